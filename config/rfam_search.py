@@ -72,6 +72,9 @@ GENOME_ACC = "SELECT upid FROM genome WHERE num_families > 0"
 
 # ---------------------------------RFAM FIELDS----------------------------
 
+# Accessions are passed to the queries below as query parameters (%s), so that
+# they can be run as prepared statements
+
 # Select all family related fields joining tables to fetch pubmed,go and so ids
 FAM_FIELDS = ("SELECT f.rfam_acc as id, f.rfam_id as name, f.description,"
               "f.author, f.number_of_species as num_species,"
@@ -82,7 +85,7 @@ FAM_FIELDS = ("SELECT f.rfam_acc as id, f.rfam_id as name, f.description,"
               "FROM family f JOIN full_region fr USING (rfam_acc)\n"
               "JOIN database_link dl using (rfam_acc)\n"
               "JOIN family_literature_reference fl USING (rfam_acc)\n"
-              "WHERE f.rfam_acc = \'%s\' AND fr.is_significant=1\n"
+              "WHERE f.rfam_acc = %s AND fr.is_significant=1\n"
               "AND (dl.db_id like \'GO\' OR dl.db_id like \'SO\')\n"
               "GROUP BY f.rfam_acc, f.rfam_id, f.description, f.author, f.number_of_species,"
               "f.number_3d_structures, f.num_seed, f.num_full, f.type, f.created, f.updated")
@@ -93,7 +96,7 @@ CLAN_FIELDS = """
               c.updated, c.author, count(*) as num_families
               FROM clan c, clan_membership cm
               WHERE c.clan_acc=cm.clan_acc
-              AND c.clan_acc='%s'
+              AND c.clan_acc=%s
               """
 
 # Fetching clan fields from the db
@@ -101,7 +104,7 @@ MOTIF_FIELDS = """
                SELECT m.motif_acc as id, m.motif_id as name, m.description,
                m.created, m.updated, m.author
                FROM motif m
-               WHERE m.motif_acc='%s'
+               WHERE m.motif_acc=%s
                """
 
 # Fetching genome fields from the db
@@ -111,7 +114,7 @@ GENOME_FIELDS = """
                 g.common_name, g.assembly_name, g.assembly_level, g.created, g.updated
                 FROM genome g, taxonomy tx
                 WHERE g.ncbi_id=tx.ncbi_id
-                AND g.upid='%s'
+                AND g.upid=%s
                 """
 
 FULL_REGION_FIELDS = """
@@ -127,7 +130,7 @@ FULL_REGION_FIELDS = """
     AND fr.rfam_acc=f.rfam_acc
     AND fr.is_significant=1
     AND fr.type = 'full'
-    AND gs.upid = '%s'
+    AND gs.upid = %s
     AND gs.version = '14.0'
 """
 
@@ -144,7 +147,7 @@ FULL_REGION_SEEDS = """
     AND fr.rfam_acc=f.rfam_acc
     AND fr.is_significant=1
     AND fr.type='seed'
-    AND gs.upid = '%s'
+    AND gs.upid = %s
     AND gs.version='14.0'
 """
 
@@ -155,14 +158,14 @@ FULL_REGION_SEEDS = """
 PDB_IDs_QUERY = """
                 SELECT distinct pdb_id
                 FROM pdb_full_region
-                WHERE rfam_acc='%s'
+                WHERE rfam_acc=%s
                 AND is_significant=1
                 """
 
 PSEUDOKNOTS_QUERY = """
     SELECT distinct pseudoknot_id
     FROM pseudoknots
-    WHERE rfam_acc='%s'
+    WHERE rfam_acc=%s
     """
 
 # Fetch ncbi ids related to a family accession
@@ -172,7 +175,7 @@ NCBI_IDs_QUERY = """
                  WHERE tx.ncbi_id=rs.ncbi_id
                  AND fr.rfamseq_acc=rs.rfamseq_acc
                  AND fr.is_significant=1
-                 AND fr.rfam_acc='%s'
+                 AND fr.rfam_acc=%s
                  GROUP BY tx.ncbi_id
                  """
 
@@ -181,7 +184,7 @@ FAMILY_UPIDS = """
                SELECT distinct upid
                FROM genseq gs, full_region fr
                WHERE gs.rfamseq_acc=fr.rfamseq_acc
-               AND fr.rfam_acc='%s'
+               AND fr.rfam_acc=%s
                AND fr.is_significant = 1
                AND gs.version='14.0'
                """
@@ -191,7 +194,7 @@ FAMILY_UPIDS = """
 FAM_CLAN = """
            SELECT clan_acc
            FROM clan_membership
-           WHERE rfam_acc='%s'
+           WHERE rfam_acc=%s
            """
 
 # CLANS
@@ -199,14 +202,14 @@ FAM_CLAN = """
 CLAN_FAMS = """
             SELECT rfam_acc
             from clan_membership
-            WHERE clan_acc='%s'
+            WHERE clan_acc=%s
             """
 
 # MOTIFS
 MOTIF_FAMS = """
              SELECT distinct rfam_acc
              FROM motif_matches
-             WHERE motif_acc='%s'
+             WHERE motif_acc=%s
              """
 
 # GENOMES
@@ -215,7 +218,7 @@ GENOME_FAMS = """
               FROM full_region fr, genseq gs
               WHERE fr.rfamseq_acc=gs.rfamseq_acc
               AND fr.is_significant = 1
-              AND gs.upid='%s'
+              AND gs.upid=%s
               AND gs.version='14.0'
               """
 
@@ -225,13 +228,13 @@ GENOME_FAMS = """
 # count # families associated with clan
 NUM_FAMS_CLAN = """
                 SELECT count(*) FROM clan_membership
-                WHERE clan_acc='%s'
+                WHERE clan_acc=%s
                 """
 
 # count # families associated with motif
 NUM_FAMS_MOTIF = """
                  SELECT count(*) FROM motif_family_stats
-                 WHERE motif_acc='%s'
+                 WHERE motif_acc=%s
                  """
 
 COUNT_FULL_REGION = """
@@ -240,7 +243,7 @@ COUNT_FULL_REGION = """
                     WHERE fr.rfamseq_acc = gs.rfamseq_acc
                     AND fr.is_significant = 1
                     AND fr.type='full'
-                    AND gs.upid = '%s'
+                    AND gs.upid = %s
                     AND gs.version='14.0'
                     """
 
@@ -248,7 +251,7 @@ AU_ORCIDS = """
             SELECT orcid
             FROM author au, family_author fa
             WHERE au.author_id=fa.author_id
-            AND rfam_acc='%s'
+            AND rfam_acc=%s
             AND orcid <> ''
             """
 
@@ -257,7 +260,7 @@ SEED_PK_WITH_COV = """
                 FROM pseudoknot
                 WHERE source='seed'
                 AND covariation=1
-                AND rfam_acc='%s'
+                AND rfam_acc=%s
                 """
 
 SEED_PK_NO_COV = """
@@ -265,7 +268,7 @@ SEED_PK_NO_COV = """
     FROM pseudoknot
     WHERE source='seed'
     AND covariation=0
-    AND rfam_acc='%s'
+    AND rfam_acc=%s
     """
 
 RSCAPE_PK_WITH_COV = """
@@ -273,7 +276,7 @@ RSCAPE_PK_WITH_COV = """
     FROM pseudoknot
     WHERE source='rscape'
     AND covariation=1
-    AND rfam_acc='%s'
+    AND rfam_acc=%s
     """
 
 RSCAPE_PK_NO_COV = """
@@ -281,8 +284,66 @@ RSCAPE_PK_NO_COV = """
     FROM pseudoknot
     WHERE source='rscape'
     AND covariation=0
-    AND rfam_acc='%s'
+    AND rfam_acc=%s
     """
+
+# ------------------------------FAMILY PREFETCH---------------------------
+
+# The family queries above for all families at once, with the family
+# accession as the first column. Used to export every family with a fixed
+# number of queries
+
+ALL_FAM_FIELDS = ("SELECT f.rfam_acc as id, f.rfam_id as name, f.description,"
+                  "f.author, f.number_of_species as num_species,"
+                  "f.number_3d_structures as num_3d_structures, f.num_seed,"
+                  "f.num_full, f.type as rna_type, f.created, f.updated,"
+                  "group_concat(distinct concat(dl.db_id,\':\',dl.db_link)) as dbxrefs,"
+                  "group_concat(distinct concat(fl.pmid)) as pmids\n"
+                  "FROM family f JOIN database_link dl using (rfam_acc)\n"
+                  "JOIN family_literature_reference fl USING (rfam_acc)\n"
+                  "WHERE f.rfam_acc IN (SELECT distinct rfam_acc FROM full_region "
+                  "WHERE is_significant=1)\n"
+                  "AND (dl.db_id like \'GO\' OR dl.db_id like \'SO\')\n"
+                  "GROUP BY f.rfam_acc, f.rfam_id, f.description, f.author, f.number_of_species,"
+                  "f.number_3d_structures, f.num_seed, f.num_full, f.type, f.created, f.updated")
+
+ALL_FAM_NCBI_IDs = """
+                   SELECT distinct fr.rfam_acc, rs.ncbi_id
+                   FROM full_region fr, rfamseq rs
+                   WHERE fr.rfamseq_acc=rs.rfamseq_acc
+                   AND fr.is_significant=1
+                   """
+
+TAX_STRINGS = "SELECT ncbi_id, tax_string FROM taxonomy"
+
+ALL_FAM_PDB_IDs = """
+                  SELECT distinct rfam_acc, pdb_id
+                  FROM pdb_full_region
+                  WHERE is_significant=1
+                  """
+
+ALL_FAM_ORCIDS = """
+                 SELECT fa.rfam_acc, au.orcid
+                 FROM author au, family_author fa
+                 WHERE au.author_id=fa.author_id
+                 AND au.orcid <> ''
+                 """
+
+ALL_FAM_UPIDS = """
+                SELECT distinct fr.rfam_acc, gs.upid
+                FROM genseq gs, full_region fr
+                WHERE gs.rfamseq_acc=fr.rfamseq_acc
+                AND fr.is_significant = 1
+                AND gs.version='14.0'
+                """
+
+ALL_FAM_CLANS = "SELECT rfam_acc, clan_acc FROM clan_membership"
+
+ALL_FAM_PSEUDOKNOTS = """
+                      SELECT distinct rfam_acc, source, covariation
+                      FROM pseudoknot
+                      """
+
 # -----------------------------------------------------------------------------
 
 if __name__ == '__main__':
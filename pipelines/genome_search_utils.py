@@ -21,6 +21,7 @@ from config import rfam_local as conf
 from config import gen_config as gc
 from support import merge_fasta as mf
 
+from utils import compressed_io as cio
 from utils import genome_search_utils as gsu
 
 # add parent directory to path
@@ -107,20 +108,26 @@ class MergeGenomeTBLOUT(luigi.Task):
     """
     updir = luigi.Parameter()
     upid = luigi.Parameter()
+    compression = luigi.Parameter(default="",
+                                  description="Compress merged file (gzip or bgzip)")
+    compresslevel = luigi.IntParameter(default=cio.DEFAULT_COMPRESSLEVEL)
+    threads = luigi.IntParameter(default=1)
 
     def run(self):
         """
-        Merge all tbl files in updir
+        Merge all tbl files in updir. Gzip and bgzip compressed tbl files are
+        detected automatically
         """
 
         upid = os.path.basename(self.updir)
         results_dir = os.path.join(self.updir, "search_output")
-        res_files = [x for x in os.listdir(results_dir) if x.endswith('.tbl')]
+        res_files = [x for x in os.listdir(results_dir) if x.endswith('.tbl') or x.endswith('.tbl.gz')]
 
-        up_tbl = open(os.path.join(self.updir, self.upid +'.tbl'), 'w')
+        up_tbl = cio.open_output(self.output().path, compression=self.compression or None,
+                                 compresslevel=self.compresslevel, threads=self.threads)
 
         for res_file in res_files:
-            fp_in = open(os.path.join(results_dir, res_file), 'r')
+            fp_in = cio.open_input(os.path.join(results_dir, res_file), threads=self.threads)
             for line in fp_in:
                 up_tbl.write(line)
 
@@ -134,6 +141,9 @@ class MergeGenomeTBLOUT(luigi.Task):
         """
         genome_tbl = os.path.join(self.updir, self.upid + '.tbl')
 
+        if self.compression:
+            genome_tbl += ".gz"
+
         return luigi.LocalTarget(genome_tbl)
 
 # -----------------------------------------------------------------------------
@@ -18,13 +18,31 @@ from utils import infernal_utils as iu
 
 if __name__ == '__main__':
 
+    # number of processes to parse Infernal's output with
+    processes = 1
+    if "--cpu" in sys.argv:
+        index = sys.argv.index("--cpu")
+        processes = int(sys.argv[index + 1])
+        del sys.argv[index:index + 2]
+
+    # output formats to generate in a single pass, bed only by default
+    formats = ["bed"]
+    if "--formats" in sys.argv:
+        index = sys.argv.index("--formats")
+        formats = sys.argv[index + 1].split(',')
+        del sys.argv[index:index + 2]
+
     infernal_output = sys.argv[1]
     out_dir = sys.argv[2]
-    ss_notation = None
+    ss_notation = "wuss"
 
     if len(sys.argv) > 3:
         ss_notation = sys.argv[3]
-        iu.infernal_output_parser(infernal_output, out_dir, ss_notation)
+
+    if formats == ["bed"]:
+        iu.generate_bed_detail_file_with_ss(infernal_output, out_dir, ss_notation,
+                                            processes=processes)
 
     else:
-        iu.infernal_output_parser(infernal_output, out_dir, ss_notation="wuss")
+        iu.infernal_to_formats(infernal_output, formats, dest_dir=out_dir, input_format="out",
+                               ss_notation=ss_notation, processes=processes)
@@ -1,30 +1,370 @@
 """
-The purpose of this script is to parallelize the launching process of xml_dumps 
-in order to speed up Rfam exports. It uses rfam_xml_dumper and submits an individual 
-lsf job for each entry provided in the input file  
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
 """
 
+"""
+Description: Parallelizes the launching process of xml_dumps in order to speed
+             up Rfam exports. Uses rfam_xml_dumper and either submits an
+             individual lsf job for each entry provided in the input file
+             (default), or exports the entries locally in a pool of worker
+             processes (--local).
+
+             Local exports keep a manifest of the accessions completed and
+             failed in the destination directory. Running the export again
+             skips the completed accessions and retries the rest.
+
+Usage: python parallel_xml_dumper.py <accession file> <type> <dest_dir>
+       [--local] [--processes N] [--retries N] [--hfields] [--compact]
+"""
 
+# --------------------------------------------------------------------------------------------------
+
+import argparse
+import datetime
+import multiprocessing
 import os
-import sys
 import subprocess
+import sys
+import timeit
+import traceback
+
+# --------------------------------------------------------------------------------------------------
+
+DJANGO_SETTINGS = "rfam_schemas.rfam_schemas.settings"
+
+MANIFEST = "xml_dump_manifest.tsv"  # manifest file name in the destination directory
+
+# manifest statuses. Empty accessions have no entries and so no xml file
+DONE = "done"
+EMPTY = "empty"
+FAILED = "failed"
+
+LSF_CMD = ("bsub -M 16384 -q production-rh74 -g /rfam_xml_dumps -R \"rusage[mem=16384]\" "
+           "-F 1000000 source /nfs/production/xfam/users/rfamprod/code/env2/bin/activate && "
+           "export DJANGO_SETTINGS_MODULE=\'%s\' && python %s --type %s --acc %s --out %s")
+
+# --------------------------------------------------------------------------------------------------
+
+
+def submit_lsf_jobs(accessions, acc_type, dest_dir):
+    """
+    Submits an lsf job running rfam_xml_dumper for each accession
+
+    accessions: A list of accessions
+    acc_type: The rfam_xml_dumper entry type (F, M, C, G, R)
+    dest_dir: The destination directory of the xml files
+
+    return: void
+    """
+
+    path_to_xml_dump = os.path.join(os.getcwd(), "rfam_xml_dumper.py")
+
+    for accession in accessions:
+        cmd = LSF_CMD % (DJANGO_SETTINGS, path_to_xml_dump, acc_type, accession, dest_dir)
+        subprocess.call(cmd, shell=True)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def load_manifest(manifest_file):
+    """
+    Reads the latest status of each accession from an export manifest
+
+    manifest_file: The path to the manifest file
+
+    return: A dictionary {accession: status}
+    """
+
+    statuses = {}
+
+    if not os.path.exists(manifest_file):
+        return statuses
+
+    fp_in = open(manifest_file, 'r')
+    for line in fp_in:
+        fields = line.rstrip('\n').split('\t')
+
+        # skip lines cut short by an interrupted export
+        if len(fields) >= 3:
+            statuses[fields[1]] = fields[2]
+
+    fp_in.close()
+
+    return statuses
+
+
+def pending_accessions(accessions, statuses, dest_dir):
+    """
+    Returns the accessions that need to be exported, i.e. those not completed
+    in a previous export or whose xml file has since been removed
+
+    accessions: A list of accessions
+    statuses: The manifest statuses returned by load_manifest
+    dest_dir: The destination directory of the xml files
+    """
+
+    pending = []
+    for accession in accessions:
+        status = statuses.get(accession)
+
+        if status == EMPTY:
+            continue
+
+        if status == DONE and os.path.exists(os.path.join(dest_dir, accession + ".xml")):
+            continue
+
+        pending.append(accession)
+
+    return pending
+
+# --------------------------------------------------------------------------------------------------
+
+# the dumper and the data shared by the export processes, set before the workers are forked
+_export = {}
+
+
+def _setup_export(acc_type, hfields, pretty):
+    """
+    Imports rfam_xml_dumper and loads the data shared by all exports of an
+    entry type, so that forked workers inherit them
+    """
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", DJANGO_SETTINGS)
+
+    # imported here, as lsf submissions don't need django or database access
+    from scripts.export import rfam_xml_dumper as xml_dumper
+
+    _export.update({"dumper": xml_dumper, "name_dict": None, "name_object": None,
+                    "hfields": False, "pretty": pretty, "prefetched": None})
+
+    if acc_type == xml_dumper.rs.FAMILY:
+        if hfields is True:
+            name_dict, _ = xml_dumper.read_ncbi_names_dmp(xml_dumper.rfc.TAX_NAMES_DUMP)
+            _export["name_dict"] = name_dict
+            _export["name_object"] = xml_dumper.read_ncbi_taxonomy_nodes(
+                name_dict, xml_dumper.rfc.TAX_NODES_DUMP)
+            _export["hfields"] = True
+
+        _export["prefetched"] = xml_dumper.prefetch_family_relations()
+
+    # django connections can't be shared with forked workers, which open their
+    # own. RfamDB connections are already kept per process
+    from django import db
+    for connection in db.connections.all():
+        connection.close()
+
+
+def _export_accession(task):
+    """
+    Exports a single accession in a worker process
+
+    task: An (accession, acc_type, dest_dir) tuple
+
+    return: An (accession, status, elapsed_time, error) tuple
+    """
+
+    (accession, acc_type, dest_dir) = task
+
+    t_start = timeit.default_timer()
+
+    try:
+        _export["dumper"].xml4db_dumper(_export["name_dict"], _export["name_object"], acc_type,
+                                        accession, _export["hfields"], dest_dir,
+                                        pretty=_export["pretty"],
+                                        prefetched=_export["prefetched"])
+
+        status = DONE
+        if not os.path.exists(os.path.join(dest_dir, accession + ".xml")):
+            status = EMPTY
+
+        error = ''
+
+    except Exception:
+        status = FAILED
+        error = traceback.format_exc().strip().split('\n')[-1].replace('\t', ' ')
+
+    return (accession, status, timeit.default_timer() - t_start, error)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def format_time(seconds):
+    """
+    Formats a number of seconds as h:mm:ss
+    """
+
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def print_progress(num_done, num_failed, total, elapsed):
+    """
+    Prints a progress line with the estimated time to completion to stderr
+    """
+
+    num_completed = num_done + num_failed
+    eta = "--"
+    if num_completed > 0:
+        eta = format_time(elapsed / num_completed * (total - num_completed))
+
+    line = "%d/%d exported, %d failed, elapsed %s, ETA %s" % (num_done, total, num_failed,
+                                                            format_time(elapsed), eta)
+
+    # overwrite the line on terminals, one line per update in log files
+    if sys.stderr.isatty():
+        sys.stderr.write("\r" + line)
+        if num_completed == total:
+            sys.stderr.write("\n")
+    else:
+        sys.stderr.write(line + "\n")
+
+    sys.stderr.flush()
+
+
+def export_local(accessions, acc_type, dest_dir, processes=None, retries=1, hfields=False,
+                 pretty=True, manifest_file=None):
+    """
+    Exports accessions in a pool of worker processes, each with its own
+    database connections. Workers write the xml files of their accessions
+    only, and every result is appended to the manifest as it completes, so
+    that an interrupted export can be resumed
+
+    accessions: A list of accessions
+    acc_type: The rfam_xml_dumper entry type (F, M, C, G, R)
+    dest_dir: The destination directory of the xml files
+    processes: The number of worker processes. Defaults to the number of CPUs
+    retries: The number of times failed accessions are retried
+    hfields: Add hierarchical taxonomy fields to families
+    pretty: Indent the xml files
+    manifest_file: The manifest path. Defaults to MANIFEST in dest_dir
+
+    return: A list of the accessions that failed
+    """
+
+    if manifest_file is None:
+        manifest_file = os.path.join(dest_dir, MANIFEST)
+
+    pending = pending_accessions(accessions, load_manifest(manifest_file), dest_dir)
+
+    print "%d of %d accessions to export" % (len(pending), len(accessions))
+
+    if len(pending) == 0:
+        return []
+
+    _setup_export(acc_type, hfields, pretty)
+
+    fp_manifest = open(manifest_file, 'a')
+
+    failed = []
+    attempt = 0
+    while len(pending) > 0 and attempt <= retries:
+        if attempt > 0:
+            print "Retrying %d failed accessions" % len(pending)
+
+        tasks = [(accession, acc_type, dest_dir) for accession in pending]
+        failed = []
+        num_done = 0
+
+        t_start = timeit.default_timer()
+        pool = multiprocessing.Pool(processes=processes)
+
+        try:
+            for (accession, status, elapsed_time, error) in pool.imap_unordered(_export_accession,
+                                                                                 tasks):
+                fp_manifest.write('\t'.join([datetime.datetime.now().isoformat(), accession,
+                                             status, "%.2f" % elapsed_time, error]) + '\n')
+                fp_manifest.flush()
+
+                if status == FAILED:
+                    failed.append(accession)
+                else:
+                    num_done += 1
+
+                print_progress(num_done, len(failed), len(tasks),
+                               timeit.default_timer() - t_start)
+
+        except BaseException:
+            pool.terminate()
+            raise
+
+        else:
+            # let the workers exit normally, running their exit handlers (e.g.
+            # writing query profiles)
+            pool.close()
+
+        finally:
+            pool.join()
+
+        pending = failed
+        attempt += 1
+
+    fp_manifest.close()
+
+    return failed
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_arguments():
+    """
+    Performs some basic argument parsing
+
+    return: parser object
+    """
+
+    parser = argparse.ArgumentParser(description='Parallel Rfam xml dumps')
+
+    parser.add_argument("accession_file", help="A file with one accession per line", type=str)
+    parser.add_argument("type", help="rfam_xml_dumper entry type",
+                        type=str, choices=['F', 'M', 'C', 'G', 'R'])
+    parser.add_argument("dest_dir", help="Destination directory of the xml files", type=str)
+
+    parser.add_argument("--local", help="Export in local worker processes instead of lsf jobs",
+                        action="store_true", default=False)
+    parser.add_argument("--processes", help="Number of local worker processes (default: CPUs)",
+                        type=int, default=None)
+    parser.add_argument("--retries", help="Times failed accessions are retried locally",
+                        type=int, default=1)
+    parser.add_argument("--manifest", help="Manifest file (default: %s in dest_dir)" % MANIFEST,
+                        type=str, default=None)
+    parser.add_argument("--hfields", help="Include hierarchical fields in families",
+                        action="store_true", default=False)
+    parser.add_argument("--compact", help="Write each xml file on a single line",
+                        action="store_true", default=False)
+
+    return parser
+
+# --------------------------------------------------------------------------------------------------
 
 if __name__ == '__main__':
 
-	path_to_xml_dump = os.path.join(os.getcwd(), "rfam_xml_dumper.py")
+    args = parse_arguments().parse_args()
+
+    fp = open(args.accession_file, 'r')
+    accession_list = [x.strip() for x in fp if x.strip() != '']
+    fp.close()
 
-	rfam_accession_file = sys.argv[1]
-	acc_type = sys.argv[2]
-	dest_dir = sys.argv[3]	
+    if args.local is False:
+        submit_lsf_jobs(accession_list, args.type, args.dest_dir)
 
-	fp = open(rfam_accession_file, 'r')
-	
-	accession_list = [x.strip() for x in fp]
+    else:
+        if not os.path.exists(args.dest_dir):
+            os.makedirs(args.dest_dir)
 
-	for accession in accession_list:
-		cmd = "bsub -M 16384 -q production-rh74 -g /rfam_xml_dumps -R \"rusage[mem=16384]\" -F 1000000 source /nfs/production/xfam/users/rfamprod/code/env2/bin/activate && export DJANGO_SETTINGS_MODULE=\'rfam_schemas.rfam_schemas.settings\' && python %s --type %s --acc %s --out %s" % (path_to_xml_dump, acc_type, accession, dest_dir)
-		subprocess.call(cmd, shell=True)
-		
-	
+        failed_accs = export_local(accession_list, args.type, args.dest_dir,
+                                   processes=args.processes, retries=args.retries,
+                                   hfields=args.hfields, pretty=not args.compact,
+                                   manifest_file=args.manifest)
 
-	
+        if len(failed_accs) > 0:
+            print "%d accessions failed, see the manifest: %s" % (len(failed_accs),
+                                                                 ', '.join(failed_accs))
+            sys.exit(1)
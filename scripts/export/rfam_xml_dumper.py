@@ -30,13 +30,14 @@ import timeit
 import traceback
 import xml.etree.ElementTree as ET
 from sets import Set
-from xml.dom import minidom
 
 import django
 
 from config import rfam_config as rfc
 from config import rfam_search as rs
 from utils import RfamDB
+from utils import db_snapshot
+from utils.xml_dump_writer import XmlDumpWriter
 from utils.parse_taxbrowser import *
 
 django.setup()
@@ -44,12 +45,25 @@ django.setup()
 
 from rfam_schemas.RfamLive.models import Genseq, Genome
 
+# queries that only read tables in the local snapshot (see db_snapshot)
+SNAPSHOT_QUERIES = (rs.REL_FIELDS, rs.FAM_ACC, rs.GENOME_ACC, rs.FAM_CLAN, rs.CLAN_FAMS,
+                    rs.ALL_FAM_CLANS, rs.TAX_STRINGS)
+
+# pseudoknot evidence queries, the (source, covariation) they count and the
+# label of the evidence
+PSEUDOKNOT_EVIDENCE = ((rs.SEED_PK_WITH_COV, 'seed', 1, "seed with covariation support"),
+                       (rs.SEED_PK_NO_COV, 'seed', 0, "seed no covariation support"),
+                       (rs.RSCAPE_PK_WITH_COV, 'rscape', 1, "predicted with covariation support"),
+                       (rs.RSCAPE_PK_NO_COV, 'rscape', 0, "predicted no covariation support"))
 
 # ----------------------------------------------------------------------------
 
-def xml4db_dumper(name_dict, name_object, entry_type, entry_acc, hfields, outdir):
+def xml4db_dumper(name_dict, name_object, entry_type, entry_acc, hfields, outdir, pretty=True,
+                  prefetched=None):
     """
-    Exports query results into EB-eye's XML4dbDUMP format
+    Exports query results into EB-eye's XML4dbDUMP format. Entries are written
+    to the file as they are built, so memory use does not grow with the
+    number of entries
 
     name_dict:  A dictionary with all ncbi names per tax id
     name_object: NCBI tax browser node dictionary
@@ -57,61 +71,83 @@ def xml4db_dumper(name_dict, name_object, entry_type, entry_acc, hfields, outdir
                 ('M': Motif, 'F': Family, 'C': Clan, 'G': Genome)
     entry_acc:  An Rfam related accession (Clan, Motif, Family)
     outdir: Destination directory
+    pretty: Indent the xml file if True (default), write it on a single line
+            otherwise
+    prefetched: Family relations returned by prefetch_family_relations, used
+                instead of querying the database for a family
     """
 
     entry_type = entry_type[0].capitalize()
 
-    # EB_eye_search fixed tags
-    db_xml = ET.Element("database")
-    ET.SubElement(db_xml, "name").text = rs.DB_NAME
-    ET.SubElement(db_xml, "description").text = rs.DB_DESC
+    # the file is written under a temporary name and renamed once complete,
+    # so that a failed export does not leave a truncated file behind
+    filename = os.path.join(outdir, entry_acc + ".xml")
+    tmp_filename = os.path.join(outdir, "." + entry_acc + ".xml.tmp")
+    fp_out = open(tmp_filename, 'wb')
+
+    try:
+        writer = XmlDumpWriter(fp_out, pretty=pretty)
+        writer.write_declaration()
 
-    # need to fetch from db
-    ET.SubElement(db_xml, "release").text = rs.DB_RELEASE
+        # EB_eye_search fixed tags
+        writer.start("database")
+        writer.text_element("name", rs.DB_NAME)
+        writer.text_element("description", rs.DB_DESC)
 
-    rel_date = datetime.date.today()
-    rel_date = rel_date.strftime("%d/%m/%Y")
+        # need to fetch from db
+        writer.text_element("release", rs.DB_RELEASE)
 
-    ET.SubElement(db_xml, "release_date").text = rel_date
+        rel_date = datetime.date.today()
+        rel_date = rel_date.strftime("%d/%m/%Y")
 
-    entries = ET.SubElement(db_xml, "entries")
+        writer.text_element("release_date", rel_date)
 
-    # call family xml builder to add a new family to the xml tree
-    if entry_type == rs.FAMILY:
-        family_xml_builder(
-            name_dict, name_object, entries, rfam_acc=entry_acc, hfields=hfields)
+        writer.start("entries")
+
+        # entries are built under this node and written out by the writer
+        entries = ET.Element("entries")
+        entry_count = 0
+
+        # call family xml builder to add a new family to the xml tree
+        if entry_type == rs.FAMILY:
+            family_xml_builder(
+                name_dict, name_object, entries, rfam_acc=entry_acc, hfields=hfields,
+                prefetched=prefetched)
 
-    elif entry_type == rs.CLAN:
-        clan_xml_builder(entries, clan_acc=entry_acc)
+        elif entry_type == rs.CLAN:
+            clan_xml_builder(entries, clan_acc=entry_acc)
 
-    elif entry_type == rs.MOTIF:
-        motif_xml_builder(entries, motif_acc=entry_acc)
+        elif entry_type == rs.MOTIF:
+            motif_xml_builder(entries, motif_acc=entry_acc)
 
-    elif entry_type == rs.GENOME:
-        genome_xml_builder(entries, gen_acc=entry_acc)
+        elif entry_type == rs.GENOME:
+            genome_xml_builder(entries, gen_acc=entry_acc)
 
-    elif entry_type == rs.MATCH:
-        full_region_xml_builder(entries, entry_acc)
+        elif entry_type == rs.MATCH:
+            entry_count += full_region_xml_builder(entries, entry_acc, writer=writer)
 
-    # adding entry_count
-    entry_count = len(entries.findall("entry"))
+        entry_count += writer.write_children(entries)
 
-    if entry_count == 0:
-        print "No full region entries found for %s" % entry_acc
-        return
+        if entry_count == 0:
+            print "No full region entries found for %s" % entry_acc
+            fp_out.close()
+            os.remove(tmp_filename)
+            return
 
-    ET.SubElement(db_xml, "entry_count").text = str(entry_count)
+        writer.end("entries")
 
-    # export xml tree - writes xml tree into a file
-    filename = os.path.join(outdir, entry_acc + ".xml")
-    fp_out = open(filename, 'w')
+        # adding entry_count
+        writer.text_element("entry_count", str(entry_count))
+        writer.end("database")
 
-    db_str = ET.tostring(db_xml, "utf-8")
-    db_str_reformated = minidom.parseString(db_str)
+        fp_out.close()
 
-    fp_out.write(db_str_reformated.toprettyxml(indent='\t'))
+    except:
+        fp_out.close()
+        os.remove(tmp_filename)
+        raise
 
-    fp_out.close()
+    os.rename(tmp_filename, filename)
     # xmllint(filename)
 
 
@@ -121,22 +157,134 @@ def get_taxonomy_info(rfam_acc):
     """
     Get distinct ncbi_ids and tax_strings associated with a family.
     """
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(dictionary=True, buffered=True)
-    cursor.execute(rs.NCBI_IDs_QUERY % rfam_acc)
     ncbi_ids = []
     tax_strings = set()  # distinct ncbi_ids can have identical tax_strings
-    for row in result_iterator(cursor):
+    for row in RfamDB.stream(rs.NCBI_IDs_QUERY, (rfam_acc,), dictionary=True):
         ncbi_ids.append(row['ncbi_id'])
         tax_strings.add(row['tax_string'])
-    cursor.close()
-    cnx.disconnect()
     return ncbi_ids, tax_strings
 
 
 # ----------------------------------------------------------------------------
 
-def family_xml_builder(name_dict, name_object, entries, rfam_acc=None, hfields=True):
+def fetch_family_relations(rfam_acc):
+    """
+    Fetches the fields and related values of a family from the database.
+    Returns a dictionary in the format of lookup_family_relations
+
+    rfam_acc:   A specific Rfam family accession
+    """
+
+    ncbi_ids, tax_strings = get_taxonomy_info(rfam_acc)
+
+    pseudoknots = []
+    for (query, source, covariation, label) in PSEUDOKNOT_EVIDENCE:
+        if int(fetch_value(query, rfam_acc)) > 0:
+            pseudoknots.append(label)
+
+    return {"fields": fetch_entry_fields(rfam_acc, rs.FAMILY),
+            "ncbi_ids": ncbi_ids,
+            "tax_strings": tax_strings,
+            "pdb_ids": fetch_value_list(rfam_acc, rs.PDB_IDs_QUERY),
+            "orcids": fetch_value_list(rfam_acc, rs.AU_ORCIDS),
+            "upids": fetch_value_list(rfam_acc, rs.FAMILY_UPIDS),
+            "clan": fetch_value(rs.FAM_CLAN, rfam_acc),
+            "pseudoknots": pseudoknots}
+
+
+# ----------------------------------------------------------------------------
+
+def _fetch_all_rows(query, **cursor_args):
+    # rows of a query without parameters, from the snapshot if possible
+    rows = None
+    if not cursor_args:
+        rows = fetch_snapshot_rows(query, None)
+
+    if rows is None:
+        rows = RfamDB.stream(query, **cursor_args)
+
+    return rows
+
+
+def _group_by_family(query):
+    # {rfam_acc: [value, ...]} from a query returning (rfam_acc, value) rows
+    values = {}
+    for row in _fetch_all_rows(query):
+        values.setdefault(str(row[0]), []).append(row[1])
+
+    return values
+
+
+def prefetch_family_relations():
+    """
+    Fetches the fields and related values of all families, with one query per
+    relation, so that families can be exported without querying the database
+    for each. Look up a family with lookup_family_relations
+
+    return: A dictionary of dictionaries keyed by rfam_acc, one per relation
+    """
+
+    prefetched = {"fields": {}, "pseudoknots": {}}
+
+    for row in _fetch_all_rows(rs.ALL_FAM_FIELDS, dictionary=True):
+        prefetched["fields"][str(row["id"])] = row
+
+    prefetched["ncbi_ids"] = _group_by_family(rs.ALL_FAM_NCBI_IDs)
+    prefetched["tax_strings"] = dict([(x[0], x[1]) for x in _fetch_all_rows(rs.TAX_STRINGS)])
+    prefetched["pdb_ids"] = _group_by_family(rs.ALL_FAM_PDB_IDs)
+    prefetched["orcids"] = _group_by_family(rs.ALL_FAM_ORCIDS)
+    prefetched["upids"] = _group_by_family(rs.ALL_FAM_UPIDS)
+    prefetched["clan"] = _group_by_family(rs.ALL_FAM_CLANS)
+
+    for row in _fetch_all_rows(rs.ALL_FAM_PSEUDOKNOTS):
+        prefetched["pseudoknots"].setdefault(str(row[0]), set()).add((row[1], int(row[2])))
+
+    return prefetched
+
+
+def lookup_family_relations(prefetched, rfam_acc):
+    """
+    Returns the fields and related values of a family from the relations
+    prefetched with prefetch_family_relations
+
+    prefetched: The dictionary returned by prefetch_family_relations
+    rfam_acc:   A specific Rfam family accession
+
+    return: A dictionary with the family fields (None if the family has no
+    fields), ncbi_ids, tax_strings, pdb_ids, orcids, upids, clan and
+    pseudoknot evidence labels
+    """
+
+    fields = prefetched["fields"].get(rfam_acc)
+    if fields is None:
+        print "Failure retrieving values for entry %s." % rfam_acc
+    else:
+        # the builder adds fields to the dictionary
+        fields = dict(fields)
+
+    # ncbi ids not in the taxonomy table are left out, as the taxonomy join does
+    tax_strings = prefetched["tax_strings"]
+    ncbi_ids = sorted([x for x in prefetched["ncbi_ids"].get(rfam_acc, []) if x in tax_strings])
+
+    clans = prefetched["clan"].get(rfam_acc, [])
+
+    evidence = prefetched["pseudoknots"].get(rfam_acc, set())
+    pseudoknots = [x[3] for x in PSEUDOKNOT_EVIDENCE if (x[1], x[2]) in evidence]
+
+    return {"fields": fields,
+            "ncbi_ids": ncbi_ids,
+            "tax_strings": set([tax_strings[x] for x in ncbi_ids]),
+            "pdb_ids": [str(x) for x in prefetched["pdb_ids"].get(rfam_acc, [])],
+            "orcids": [str(x) for x in prefetched["orcids"].get(rfam_acc, [])],
+            "upids": [str(x) for x in prefetched["upids"].get(rfam_acc, [])],
+            "clan": clans[0] if len(clans) > 0 else None,
+            "pseudoknots": pseudoknots}
+
+
+# ----------------------------------------------------------------------------
+
+def family_xml_builder(name_dict, name_object, entries, rfam_acc=None, hfields=True,
+                       prefetched=None):
     """
     Expands the Xml4dbDumper object by adding a new family entry
 
@@ -146,32 +294,40 @@ def family_xml_builder(name_dict, name_object, entries, rfam_acc=None, hfields=T
     rfam_acc:   A specific Rfam family accession
     hfields:    A bool value indicating whether to build hierarchical fields
                 for each species. True by default
+    prefetched: Family relations returned by prefetch_family_relations. If
+                None the family is fetched from the database
     """
 
     entry_type = "Family"
 
     cross_refs = {}
 
-    # fetch family fields
-    fam_fields = fetch_entry_fields(rfam_acc, rs.FAMILY)
+    if prefetched is not None:
+        relations = lookup_family_relations(prefetched, rfam_acc)
+    else:
+        relations = fetch_family_relations(rfam_acc)
 
-    # fetch family specific ncbi_ids
-    ncbi_ids, tax_strings = get_taxonomy_info(rfam_acc)
+    # family fields
+    fam_fields = relations["fields"]
+
+    # family specific ncbi_ids
+    ncbi_ids = relations["ncbi_ids"]
+    tax_strings = relations["tax_strings"]
 
     if hfields:
         valid_ncbi_ids = get_valid_family_tax_ids(name_object, ncbi_ids)
     else:
         valid_ncbi_ids = ncbi_ids
 
-    # fetch family specific ncbi_ids
-    pdb_ids = fetch_value_list(rfam_acc, rs.PDB_IDs_QUERY)
+    # family specific pdb ids
+    pdb_ids = relations["pdb_ids"]
 
-    # fetch all author orcids associated with a family accession
-    orcids = fetch_value_list(rfam_acc, rs.AU_ORCIDS)
+    # all author orcids associated with a family accession
+    orcids = relations["orcids"]
     # pass orcid list in fam_fields
 
-    # fetch family upids
-    upids = fetch_value_list(rfam_acc, rs.FAMILY_UPIDS)
+    # family upids
+    upids = relations["upids"]
 
     # get pubmed ids
     pmids = get_value_list(fam_fields["pmids"], ',')
@@ -180,30 +336,10 @@ def family_xml_builder(name_dict, name_object, entries, rfam_acc=None, hfields=T
     dbxrefs = get_value_list(fam_fields["dbxrefs"], ',')
 
     # get associated clan
-    clan = fetch_value(rs.FAM_CLAN, rfam_acc)
+    clan = relations["clan"]
 
     # get pseudoknot evidence
-    pseudoknots = []
-    
-    # check if seed pseudoknot with covariation
-    pseudoknot_evidence = int(fetch_value(rs.SEED_PK_WITH_COV, rfam_acc))
-    if pseudoknot_evidence > 0:
-        pseudoknots.append("seed with covariation support")
-
-    # check if seed pseudoknot with no covariation
-    pseudoknot_evidence = int(fetch_value(rs.SEED_PK_NO_COV, rfam_acc))
-    if pseudoknot_evidence > 0:
-        pseudoknots.append("seed no covariation support")
-
-    # check if rscape pseudoknot with  covariation
-    pseudoknot_evidence = int(fetch_value(rs.RSCAPE_PK_WITH_COV, rfam_acc))
-    if pseudoknot_evidence > 0:
-        pseudoknots.append("predicted with covariation support")
-
-    # check if rscape pseudoknot with no covariation
-    pseudoknot_evidence = int(fetch_value(rs.RSCAPE_PK_NO_COV, rfam_acc))
-    if pseudoknot_evidence > 0:
-        pseudoknots.append("predicted no covariation support")
+    pseudoknots = relations["pseudoknots"]
 
     fam_fields["pseudoknots"] = pseudoknots
 
@@ -396,20 +532,6 @@ def genome_xml_builder(entries, gen_acc=None):
     build_genome_additional_fields(entry, genome_fields)
 
 
-# ----------------------------------------------------------------------------
-
-def result_iterator(cursor, arraysize=1000):
-    """
-    An iterator that uses fetchmany to keep memory usage down
-    """
-    while True:
-        results = cursor.fetchmany(arraysize)
-        if not results:
-            break
-        for result in results:
-            yield result
-
-
 # ----------------------------------------------------------------------------
 
 def format_full_region(entries, region, genome, chromosome, rnacentral_ids):
@@ -503,30 +625,29 @@ def get_rnacentral_mapping(upid):
     AND fr.seq_end = rm.seq_end
     AND fr.is_significant = 1
     AND rm.rnacentral_id IS NOT NULL
-    AND gs.upid = '%s'
+    AND gs.upid = %s
     AND gs.version='14.0'
     """
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(dictionary=True, buffered=True)
-    cursor.execute(query % upid)
     rnacentral_ids = {}
-    for row in result_iterator(cursor):
+    for row in RfamDB.stream(query, (upid,), dictionary=True):
         rfamseq_acc = row["rfamseq_acc"]
         name = '%s/%s:%s' % (row["rfamseq_acc"], row["seq_start"], row["seq_end"])
         rnacentral_ids[name] = str(row["rnacentral_id"])
-    cursor.close()
-    cnx.disconnect()
     return rnacentral_ids
 
 
 # ----------------------------------------------------------------------------
 
-def full_region_xml_builder(entries, upid):
+def full_region_xml_builder(entries, upid, writer=None):
     """
     Export full region entries for a genome.
 
     entries:    Entries node on xml tree
     upid:  Genome identifier.
+    writer: An XmlDumpWriter. If set, each entry is written out and removed
+            from the entries node as soon as it is built
+
+    return: The number of entries written out by the writer
     """
 
     tax_id_duplicates = {'562': 1, '1280': 1, '7209': 1, '10679': 1, '10717': 1,
@@ -541,34 +662,34 @@ def full_region_xml_builder(entries, upid):
         chromosomes = get_chromosome_metadata()
 
     rnacentral_ids = get_rnacentral_mapping(upid=upid)
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(dictionary=True, buffered=True)
 
     # work on 'full' refions
-    cursor.execute(rs.FULL_REGION_FIELDS % upid)
-    for row in result_iterator(cursor):
+    num_written = 0
+    for row in RfamDB.stream(rs.FULL_REGION_FIELDS, (upid,), dictionary=True):
         format_full_region(entries, row, genome, chromosomes, rnacentral_ids)
+        if writer is not None:
+            num_written += writer.write_children(entries)
 
     # work on 'seed' regions if not already exported
-    # cursor.execute(rs.FULL_REGION_SEEDS % upid)
+    # cursor.execute(rs.FULL_REGION_SEEDS, (upid,))
 
     """
     # if one of the cases of duplicates, work with the flags
     if genome.ncbi_id in tax_id_duplicates:
         if tax_id_duplicates[genome.ncbi_id] == 1:
-            for row in result_iterator(cursor):
+            for row in RfamDB.stream(rs.FULL_REGION_SEEDS, (upid,), dictionary=True):
                 format_full_region(entries, row, genome, chromosomes, rnacentral_ids)
             # set flag to 0 to disable export
             tax_id_duplicates[genome.ncbi_id] = 0
     """
     # capture the rest of the cases
     # else:
-    cursor.execute(rs.FULL_REGION_SEEDS % upid)
-    for row in result_iterator(cursor):
+    for row in RfamDB.stream(rs.FULL_REGION_SEEDS, (upid,), dictionary=True):
         format_full_region(entries, row, genome, chromosomes, rnacentral_ids)
+        if writer is not None:
+            num_written += writer.write_children(entries)
 
-    cursor.close()
-    cnx.disconnect()
+    return num_written
 
 
 # ----------------------------------------------------------------------------
@@ -869,6 +990,31 @@ def get_value_list(val_str, delimiter=','):
     return value_list
 
 
+# ----------------------------------------------------------------------------
+
+def fetch_snapshot_rows(query, accession):
+    """
+    Answers a query from the local snapshot of reference tables if snapshots
+    are enabled (see db_snapshot) and the query only reads snapshot tables
+
+    query:  One of the queries in SNAPSHOT_QUERIES
+    accession:  The accession to execute the query on, or None
+
+    return: A list of tuples, or None if the query must run on the database
+    """
+
+    if query not in SNAPSHOT_QUERIES:
+        return None
+
+    snapshot = db_snapshot.get_snapshot()
+    if snapshot is None:
+        return None
+
+    params = (accession,) if accession is not None else ()
+
+    return [tuple(x) for x in snapshot.execute(query.replace("%s", "?"), params)]
+
+
 # ----------------------------------------------------------------------------
 
 def fetch_value_list(rfam_acc, query):
@@ -881,19 +1027,10 @@ def fetch_value_list(rfam_acc, query):
     query:  A string with the MySQL query to be executed
     """
 
-    cnx = RfamDB.connect()
+    values = fetch_snapshot_rows(query, rfam_acc)
 
-    cursor = cnx.cursor(raw=True)
-
-    if rfam_acc is None:
-        cursor.execute(query)
-    else:
-        cursor.execute(query % rfam_acc)
-
-    values = cursor.fetchall()
-
-    cursor.close()
-    cnx.disconnect()
+    if values is None:
+        values = RfamDB.fetch_prepared(query, (rfam_acc,) if rfam_acc is not None else ())
 
     if len(values) > 0:
         if isinstance(values[0], tuple):
@@ -916,34 +1053,27 @@ def fetch_entry_fields(entry_acc, entry_type):
 
     # maybe the entry type not required... use rfam_acc[0:2]
 
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(dictionary=True)
-
     entry_type = entry_type[0].capitalize()
 
     fields = None
 
-    try:
-        if entry_type == rs.FAMILY:
-            cursor.execute(rs.FAM_FIELDS % entry_acc)
+    # genome fields only read the genome and taxonomy tables
+    if entry_type == rs.GENOME and db_snapshot.get_snapshot() is not None:
+        rows = db_snapshot.get_snapshot().execute(rs.GENOME_FIELDS.replace("%s", "?"),
+                                                  (entry_acc,))
 
-        elif entry_type == rs.CLAN:
-            cursor.execute(rs.CLAN_FIELDS % entry_acc)
+        if len(rows) > 0:
+            return dict(zip(rows[0].keys(), tuple(rows[0])))
 
-        elif entry_type == rs.MOTIF:
-            cursor.execute(rs.MOTIF_FIELDS % entry_acc)
-
-        elif entry_type == rs.GENOME:
-            cursor.execute(rs.GENOME_FIELDS % entry_acc)
+    queries = {rs.FAMILY: rs.FAM_FIELDS, rs.CLAN: rs.CLAN_FIELDS,
+               rs.MOTIF: rs.MOTIF_FIELDS, rs.GENOME: rs.GENOME_FIELDS}
 
-        fields = cursor.fetchall()[0]
+    try:
+        fields = RfamDB.fetch_prepared(queries[entry_type], (entry_acc,), dictionary=True)[0]
 
     except:
         print "Failure retrieving values for entry %s." % entry_acc
 
-    cursor.close()
-    cnx.disconnect()
-
     return fields
 
 
@@ -959,20 +1089,10 @@ def fetch_value(query, accession):
                 to execute the query on
     """
 
-    cnx = RfamDB.connect()
-
-    cursor = cnx.cursor(raw=True)
+    value = fetch_snapshot_rows(query, accession)
 
-    if accession is not None:
-        cursor.execute(query % accession)
-
-    else:
-        cursor.execute(query)
-
-    value = cursor.fetchall()
-
-    cursor.close()
-    cnx.disconnect()
+    if value is None:
+        value = RfamDB.fetch_prepared(query, (accession,) if accession is not None else ())
 
     if len(value) > 0:
         return value[0][0]
@@ -982,7 +1102,7 @@ def fetch_value(query, accession):
 
 # ----------------------------------------------------------------------------
 
-def main(entry_type, rfam_acc, outdir, hfields=False):
+def main(entry_type, rfam_acc, outdir, hfields=False, pretty=True):
     """
     This function puts everything together
 
@@ -993,6 +1113,7 @@ def main(entry_type, rfam_acc, outdir, hfields=False):
     hfields: A flag (True/False) indicating whether to add hierarchical
              fields on not. True by default
     outdir: Destination directory
+    pretty: Indent the xml files if True (default)
     """
 
     rfam_accs = None
@@ -1038,9 +1159,15 @@ def main(entry_type, rfam_acc, outdir, hfields=False):
 
                 rfam_accs = fetch_value_list(None, rs.FAM_ACC)
 
+                # fetch the relations of all families at once
+                t0 = timeit.default_timer()
+                prefetched = prefetch_family_relations()
+                print "Prefetch time: %.1fs" % (timeit.default_timer() - t0)
+
                 for entry in rfam_accs:
                     t0 = timeit.default_timer()
-                    xml4db_dumper(name_dict, name_object, entry_type, entry, hfields, outdir)
+                    xml4db_dumper(name_dict, name_object, entry_type, entry, hfields, outdir,
+                                  pretty=pretty, prefetched=prefetched)
                     print "Execution time: %.1fs" % (timeit.default_timer() - t0)
 
                 return
@@ -1049,14 +1176,14 @@ def main(entry_type, rfam_acc, outdir, hfields=False):
             for entry in rfam_accs:
                 print entry
                 t0 = timeit.default_timer()
-                xml4db_dumper(None, None, entry_type, entry, False, outdir)
+                xml4db_dumper(None, None, entry_type, entry, False, outdir, pretty=pretty)
                 print "Execution time: %.1fs" % (timeit.default_timer() - t0)
 
         # export single entry
         else:
             # need to check the validity of an rfam_acc (rfam, motif, clan)
             if entry_type == rs.MOTIF or entry_type == rs.CLAN or entry_type == rs.GENOME:
-                xml4db_dumper(None, None, entry_type, rfam_acc, False, outdir)
+                xml4db_dumper(None, None, entry_type, rfam_acc, False, outdir, pretty=pretty)
 
             # export single family entry
             else:
@@ -1068,7 +1195,7 @@ def main(entry_type, rfam_acc, outdir, hfields=False):
                         name_dict, rfc.TAX_NODES_DUMP)
 
                 xml4db_dumper(
-                    name_dict, name_object, entry_type, rfam_acc, hfields, outdir)
+                    name_dict, name_object, entry_type, rfam_acc, hfields, outdir, pretty=pretty)
 
     except:
         traceback.print_exc()
@@ -1118,15 +1245,19 @@ def get_family_tax_tree(name_object, name_dict, family_tax_ids):
     name_object: NCBI tax browser node dictionary
     name_dict: A dictionary with all ncbi names per tax id
     family_tax_ids: A list of family specific ncbi ids
+
+    return: A dictionary with the lineage tuple of each tax id, leaf to root
     """
 
     species_tax_trees = {}
 
+    # lineages are shared by many families, so they are looked up in a cache
+    lineage_cache = get_lineage_cache(name_object)
+
     for taxid in family_tax_ids:
 
         if taxid in name_object:
-            species_tax_trees[taxid] = name_object[
-                taxid].get_lineage(name_object)
+            species_tax_trees[taxid] = lineage_cache.get_lineage(taxid)
 
     return species_tax_trees
 
@@ -1174,6 +1305,13 @@ def usage():
     parser.add_argument(
         "--hfields", help="include hierarchical fields", action="store_true")
 
+    parser.add_argument(
+        "--compact", help="write each xml file on a single line", action="store_true")
+
+    parser.add_argument(
+        "--database", help="database to export from (default: RFAMLIVE or $RFAM_DB)",
+        type=str, choices=RfamDB.DATABASES, default=None)
+
     req_args.add_argument(
         "--out", help="path to output directory", type=str, required=True)
 
@@ -1211,4 +1349,7 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit()
 
-    main(args.type, args.acc, args.out, hfields=args.hfields)
+    if args.database is not None:
+        RfamDB.select_database(args.database)
+
+    main(args.type, args.acc, args.out, hfields=args.hfields, pretty=not args.compact)
@@ -18,6 +18,9 @@ Description: Clan competition script
 Notes: clan files are generated using export script clan_file_generator.py
        and sorted on rfamseq_acc (col2) using linux sort command as:
        sort -k2 -t $'\t\' clan_file.txt > clan_file_sorted.txt
+
+       Alternatively use the --db option to stream clan regions from the
+       database ordered by rfamseq_acc, without generating clan files
 """
 
 # ---------------------------------IMPORTS-------------------------------------
@@ -27,305 +30,269 @@ import os
 import string
 import logging
 import timeit
+import multiprocessing
 from utils import db_utils
+from utils import clan_competition_utils as ccu
 
 # -----------------------------------------------------------------------------
 
-RFAM_ACC = 0  # full region rfam_acc
-SEQ_ACC = 1  # full region rfamseq_acc
-START = 2  # full region seq_start
-END = 3  # full region seq_end
-BIT_SCORE = 4
-EVAL = 5  # full region evalue score
-TRUNC = 8  # full region truncated
-
-OVERLAP = 0.5  # overlap cutoff
-COMP_OVL = 1.0  # complete overlap
-NO_OVL = 0.0    # no overlap
+UPDATE_BATCH_SIZE = 100000  # non significant regions updated at a time
 
 # -----------------------------------------------------------------------------
 
 
-def get_strand(start, end):
+def complete_clan_seqs(sorted_clan, clan_comp_type='FULL', update=True):
     """
-    Checks the start and end coordinates of a sequence and returns -1 if the
-    sequence comes from the 3' strand and 1 if it comes from the 5' strand
+    Parses a sorted clan file and generates a list of regions per rfam_acc,
+    which are then competed by clan_competition_utils.compete_seq_regions
 
-    start: An integer indicating sequence start location
-    end: An integer indicating sequence end location
+    sorted_clan: A valid path to a sorted clan file
+    update: If True set is_significant to 0 for the non significant regions
     """
 
-    # -
-    if start > end:
-        return -1
-    # +
-    elif start <= end:
-        return 1
+    fp = open(sorted_clan, 'r')
 
-    return 0
+    # log regions in which calculate overlap returns None
+    logging.basicConfig(
+        filename="missed_overlaps.log", filemode='w', level=logging.DEBUG)
 
-# -----------------------------------------------------------------------------
+    non_sig_regs = []
+    regions = []
 
+    # read first 2 regions
+    seq_prev = fp.readline().strip().split('\t')
+    seq_next = fp.readline().strip().split('\t')
 
-def calc_seq_overlap(s1, e1, s2, e2):
-    """
-    Calculate sequence overlaps
+    # read while there are no duplicates
+    while len(seq_next) > 1:
 
-    s1: SEQ1 start coordinate
-    e1: SEQ1 end coordinate
-    s2: SEQ2 start coordinate
-    e2: SEQ2 end coordinate
-    """
+        # the same accession - create region list, otherwise the sequence is
+        # significant...
+        while(len(seq_next) > 1 and string.find(seq_prev[ccu.SEQ_ACC],
+                                                seq_next[ccu.SEQ_ACC]) != -1):
+            # add the previous only in the first occurence
 
-    len1 = abs(e1 - s1)
-    len2 = abs(e2 - s2)
+            if len(regions) == 0:
+                regions.append(seq_prev)  # add the first
+                regions.append(seq_next)
+            # else only add the next one
+            else:
+                regions.append(seq_next)  # add the next
 
-    overlap = None
+            seq_prev = seq_next
+            seq_next = fp.readline().strip().split('\t')
 
-    # get strand
-    strand = get_strand(s1, e1)
+        # at some point create the seq region list
+        # call compete region function
+        non_sig_regs.extend(ccu.compete_seq_regions(regions, logging))
 
-    # full overlap
-    if s1 == s2 and len1 == len2:
-        return float(len1) / float(len2)
+        seq_prev = seq_next
+        seq_next = fp.readline().strip().split('\t')
 
-    # check5'
-    elif strand == 1:
-        overlap = cal_overlap_pos_strand(s1, e1, s2, e2)
+        regions = []
 
-    # check 3'
-    elif strand == -1:
-        overlap = cal_overlap_neg_strand(s1, e1, s2, e2)
+    fp.close()
 
-    # will return None in a case that we didn't capture
-    return overlap
+    # at this point update full_region table
+    if update:
+        update_non_significant_regions(non_sig_regs, clan_comp_type)
 
-# -----------------------------------------------------------------------------
+    return non_sig_regs
 
+# -----------------------------------------------------------------------------
 
-def cal_overlap_pos_strand(s1, e1, s2, e2):
-    """
-    Calculates the region overlap between two regions on the 5' strand and
-    returns the degree of overlap
 
-    s1: Seq1 start coordinates
-    e1: Seq1 end coordinates
-    s2: Seq2 start coordinates
-    e2: Seq2 end coordinates
+def compete_clan_from_db(clan_acc, clan_comp_type='FULL'):
     """
+    Streams the regions of a clan from the database ordered by sequence
+    accession and competes them on the fly, without clan files. Non significant
+    regions are updated in batches of UPDATE_BATCH_SIZE so that memory usage
+    does not depend on the size of the clan
 
-    overlap = None
-
-    len1 = abs(e1 - s1)
-    len2 = abs(e2 - s2)
+    clan_acc: A valid Rfam clan accession
+    clan_comp_type: FULL for full_region competition or PDB for pdb_full_region
 
-    min_len = min(len1, len2)
+    return: The number of non significant regions
+    """
 
-    # seq2 within seq1
-    if s1 < s2 and e2 < e1:
-        overlap = COMP_OVL
+    # log regions in which calculate overlap returns None
+    logging.basicConfig(
+        filename="missed_overlaps.log", filemode='w', level=logging.DEBUG)
 
-    # partial overlap, seq1 before seq2
-    elif s1 <= s2 and s2 < e1 and e1 <= e2:
-        overlap = float(e1 - s2 + 1) / float(min_len)
+    regions = db_utils.stream_clan_region_records(clan_acc, clan_comp_type=clan_comp_type)
 
-    # no overlap, seq1 before seq2
-    elif s1 < s2 and e1 <= s2:
-        overlap = NO_OVL
+    num_non_sig_regs = 0
+    non_sig_regs = []
 
-    # seq1 within seq2 region
-    elif s2 < s1 and e1 < e2:
-        overlap = COMP_OVL
+    for non_sig_reg in ccu.compete_clan_regions(regions, logging):
+        non_sig_regs.append(non_sig_reg)
 
-    # no overlap, seq2 before seq1
-    elif s2 < s1 and e2 <= s1:
-        overlap = NO_OVL
+        if len(non_sig_regs) == UPDATE_BATCH_SIZE:
+            update_non_significant_regions(non_sig_regs, clan_comp_type)
+            num_non_sig_regs += len(non_sig_regs)
+            non_sig_regs = []
 
-    # partial overlap, seq2 before seq1
-    elif s2 <= s1 and s1 < e2 and e2 <= e1:
-        overlap = float(e2 - s1 + 1) / float(min_len)
+    update_non_significant_regions(non_sig_regs, clan_comp_type)
+    num_non_sig_regs += len(non_sig_regs)
 
-    return overlap
+    return num_non_sig_regs
 
 # -----------------------------------------------------------------------------
 
 
-def cal_overlap_neg_strand(s1, e1, s2, e2):
+def compete_clans_incremental(rfam_accs=None, rfamseq_accs=None):
     """
-    Calculates the region overlap between two regions on the 3' strand and
-    returns the degree of overlap
+    Recompetes only the sequences affected by a partial update, such as new or
+    rethresholded families, and updates is_significant for the regions whose
+    value changes. Regions of the affected clans on the touched sequences are
+    streamed from the database, so a single family update doesn't require
+    resetting and recompeting all clans.
+
+    Sequences that no longer have regions of the changed families (e.g. removed
+    regions) must be provided in rfamseq_accs.
 
-    s1: Seq1 start coordinates
-    e1: Seq1 end coordinates
-    s2: Seq2 start coordinates
-    e2: Seq2 end coordinates
+    rfam_accs: A list of Rfam family accessions whose full_region regions changed
+    rfamseq_accs: A list of rfamseq accessions whose full_region regions changed
 
+    return: A tuple with the number of regions set to non significant and the
+    number of regions set to significant
     """
 
-    overlap = None
+    # log regions in which calculate overlap returns None
+    logging.basicConfig(
+        filename="missed_overlaps.log", filemode='w', level=logging.DEBUG)
+
+    clans = set()
+    seq_accs = set()
 
-    len1 = abs(e1 - s1)
-    len2 = abs(e2 - s2)
+    if rfam_accs:
+        clans.update(db_utils.fetch_family_clan_accessions(rfam_accs))
+        seq_accs.update(db_utils.fetch_family_rfamseq_accessions(rfam_accs))
 
-    min_len = min(len1, len2)
+    if rfamseq_accs:
+        clans.update(db_utils.fetch_rfamseq_clan_accessions(rfamseq_accs))
+        seq_accs.update(rfamseq_accs)
 
-    # seq2 within seq1 region - this may match the partial overlap case
-    if s1 > s2 and e1 < e2:
-        overlap = COMP_OVL
+    num_to_zero = 0
+    num_to_one = 0
 
-    # no overlap, seq1 before seq2
-    elif s1 > s2 and e1 >= s2:
-        overlap = NO_OVL
+    for clan in sorted(clans):
+        regions = db_utils.stream_clan_rfamseq_region_records(clan, seq_accs)
+        (to_zero, to_one) = ccu.significance_changes(regions, logging)
 
-    # partial overlap, seq1 before seq2
-    elif s1 >= s2 and s2 > e1 and e1 >= e2:
-        overlap = float(s2 - e1 + 1) / float(min_len)
+        if len(to_zero) > 0:
+            db_utils.set_is_singificant_to_zero_multi(to_zero)
 
-    # seq1 within seq2 region
-    elif s2 > s1 and e1 > e2:
-        overlap = COMP_OVL
+        if len(to_one) > 0:
+            db_utils.set_is_significant_to_one_multi(to_one)
 
-    # no overlap, seq2 before seq1
-    elif s2 > s1 and e2 >= s1:
-        overlap = NO_OVL
+        print "%s : -%s +%s" % (clan, len(to_zero), len(to_one))
 
-    # partial overlap, seq2 before seq1
-    elif s2 >= s1 and s1 > e2 and e2 >= e1:
-        overlap = float(s1 - e2 + 1) / float(min_len)
+        num_to_zero += len(to_zero)
+        num_to_one += len(to_one)
 
-    return overlap
+    return (num_to_zero, num_to_one)
 
 # -----------------------------------------------------------------------------
 
 
-def compete_seq_regions(regions, log):
+def compete_clans_parallel(clans, clan_comp_type='FULL', workers=2):
     """
-    regions: A list of duplicate regions for seq_acc
-    log: log file pointer for tracking regions we haven't captured
+    Competes clans in a pool of worker processes. Workers only compete clans
+    and return the non significant regions, which are collected here and
+    updated in batches of UPDATE_BATCH_SIZE from a single database connection
+
+    clans: A list of (clan_acc, clan_file) tuples. Regions of clans with no
+    clan file (None) are streamed from the database
+    clan_comp_type: FULL for full_region competition or PDB for pdb_full_region
+    workers: The number of worker processes
+
+    return: The number of non significant regions
     """
 
-    index = 0
+    # log regions in which calculate overlap returns None
+    logging.basicConfig(
+        filename="missed_overlaps.log", filemode='w', level=logging.DEBUG)
+
+    tasks = [(clan_acc, clan_file, clan_comp_type) for (clan_acc, clan_file) in clans]
 
+    num_non_sig_regs = 0
     non_sig_regs = []
 
-    while index <= len(regions) - 2:
-        reg1 = regions[index]
-        comp_regs = regions[index + 1:]
-
-        for reg2 in comp_regs:
-
-            strand1 = get_strand(int(reg1[START]), int(reg1[END]))
-            strand2 = get_strand(int(reg2[START]), int(reg2[END]))
-
-            # check if the sequences come from the same strand
-            if strand1 == strand2:
-
-                # calculate overlap
-                overlap = calc_seq_overlap(int(reg1[START]), int(reg1[END]),
-                                           int(reg2[START]), int(reg2[END]))
-
-                # check for a an overlap
-                if overlap >= OVERLAP:
-
-                    # at this point check the evalues and build the list for
-                    # the non significant regions
-
-                    if float(reg1[EVAL]) != float(reg2[EVAL]):
-                        if float(reg1[EVAL]) < float(reg2[EVAL]):
-                            if ((reg2[RFAM_ACC], reg2[SEQ_ACC],
-                                 reg2[START]) not in non_sig_regs):
-                                non_sig_regs.append(
-                                    (reg2[RFAM_ACC], reg2[SEQ_ACC], reg2[START]))
-                        else:
-                            if ((reg1[RFAM_ACC], reg1[SEQ_ACC],
-                                 reg1[START]) not in non_sig_regs):
-                                non_sig_regs.append(
-                                    (reg1[RFAM_ACC], reg1[SEQ_ACC], reg1[START]))
-
-                    # check bit scores if e-values are equal
-                    else:
-                        if float(reg1[BIT_SCORE]) >= float(reg2[BIT_SCORE]):
-                            if ((reg2[RFAM_ACC], reg2[SEQ_ACC],
-                                 reg2[START]) not in non_sig_regs):
-                                non_sig_regs.append(
-                                    (reg2[RFAM_ACC], reg2[SEQ_ACC], reg2[START]))
-                        else:
-                            if ((reg1[RFAM_ACC], reg1[SEQ_ACC],
-                                 reg1[START]) not in non_sig_regs):
-                                non_sig_regs.append(
-                                    (reg1[RFAM_ACC], reg1[SEQ_ACC], reg1[START]))
-
-                elif overlap is None:
-                    log.debug("reg1: %s" % '\t'.join(reg1))
-                    log.debug("reg2: %s" % '\t'.join(reg2))
-
-        index = index + 1
-        comp_regs = None
+    pool = multiprocessing.Pool(processes=workers)
 
-    return non_sig_regs
+    try:
+        for (clan_acc, clan_non_sig_regs, elapsed_time) in pool.imap_unordered(_compete_clan, tasks):
+            print "%s : %s (%.2f sec)" % (clan_acc, len(clan_non_sig_regs), elapsed_time)
 
-# -----------------------------------------------------------------------------
+            non_sig_regs.extend(clan_non_sig_regs)
+            num_non_sig_regs += len(clan_non_sig_regs)
 
+            if len(non_sig_regs) >= UPDATE_BATCH_SIZE:
+                update_non_significant_regions(non_sig_regs, clan_comp_type)
+                non_sig_regs = []
 
-def complete_clan_seqs(sorted_clan, clan_comp_type='FULL'):
-    """
-    Parses a sorted clan file and generates a list of regions per rfam_acc,
-    which are then competed by compete_seq_regions
+        update_non_significant_regions(non_sig_regs, clan_comp_type)
 
-    sorted_clan: A valid path to a sorted clan file
+    except BaseException:
+        pool.terminate()
+        raise
+
+    else:
+        # let the workers exit normally, running their exit handlers (e.g.
+        # writing query profiles)
+        pool.close()
+
+    finally:
+        pool.join()
+
+    return num_non_sig_regs
+
+# -----------------------------------------------------------------------------
+
+
+def _compete_clan(task):
     """
+    Competes a single clan without updating the database. Used by the process
+    pool in compete_clans_parallel
 
-    fp = open(sorted_clan, 'r')
+    task: A (clan_acc, clan_file, clan_comp_type) tuple
 
-    # log regions in which calculate overlap returns None
-    logging.basicConfig(
-        filename="missed_overlaps.log", filemode='w', level=logging.DEBUG)
+    return: A (clan_acc, non_sig_regs, elapsed_time) tuple
+    """
 
-    non_sig_regs = []
-    regions = []
+    (clan_acc, clan_file, clan_comp_type) = task
 
-    # read first 2 regions
-    seq_prev = fp.readline().strip().split('\t')
-    seq_next = fp.readline().strip().split('\t')
+    t_start = timeit.default_timer()
 
-    # read while there are no duplicates
-    while len(seq_next) > 1:
+    if clan_file is None:
+        regions = db_utils.stream_clan_region_records(clan_acc, clan_comp_type=clan_comp_type)
+        non_sig_regs = list(ccu.compete_clan_regions(regions, logging))
+    else:
+        non_sig_regs = complete_clan_seqs(clan_file, clan_comp_type=clan_comp_type, update=False)
 
-        # the same accession - create region list, otherwise the sequence is
-        # significant...
-        while(len(seq_next) > 1 and string.find(seq_prev[SEQ_ACC],
-                                                seq_next[SEQ_ACC]) != -1):
-            # add the previous only in the first occurence
+    return (clan_acc, non_sig_regs, timeit.default_timer() - t_start)
 
-            if len(regions) == 0:
-                regions.append(seq_prev)  # add the first
-                regions.append(seq_next)
-            # else only add the next one
-            else:
-                regions.append(seq_next)  # add the next
+# -----------------------------------------------------------------------------
 
-            seq_prev = seq_next
-            seq_next = fp.readline().strip().split('\t')
 
-        # at some point create the seq region list
-        # call compete region function
-        non_sig_regs.extend(compete_seq_regions(regions, logging))
+def update_non_significant_regions(non_sig_regs, clan_comp_type='FULL'):
+    """
+    Sets is_significant to 0 for the regions that lost clan competition
 
-        seq_prev = seq_next
-        seq_next = fp.readline().strip().split('\t')
+    non_sig_regs: A list of (rfam_acc, rfamseq_acc, seq_start) tuples
+    clan_comp_type: FULL for full_region competition or PDB for pdb_full_region
 
-        regions = []
+    return: The number of rows updated
+    """
 
-    fp.close()
+    if len(non_sig_regs) == 0:
+        return 0
 
-    # at this point update full_region table
-    if len(non_sig_regs) != 0:
-        if clan_comp_type == 'FULL':
-            db_utils.set_is_singificant_to_zero_multi(non_sig_regs)
-        else:
-            db_utils.set_pdb_is_significant_to_zero(non_sig_regs)
+    if clan_comp_type == 'FULL':
+        return db_utils.set_is_singificant_to_zero_multi(non_sig_regs)
 
-    return non_sig_regs
+    return db_utils.set_pdb_is_significant_to_zero(non_sig_regs)
 
 # -----------------------------------------------------------------------------
 
@@ -337,10 +304,15 @@ def usage():
 
     print "\nUsage:\n------"
 
-    print "\nclan_competition.py [clan_file|clan_dir] [-r] [PDB|FULL]"
+    print "\nclan_competition.py [clan_file|clan_dir|--db [clan_acc]] [-r] [PDB|FULL] [--workers N]"
+    print "clan_competition.py --incremental [--families RF00001,...] [--seqs acc,...|acc_file]"
 
     print "\nclan_dir: A directory of sorted clan region files"
     print "clan_file: The path to a sorted clan region file"
+    print "--db: Stream clan regions from the database, for all clans or clan_acc only"
+    print "\n--workers N: Compete clans in N processes (clan_dir and --db only)"
+    print "\n--incremental: Recompete only the sequences of the changed families"
+    print "  (--families RF00001,...) and/or changed sequences (--seqs acc,...|acc_file)"
     print "\n-r option to reset is_significant field"
     print "\nPDB option for pdb clan competition"
     print "\nFULL option for full region clan competition"
@@ -356,25 +328,98 @@ if __name__ == '__main__':
     clan_source = sys.argv[1]
     #clan_competition_type = sys.argv[2]
 
+    clan_comp_type = 'FULL'
+    if sys.argv.count("pdb") == 1 or sys.argv.count("PDB") == 1:
+        clan_comp_type = 'PDB'
+
+    # number of processes to compete clans with
+    workers = 1
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+
+    # recompete changed families/sequences and exit
+    if clan_source == "--incremental":
+        rfam_accs = None
+        if "--families" in sys.argv:
+            rfam_accs = sys.argv[sys.argv.index("--families") + 1].split(',')
+
+        rfamseq_accs = None
+        if "--seqs" in sys.argv:
+            seqs = sys.argv[sys.argv.index("--seqs") + 1]
+
+            # a file with one accession per line or a comma separated list
+            if os.path.isfile(seqs):
+                fp = open(seqs, 'r')
+                rfamseq_accs = [x.strip() for x in fp if x.strip() != '']
+                fp.close()
+            else:
+                rfamseq_accs = seqs.split(',')
+
+        if rfam_accs is None and rfamseq_accs is None:
+            usage()
+            sys.exit()
+
+        t_start = timeit.default_timer()
+
+        (num_to_zero, num_to_one) = compete_clans_incremental(rfam_accs=rfam_accs,
+                                                              rfamseq_accs=rfamseq_accs)
+
+        print "non significant: %s, significant: %s" % (num_to_zero, num_to_one)
+        print "elapsed time: ", timeit.default_timer() - t_start
+        sys.exit()
+
     # minor input checks
-    if not os.path.isdir(clan_source) and not os.path.isfile(clan_source):
+    if clan_source != "--db" and not os.path.isdir(clan_source) and not os.path.isfile(clan_source):
         usage()
         sys.exit()
 
     # with -r option reset all is_significant fields back to 1
     if sys.argv.count("-r") == 1:
         print "\nReseting is_significant fields ..."
-        if sys.argv.count("pdb") == 1 or sys.argv.count("PDB") == 1:
-            db_utils.reset_is_significant(clan_comp_type='PDB')
-        else:
-            db_utils.reset_is_significant(clan_comp_type='FULL')
+        num_reset = db_utils.reset_is_significant(clan_comp_type=clan_comp_type)
+        print "%s regions reset" % num_reset
 
     t_start = timeit.default_timer()
 
     print "\nCompeting Clans ...\n"
 
+    # compete clans streamed from the database
+    if clan_source == "--db":
+        if len(sys.argv) > 2 and sys.argv[2][0:2].upper() == "CL":
+            clans = [sys.argv[2]]
+        else:
+            clans = db_utils.fetch_clan_accessions()
+
+        if workers > 1:
+            num_non_sig_seqs = compete_clans_parallel([(x, None) for x in clans],
+                                                      clan_comp_type=clan_comp_type,
+                                                      workers=workers)
+            print "non significant regions: %s" % num_non_sig_seqs
+
+        else:
+            for clan in clans:
+                num_non_sig_seqs = compete_clan_from_db(clan, clan_comp_type=clan_comp_type)
+                print "%s : %s" % (clan, num_non_sig_seqs)
+
+        elapsed_time = timeit.default_timer() - t_start
+        print "elapsed time: ", elapsed_time
+
     # compete multiple clans
-    if os.path.isdir(clan_source):
+    elif os.path.isdir(clan_source) and workers > 1:
+        clan_files = [os.path.join(clan_source, x) for x in os.listdir(clan_source)
+                      if x.endswith(".txt")]
+
+        # start with the largest clans so that these don't run last
+        clan_files.sort(key=os.path.getsize, reverse=True)
+
+        num_non_sig_seqs = compete_clans_parallel([(os.path.basename(x)[0:8], x) for x in clan_files],
+                                                  clan_comp_type=clan_comp_type, workers=workers)
+        print "non significant regions: %s" % num_non_sig_seqs
+
+        elapsed_time = timeit.default_timer() - t_start
+        print "elapsed time: ", elapsed_time
+
+    elif os.path.isdir(clan_source):
         clan_files = [x for x in os.listdir(clan_source) if x.endswith(".txt")]
 
         non_sig_seqs = None
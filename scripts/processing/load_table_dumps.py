@@ -0,0 +1,144 @@
+#!/usr/bin/python
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Loads full_region (.txt), rfamseq (.rfamseq) and genseq (.genseq)
+             dumps to the database with LOAD DATA LOCAL INFILE. Interrupted
+             loads resume from the last committed chunk when rerun with the
+             same arguments.
+
+Usage: python load_table_dumps.py <dump file or directory> [--table full_region]
+       [--chunk-size N] [--disable-indexes] [--no-verify] [--restart]
+"""
+
+# ---------------------------------IMPORTS-------------------------------------
+
+import os
+import sys
+import argparse
+import timeit
+
+from utils import RfamDB
+from utils import load_data_utils as ldu
+
+# -----------------------------------------------------------------------------
+
+
+def list_dump_files(dump_input, table=None):
+    """
+    Lists the dump files to load
+
+    dump_input: A dump file or a directory of dump files
+    table: If set, all files in a directory are loaded to this table,
+    otherwise files with a known dump extension are loaded
+
+    return: A sorted list of file paths
+    """
+
+    if os.path.isfile(dump_input):
+        return [dump_input]
+
+    dump_files = []
+    for filename in sorted(os.listdir(dump_input)):
+        if filename.endswith(".json") or filename.endswith(".tmp"):
+            continue
+
+        if table is None:
+            try:
+                ldu.table_for_file(filename)
+            except ValueError:
+                continue
+
+        dump_files.append(os.path.join(dump_input, filename))
+
+    return dump_files
+
+# -----------------------------------------------------------------------------
+
+
+def parse_arguments():
+    """
+    Performs some basic argument parsing
+
+    return: parser object
+    """
+
+    parser = argparse.ArgumentParser(description='Bulk loads table dumps with LOAD DATA')
+
+    parser.add_argument("input", help="A dump file or a directory of dump files", type=str)
+    parser.add_argument("--table", help="Table to load to. Guessed from the file extension if omitted",
+                        choices=sorted(ldu.TABLE_COLUMNS.keys()), default=None)
+    parser.add_argument("--chunk-size", help="Number of rows loaded per transaction",
+                        type=int, default=ldu.CHUNK_SIZE)
+    parser.add_argument("--disable-indexes", help="Drop secondary indexes and disable unique and foreign key checks "
+                        "during the load. Indexes are rebuilt once all files of a table are loaded",
+                        action="store_true", default=False)
+    parser.add_argument("--no-verify", help="Skip row count verification",
+                        action="store_true", default=False)
+    parser.add_argument("--restart", help="Ignore any previous load of the files",
+                        action="store_true", default=False)
+    parser.add_argument("--tmp-dir", help="Directory to write chunk files to", type=str, default=None)
+    parser.add_argument("--database", help="Database to load to",
+                        choices=RfamDB.DATABASES, default=None)
+
+    return parser
+
+# -----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = parse_arguments()
+    args = parser.parse_args()
+
+    if args.database is not None:
+        RfamDB.select_database(args.database)
+
+    dump_files = list_dump_files(args.input, args.table)
+
+    if len(dump_files) == 0:
+        sys.exit("\nNo dump files found in %s" % args.input)
+
+    # group files by table, so that indexes are dropped and rebuilt once per table
+    table_files = {}
+    for dump_file in dump_files:
+        table = args.table or ldu.table_for_file(dump_file)
+        table_files.setdefault(table, []).append(dump_file)
+
+    t_start = timeit.default_timer()
+
+    failed = []
+    for table in sorted(table_files.keys()):
+        index_state_file = os.path.join(os.path.dirname(os.path.abspath(dump_files[0])),
+                                        table + ldu.INDEX_STATE_EXTENSION)
+
+        if args.disable_indexes:
+            ldu.disable_indexes(table, index_state_file)
+
+        for dump_file in table_files[table]:
+            print ("Loading %s" % dump_file)
+
+            state = ldu.load_dump(dump_file, table=table, chunk_size=args.chunk_size,
+                                  disable_checks=args.disable_indexes, verify=not args.no_verify,
+                                  restart=args.restart, tmp_dir=args.tmp_dir)
+
+            if state.get("verified") is False:
+                failed.append(dump_file)
+
+        # also rebuilds indexes dropped by an interrupted run
+        ldu.enable_indexes(index_state_file)
+
+    print ("%d files loaded in %.1fs" % (len(dump_files), timeit.default_timer() - t_start))
+
+    if len(failed) > 0:
+        sys.exit("\nRow count verification failed for: %s" % ', '.join(failed))
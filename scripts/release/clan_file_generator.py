@@ -61,18 +61,17 @@ def clan_file_generator(output_dir, clan_comp_type='FULL', clan_acc=None):
         elif clan_comp_type.upper() == 'PDB':
             regions = rfamdb.fetch_clan_pdb_full_region_records(clan)
 
-        # open a new clan file to dump the sequences
-        if len(regions) > 0:
-            print "clan: ", clan
-            clan_fp = open(os.path.join(output_dir, clan) + ".txt", 'w')
-
-        # if no available regions, move to next clan
-        else:
-            continue
+        # full regions are streamed, so the clan file is opened on the first
+        # region. No file is created for clans without regions
+        clan_fp = None
 
         flag = 1
         # loop over rows
         for region in regions:
+            if clan_fp is None:
+                print "clan: ", clan
+                clan_fp = open(os.path.join(output_dir, clan) + ".txt", 'w')
+
             # append fields
             if clan_comp_type == 'FULL':
                 region = region[:len(region) - 1]
@@ -89,7 +88,8 @@ def clan_file_generator(output_dir, clan_comp_type='FULL', clan_acc=None):
             clan_fp.write(line)
             flag = 1
 
-        clan_fp.close()
+        if clan_fp is not None:
+            clan_fp.close()
 
         flag = 1
 
@@ -0,0 +1,351 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Benchmarks clan competition on synthetic clan files. Region files
+             are generated in the clan file format of clan_file_generator.py,
+             parameterised by the number of sequences, hits per sequence,
+             overlap density and strand mix. Competition is timed end to end
+             through scripts/processing/clan_competition.py, with the database
+             updates replaced by an in-memory sink:
+
+             file:   complete_clan_seqs, as run on clan files
+             stream: compete_clan_from_db, with the clan regions read from the
+                     file instead of the database
+
+             Every run is done in a new process, so that the peak RSS reported
+             is that of the run alone.
+
+Usage: python clan_competition_benchmark.py [--seqs 1000,10000] [--hits 2,10]
+       [--overlap 0.5] [--minus-strand 0.5] [--modes file,stream]
+       [--repeat 3] [--json results.json]
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import timeit
+
+# --------------------------------------------------------------------------------------------------
+
+MODES = ("file", "stream")
+
+CLAN_SIZE = 4  # number of families in the synthetic clan
+HIT_LENGTH = (50, 300)  # min and max length of a hit
+SEQ_LENGTH_PER_HIT = 2000  # sequence length per hit, which sets the chance of random overlaps
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _seq_hits(rng, num_hits, overlap, minus_strand):
+    # hits of a sequence as (start, end) tuples. With probability overlap a
+    # hit is placed on the strand of a previous hit and shifted from it by at
+    # most half of the shorter of the two, so that most of these compete
+    seq_length = num_hits * SEQ_LENGTH_PER_HIT
+
+    hits = []
+    for _ in range(num_hits):
+        length = rng.randint(*HIT_LENGTH)
+
+        if len(hits) > 0 and rng.random() < overlap:
+            (start, end) = rng.choice(hits)
+            low = min(start, end)
+            previous_length = abs(end - start) + 1
+            low = max(1, low + rng.randint(-min(length, previous_length) // 2,
+                                           min(length, previous_length) // 2))
+            minus = start > end
+
+        else:
+            low = rng.randint(1, seq_length - length)
+            minus = rng.random() < minus_strand
+
+        high = low + length - 1
+        hits.append((high, low) if minus else (low, high))
+
+    return hits
+
+
+def generate_clan_file(path, num_seqs, hits_per_seq, overlap=0.5, minus_strand=0.5,
+                       clan_size=CLAN_SIZE, seed=0):
+    """
+    Writes a synthetic clan file, sorted on rfamseq_acc as competition expects
+
+    path: The path of the clan file
+    num_seqs: The number of sequences
+    hits_per_seq: The number of hits on each sequence
+    overlap: The probability that a hit overlaps a previous hit of its
+    sequence (0-1)
+    minus_strand: The share of hits not overlapping others on the minus strand
+    clan_size: The number of families the hits are distributed to
+    seed: The seed of the random number generator
+
+    return: The number of regions written
+    """
+
+    rng = random.Random(seed)
+    rfam_accs = ["RF%05d" % (x + 1) for x in range(clan_size)]
+
+    fp_out = open(path, 'w')
+
+    num_regions = 0
+    for seq_index in range(num_seqs):
+        rfamseq_acc = "SY%08d.1" % seq_index
+
+        lines = []
+        for (start, end) in _seq_hits(rng, hits_per_seq, overlap, minus_strand):
+            bit_score = round(rng.uniform(20.0, 200.0), 1)
+            evalue = "%.1e" % (10 ** -(bit_score / 10.0))
+            length = abs(end - start) + 1
+
+            lines.append('\t'.join([rng.choice(rfam_accs), rfamseq_acc, str(start), str(end),
+                                    str(bit_score), evalue, "1", str(length), "0", "full"]))
+
+        # clan files are sorted with sort -k2, on the line from the sequence accession on
+        lines.sort(key=lambda x: x.split('\t', 1)[1])
+
+        for line in lines:
+            fp_out.write(line + '\n')
+
+        num_regions += len(lines)
+
+    fp_out.close()
+
+    return num_regions
+
+# --------------------------------------------------------------------------------------------------
+
+
+class MemorySink(object):
+    """
+    Collects non significant regions in place of the database updates of
+    clan_competition.update_non_significant_regions
+    """
+
+    def __init__(self):
+        self.regions = set()
+        self.num_updates = 0
+
+    def update(self, non_sig_regs, clan_comp_type='FULL'):
+        self.regions.update(non_sig_regs)
+        self.num_updates += 1
+
+        return len(non_sig_regs)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _read_clan_file(path):
+    # the regions of a clan file, as streamed from the database
+    fp_in = open(path, 'r')
+    for line in fp_in:
+        yield line.rstrip('\n').split('\t')
+
+    fp_in.close()
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in MB
+    """
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    if platform.system() == "Darwin":
+        return max_rss / (1024.0 * 1024.0)
+
+    return max_rss / 1024.0
+
+
+def run_competition(clan_file, mode, work_dir):
+    """
+    Competes a clan file once with the database updates replaced by a
+    MemorySink. Meant to be run in a new process
+
+    clan_file: The path of a sorted clan file
+    mode: file to compete with complete_clan_seqs or stream to compete with
+    compete_clan_from_db
+    work_dir: The directory competition logs are written to
+
+    return: A dictionary with the elapsed time, the number of non significant
+    regions and the peak RSS of the process
+    """
+
+    # imported here, so that clan files can be generated without database configuration
+    from scripts.processing import clan_competition
+
+    sink = MemorySink()
+    clan_competition.update_non_significant_regions = sink.update
+    clan_competition.db_utils.stream_clan_region_records = \
+        lambda clan_acc, clan_comp_type='FULL': _read_clan_file(clan_file)
+
+    os.chdir(work_dir)
+    rss_start = peak_rss()
+
+    t_start = timeit.default_timer()
+
+    if mode == "file":
+        clan_competition.complete_clan_seqs(clan_file, clan_comp_type='FULL', update=True)
+    else:
+        clan_competition.compete_clan_from_db("CL00001", clan_comp_type='FULL')
+
+    elapsed = timeit.default_timer() - t_start
+
+    return {"seconds": elapsed, "non_significant": len(sink.regions),
+            "peak_rss_mb": peak_rss(), "start_rss_mb": rss_start}
+
+
+def _run_in_process(args):
+    # pool worker
+    return run_competition(*args)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def benchmark(seqs, hits, overlap=0.5, minus_strand=0.5, modes=MODES, repeat=3, seed=0,
+              work_dir=None):
+    """
+    Generates a clan file for every combination of sequence and hit counts and
+    times competition on it in each mode
+
+    seqs: A list of sequence counts
+    hits: A list of hits per sequence
+    overlap: The overlap density, see generate_clan_file
+    minus_strand: The share of minus strand hits, see generate_clan_file
+    modes: The competition modes to time, see run_competition
+    repeat: The number of runs per case. The fastest run is reported
+    seed: The seed of the random number generator
+    work_dir: A directory for the clan files. Defaults to a temporary
+    directory that is removed afterwards
+
+    return: A list of result dictionaries, one per case
+    """
+
+    tmp_dir = None
+    if work_dir is None:
+        work_dir = tmp_dir = tempfile.mkdtemp(prefix="clan_benchmark_")
+
+    results = []
+
+    try:
+        for num_seqs in seqs:
+            for hits_per_seq in hits:
+                clan_file = os.path.join(work_dir, "CL_%d_%d.txt" % (num_seqs, hits_per_seq))
+                num_regions = generate_clan_file(clan_file, num_seqs, hits_per_seq,
+                                                 overlap=overlap, minus_strand=minus_strand,
+                                                 seed=seed)
+
+                for mode in modes:
+                    runs = []
+                    for _ in range(repeat):
+                        # a new process per run, so that peak RSS is not carried over
+                        pool = multiprocessing.Pool(processes=1)
+                        runs.append(pool.apply(_run_in_process, ((clan_file, mode, work_dir),)))
+                        pool.close()
+                        pool.join()
+
+                    best = min(runs, key=lambda x: x["seconds"])
+
+                    results.append({"mode": mode, "seqs": num_seqs, "hits_per_seq": hits_per_seq,
+                                    "overlap": overlap, "minus_strand": minus_strand,
+                                    "regions": num_regions,
+                                    "non_significant": best["non_significant"],
+                                    "seconds": best["seconds"],
+                                    "regions_per_sec": num_regions / max(best["seconds"], 1e-9),
+                                    "peak_rss_mb": max([x["peak_rss_mb"] for x in runs])})
+
+                os.remove(clan_file)
+
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    return results
+
+
+def print_results(results):
+    """
+    Prints benchmark results as a table
+    """
+
+    print ("%-8s %10s %6s %12s %12s %10s %14s %12s" % ("mode", "seqs", "hits", "regions",
+                                                      "non_sig", "seconds", "regions/sec",
+                                                      "peak RSS MB"))
+
+    for result in results:
+        print ("%-8s %10d %6d %12d %12d %10.2f %14.0f %12.1f" % (
+            result["mode"], result["seqs"], result["hits_per_seq"], result["regions"],
+            result["non_significant"], result["seconds"], result["regions_per_sec"],
+            result["peak_rss_mb"]))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_arguments():
+    """
+    Performs some basic argument parsing
+
+    return: parser object
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmarks clan competition on synthetic clans')
+
+    parser.add_argument("--seqs", help="Comma separated sequence counts", type=str,
+                        default="1000,10000")
+    parser.add_argument("--hits", help="Comma separated numbers of hits per sequence", type=str,
+                        default="2,10")
+    parser.add_argument("--overlap", help="Probability of a hit overlapping a previous hit (0-1)",
+                        type=float, default=0.5)
+    parser.add_argument("--minus-strand", help="Share of minus strand hits (0-1)", type=float,
+                        default=0.5)
+    parser.add_argument("--modes", help="Comma separated competition modes (file, stream)",
+                        type=str, default=','.join(MODES))
+    parser.add_argument("--repeat", help="Runs per case, the fastest is reported", type=int,
+                        default=3)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Directory for the clan files", type=str, default=None)
+    parser.add_argument("--json", help="Also write the results to a JSON file", type=str,
+                        default=None)
+
+    return parser
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    args = parse_arguments().parse_args()
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parse_arguments().error("Unknown mode %s. Choose from %s" % (mode, ', '.join(MODES)))
+
+    results = benchmark([int(x) for x in args.seqs.split(',')],
+                        [int(x) for x in args.hits.split(',')],
+                        overlap=args.overlap, minus_strand=args.minus_strand, modes=modes,
+                        repeat=args.repeat, seed=args.seed, work_dir=args.work_dir)
+
+    print_results(results)
+
+    if args.json is not None:
+        fp_out = open(args.json, 'w')
+        json.dump(results, fp_out, indent=2)
+        fp_out.close()
@@ -0,0 +1,357 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Generates a synthetic Rfam database in SQLite (see
+             utils/sqlite_backend), scaled by the number of families, genomes
+             and regions, so that the database code can be run and timed
+             without rfam_live. The data is random but consistent: every
+             region belongs to an existing family and sequence, sequences
+             belong to genomes, and a share of the families are grouped in
+             clans. The same seed always generates the same database.
+
+Usage: python synthetic_rfam_db.py <database file> [--families N] [--genomes N]
+       [--regions N] [--seqs-per-genome N] [--seed N]
+
+       The database is then used with:
+       export RFAM_DB_SQLITE=<database file>
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import timeit
+
+from utils import sqlite_backend
+
+# --------------------------------------------------------------------------------------------------
+
+RELEASE = "14.0"  # release of the data, as in the genseq version of db_utils and rfam_search
+INSERT_BATCH_SIZE = 10000  # rows inserted at a time
+
+CLAN_FRACTION = 0.3  # share of families in clans
+CLAN_SIZES = (2, 6)  # min and max number of families per clan
+SIGNIFICANT_FRACTION = 0.9  # share of significant regions
+SEED_FRACTION = 0.05  # share of regions that are seed regions
+
+RNA_TYPES = ("Gene; tRNA;", "Gene; rRNA;", "Gene; snRNA; snoRNA; CD-box;",
+             "Gene; snRNA; snoRNA; HACA-box;", "Gene; miRNA;", "Gene; ribozyme;",
+             "Gene; sRNA;", "Cis-reg; riboswitch;", "Cis-reg; IRES;", "Intron;")
+
+LINEAGES = (("Bacteria", "Bacteria; Proteobacteria; Gammaproteobacteria; Enterobacterales;"),
+            ("Bacteria", "Bacteria; Firmicutes; Bacilli; Bacillales;"),
+            ("Archaea", "Archaea; Euryarchaeota; Methanomicrobia; Methanosarcinales;"),
+            ("Eukaryota", "Eukaryota; Metazoa; Chordata; Mammalia; Primates;"),
+            ("Eukaryota", "Eukaryota; Viridiplantae; Streptophyta; Magnoliopsida;"),
+            ("Eukaryota", "Eukaryota; Fungi; Ascomycota; Saccharomycetes;"),
+            ("Viruses", "Viruses; Riboviria; Orthornavirae;"))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def insert_rows(cnx, table, columns, rows):
+    """
+    Inserts rows into a table in batches
+
+    cnx: A sqlite3 connection
+    table: The name of the table
+    columns: A tuple of column names
+    rows: An iterable of tuples with a value for each column
+
+    return: The number of rows inserted
+    """
+
+    query = "INSERT INTO %s (%s) VALUES (%s)" % (table, ', '.join(columns),
+                                                 ', '.join(["?"] * len(columns)))
+
+    num_rows = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == INSERT_BATCH_SIZE:
+            cnx.executemany(query, batch)
+            num_rows += len(batch)
+            batch = []
+
+    cnx.executemany(query, batch)
+
+    return num_rows + len(batch)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def generate_families(cnx, rng, num_families, created):
+    """
+    Generates families, with a wikitext entry, a literature reference and an
+    SO database link each, as the family queries join on them
+
+    return: A list of (rfam_acc, clen) tuples
+    """
+
+    families = []
+    family_rows = []
+    for index in range(1, num_families + 1):
+        rfam_acc = "RF%05d" % index
+        clen = rng.randint(50, 500)
+        families.append((rfam_acc, clen))
+
+        family_rows.append((rfam_acc, "synthetic_%d" % index, index,
+                            "Synthetic RNA family %d" % index, "Synthetic A",
+                            "Published; PMID:%d" % index,
+                            round(rng.uniform(20.0, 60.0), 2), rng.choice(RNA_TYPES), clen,
+                            rng.randint(2, 100), 0, 0, created, created))
+
+    insert_rows(cnx, "wikitext", ("auto_wiki", "title"),
+                [(x, "Synthetic_RNA_%d" % x) for x in range(1, num_families + 1)])
+
+    insert_rows(cnx, "family", ("rfam_acc", "rfam_id", "auto_wiki", "description", "author",
+                                "seed_source", "gathering_cutoff", "type", "clen", "num_seed",
+                                "num_full", "number_of_species", "created", "updated"),
+                family_rows)
+
+    insert_rows(cnx, "literature_reference", ("pmid", "title", "author", "journal"),
+                [(x, "Synthetic reference %d" % x, "Synthetic A", "Synthetic J") for x in
+                 range(1, num_families + 1)])
+
+    insert_rows(cnx, "family_literature_reference", ("rfam_acc", "pmid", "order_added"),
+                [(x[0], index + 1, 1) for (index, x) in enumerate(families)])
+
+    insert_rows(cnx, "database_link", ("rfam_acc", "db_id", "db_link"),
+                [(x[0], "SO", "0000655") for x in families])
+
+    return families
+
+# --------------------------------------------------------------------------------------------------
+
+
+def generate_clans(cnx, rng, families, created):
+    """
+    Groups CLAN_FRACTION of the families in clans of CLAN_SIZES families
+
+    return: A dictionary with the family accessions of every clan
+    """
+
+    rfam_accs = [x[0] for x in families]
+    rng.shuffle(rfam_accs)
+    rfam_accs = rfam_accs[:int(len(rfam_accs) * CLAN_FRACTION)]
+
+    clans = {}
+    while len(rfam_accs) >= CLAN_SIZES[0]:
+        clan_acc = "CL%05d" % (len(clans) + 1)
+        size = min(rng.randint(*CLAN_SIZES), len(rfam_accs))
+        clans[clan_acc] = sorted(rfam_accs[:size])
+        rfam_accs = rfam_accs[size:]
+
+    insert_rows(cnx, "clan", ("clan_acc", "id", "description", "author", "created", "updated"),
+                [(x, "Synthetic_clan_%s" % x[2:], "Synthetic clan", "Synthetic A", created,
+                  created) for x in sorted(clans.keys())])
+
+    insert_rows(cnx, "clan_membership", ("clan_acc", "rfam_acc"),
+                [(x, y) for x in sorted(clans.keys()) for y in clans[x]])
+
+    return clans
+
+# --------------------------------------------------------------------------------------------------
+
+
+def generate_genomes(cnx, rng, num_genomes, seqs_per_genome, created, release=RELEASE):
+    """
+    Generates genomes, each with its own tax id and seqs_per_genome
+    sequences in rfamseq and genseq
+
+    return: A list of (rfamseq_acc, length) tuples
+    """
+
+    taxonomy_rows = []
+    genome_rows = []
+    sequences = []
+    rfamseq_rows = []
+    genseq_rows = []
+    for index in range(1, num_genomes + 1):
+        ncbi_id = 100000 + index
+        upid = "UP%09d" % index
+        (kingdom, lineage) = rng.choice(LINEAGES)
+        species = "Synthetic species %d" % index
+
+        taxonomy_rows.append((ncbi_id, species, "%s %s" % (lineage, species), species, species))
+
+        total_length = 0
+        for seq_index in range(1, seqs_per_genome + 1):
+            rfamseq_acc = "SY%07d.1" % (len(sequences) + 1)
+            length = rng.randint(10000, 5000000)
+            total_length += length
+            sequences.append((rfamseq_acc, length))
+
+            rfamseq_rows.append((rfamseq_acc, rfamseq_acc.split('.')[0], 1, ncbi_id,
+                                 "genomic DNA", length, "%s chromosome %d" % (species, seq_index),
+                                 "SYNTHETIC"))
+            genseq_rows.append((rfamseq_acc, upid, str(seq_index), "chromosome", release))
+
+        genome_rows.append((upid, "GCA_%09d" % index, 1, species, kingdom, ncbi_id, total_length,
+                            0, 0, created, created))
+
+    insert_rows(cnx, "taxonomy", ("ncbi_id", "species", "tax_string", "tree_display_name",
+                                  "align_display_name"), taxonomy_rows)
+
+    insert_rows(cnx, "genome", ("upid", "assembly_acc", "assembly_version", "scientific_name",
+                                "kingdom", "ncbi_id", "total_length", "num_rfam_regions",
+                                "num_families", "created", "updated"), genome_rows)
+
+    insert_rows(cnx, "rfamseq", ("rfamseq_acc", "accession", "version", "ncbi_id", "mol_type",
+                                 "length", "description", "source"), rfamseq_rows)
+
+    insert_rows(cnx, "genseq", ("rfamseq_acc", "upid", "chromosome_name", "chromosome_type",
+                                "version"), genseq_rows)
+
+    return sequences
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _region_rows(rng, families, sequences, num_regions):
+    # random full_region rows of random families on random sequences and strands
+    for _ in range(num_regions):
+        (rfam_acc, clen) = rng.choice(families)
+        (rfamseq_acc, length) = rng.choice(sequences)
+
+        hit_length = rng.randint(clen // 2, clen)
+        start = rng.randint(1, length - hit_length)
+        end = start + hit_length - 1
+        if rng.random() < 0.5:
+            (start, end) = (end, start)
+
+        bit_score = round(rng.uniform(20.0, 300.0), 2)
+        is_significant = 1 if rng.random() < SIGNIFICANT_FRACTION else 0
+        region_type = "seed" if rng.random() < SEED_FRACTION else "full"
+
+        yield (rfam_acc, rfamseq_acc, start, end, bit_score,
+               "%.2e" % (10 ** -(bit_score / 10.0)), 1, clen, "0", region_type, is_significant)
+
+
+def generate_regions(cnx, rng, families, sequences, num_regions):
+    """
+    Generates full_region rows, with seed_region rows for the seed regions
+
+    return: The number of regions generated
+    """
+
+    columns = ("rfam_acc", "rfamseq_acc", "seq_start", "seq_end", "bit_score", "evalue_score",
+               "cm_start", "cm_end", "truncated", "type", "is_significant")
+
+    num_rows = insert_rows(cnx, "full_region", columns,
+                           _region_rows(rng, families, sequences, num_regions))
+
+    cnx.execute("INSERT INTO seed_region (rfam_acc, rfamseq_acc, seq_start, seq_end) "
+                "SELECT rfam_acc, rfamseq_acc, seq_start, seq_end FROM full_region "
+                "WHERE type='seed'")
+
+    return num_rows
+
+# --------------------------------------------------------------------------------------------------
+
+
+def generate_database(path, num_families=100, num_genomes=50, num_regions=100000,
+                      seqs_per_genome=5, seed=0):
+    """
+    Creates an SQLite database with the rfam_live schema and fills it with
+    synthetic data
+
+    path: The path of the database file. Must not exist
+    num_families: The number of families
+    num_genomes: The number of genomes
+    num_regions: The number of full_region rows
+    seqs_per_genome: The number of sequences of each genome
+    seed: The seed of the random number generator
+
+    return: A dictionary with the number of rows of the main tables
+    """
+
+    sqlite_backend.create_database(path)
+
+    rng = random.Random(seed)
+    created = datetime.datetime(2019, 1, 1)
+
+    cnx = sqlite3.connect(path)
+
+    try:
+        families = generate_families(cnx, rng, num_families, created)
+        clans = generate_clans(cnx, rng, families, created)
+        sequences = generate_genomes(cnx, rng, num_genomes, seqs_per_genome, created)
+        generate_regions(cnx, rng, families, sequences, num_regions)
+
+        cnx.execute("INSERT INTO version (rfam_release, rfam_release_date, number_families, "
+                    "embl_release) VALUES (?, ?, ?, ?)",
+                    (float(RELEASE), created, num_families, "synthetic"))
+
+        cnx.commit()
+
+        counts = {}
+        for table in ("family", "clan", "clan_membership", "genome", "rfamseq", "full_region",
+                      "seed_region"):
+            counts[table] = cnx.execute("SELECT count(*) FROM %s" % table).fetchone()[0]
+
+    except:
+        cnx.close()
+        os.remove(path)
+        raise
+
+    cnx.close()
+
+    return counts
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_arguments():
+    """
+    Performs some basic argument parsing
+
+    return: parser object
+    """
+
+    parser = argparse.ArgumentParser(description='Generates a synthetic Rfam database in SQLite')
+
+    parser.add_argument("path", help="The database file to create", type=str)
+    parser.add_argument("--families", help="Number of families", type=int, default=100)
+    parser.add_argument("--genomes", help="Number of genomes", type=int, default=50)
+    parser.add_argument("--regions", help="Number of full_region rows", type=int, default=100000)
+    parser.add_argument("--seqs-per-genome", help="Number of sequences per genome",
+                        type=int, default=5)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+
+    return parser
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    args = parse_arguments().parse_args()
+
+    if os.path.exists(args.path):
+        sys.exit("\n%s already exists" % args.path)
+
+    t_start = timeit.default_timer()
+
+    counts = generate_database(args.path, num_families=args.families, num_genomes=args.genomes,
+                               num_regions=args.regions, seqs_per_genome=args.seqs_per_genome,
+                               seed=args.seed)
+
+    for table in sorted(counts.keys()):
+        print ("%s: %d rows" % (table, counts[table]))
+
+    print ("Generated %s in %.1fs" % (args.path, timeit.default_timer() - t_start))
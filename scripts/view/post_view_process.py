@@ -19,16 +19,12 @@ if __name__ == '__main__':
     """
 
     # FAMILIES
-    RfamDB.set_num_full_sig_seqs()
-    RfamDB.set_number_of_species()
-    # truncate family_ncbi table before executing this
-    RfamDB.update_family_ncbi()
+    RfamDB.refresh_family_stats()
 
     # GENOMES
-    RfamDB.set_number_of_distinct_families_in_genome(upid=None)
     RfamDB.set_genome_size(upid=None)
-    RfamDB.set_number_of_distinct_families_in_genome(upid=None)
-    RfamDB.set_number_of_genomic_significant_hits(upid=None)
+    # num_families and num_rfam_regions
+    RfamDB.refresh_genome_stats(upids=None)
 
 
 
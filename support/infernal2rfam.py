@@ -25,16 +25,70 @@ if __name__ == '__main__':
 
     input_file = sys.argv[1]
 
+    # number of processes to parse Infernal's detailed output with
+    processes = 1
+    if "--cpu" in sys.argv:
+        processes = int(sys.argv[sys.argv.index("--cpu") + 1])
+
+    # comma separated list of output formats to generate in a single pass
+    formats = None
+    if "--formats" in sys.argv:
+        formats = sys.argv[sys.argv.index("--formats") + 1].split(',')
+
+    # compression of the output files. Compressed input is detected automatically
+    compression = None
+    if "--gzip" in sys.argv:
+        compression = "gzip"
+    elif "--bgzip" in sys.argv:
+        compression = "bgzip"
+
+    compresslevel = 6
+    if "--level" in sys.argv:
+        compresslevel = int(sys.argv[sys.argv.index("--level") + 1])
+
+    threads = 1
+    if "--threads" in sys.argv:
+        threads = int(sys.argv[sys.argv.index("--threads") + 1])
+
+    compression_args = {"compression": compression, "compresslevel": compresslevel,
+                        "threads": threads}
+
+    program = "cmsearch"
+    if "--cmscan" in sys.argv:
+        program = "cmscan"
+
+    # write a binary cache of the tblout file, used by later conversions
+    cache = "--cache" in sys.argv
+
     if "--tbl" in sys.argv or "--tblout" in sys.argv:
-            iu.tblout_to_full_region(input_file, dest_dir=None)
+        if formats is None:
+            iu.tblout_to_full_region(input_file, dest_dir=None, cache=cache, **compression_args)
+        else:
+            iu.infernal_to_formats(input_file, formats, input_format="tblout", program=program,
+                                   cache=cache, **compression_args)
 
     elif "-o" in sys.argv or "--out" in sys.argv:
-        iu.infernal_to_full_region(input_file, dest_dir=None, filename=None)
+        if formats is None:
+            iu.infernal_to_full_region(input_file, dest_dir=None, filename=None,
+                                       processes=processes, **compression_args)
+        else:
+            iu.infernal_to_formats(input_file, formats, input_format="out",
+                                   processes=processes, **compression_args)
 
     else:
         print "\nWrong input!\n"
 
-        print "Usage infernal_file [-o|--tbl]\n"
+        print "Usage infernal_file [-o|--tbl] [--cpu N] [--formats FORMAT,...] [--cmscan]",
+        print "[--gzip|--bgzip] [--level N] [--threads N] [--cache]\n"
 
         print "\n-o (--out): parse infernal output format"
-        print "\n--tbl (--tblout): parse infernal tblout format"
\ No newline at end of file
+        print "\n--tbl (--tblout): parse infernal tblout format"
+        print "\n--cpu N: number of processes to parse infernal output format with"
+        print "\n--formats: output formats to generate in a single pass (%s)." % ', '.join(sorted(iu.HIT_WRITERS.keys()))
+        print "Append .gz to a format for gzipped output (e.g. full_region,tsv.gz,bed)"
+        print "\n--cmscan: tblout file generated by cmscan instead of cmsearch"
+        print "\n--cache: write a binary cache of the tblout file (requires numpy), which is"
+        print "read instead of the text by later conversions while the file is unchanged"
+        print "\n--gzip (--bgzip): compress all output files with gzip (bgzip)"
+        print "\n--level N: compression level of the output files (1-9, default 6)"
+        print "\n--threads N: number of threads to compress the output files with (requires pigz/bgzip)"
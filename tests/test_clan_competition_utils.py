@@ -0,0 +1,116 @@
+import logging
+import random
+import unittest
+
+import utils.clan_competition_utils as ccu
+
+# -----------------------------------------------------------------------
+
+
+def compete_all_pairs(regions):
+    """
+    Reference implementation comparing every pair of regions
+    """
+
+    non_sig_regs = []
+
+    for index1 in range(0, len(regions)):
+        for index2 in range(index1 + 1, len(regions)):
+            reg1 = regions[index1]
+            reg2 = regions[index2]
+            (s1, e1, s2, e2) = (int(reg1[ccu.START]), int(reg1[ccu.END]),
+                                int(reg2[ccu.START]), int(reg2[ccu.END]))
+
+            if ccu.get_strand(s1, e1) != ccu.get_strand(s2, e2):
+                continue
+
+            overlap = ccu.calc_seq_overlap(s1, e1, s2, e2)
+            if overlap is None or overlap < ccu.OVERLAP:
+                continue
+
+            if float(reg1[ccu.EVAL]) != float(reg2[ccu.EVAL]):
+                loser = reg2 if float(reg1[ccu.EVAL]) < float(reg2[ccu.EVAL]) else reg1
+            else:
+                loser = reg2 if float(reg1[ccu.BIT_SCORE]) >= float(reg2[ccu.BIT_SCORE]) else reg1
+
+            non_sig_reg = (loser[ccu.RFAM_ACC], loser[ccu.SEQ_ACC], loser[ccu.START])
+            if non_sig_reg not in non_sig_regs:
+                non_sig_regs.append(non_sig_reg)
+
+    return non_sig_regs
+
+# -----------------------------------------------------------------------
+
+
+class TestClanCompetitionUtilsFunctions(unittest.TestCase):
+
+    def test_compete_seq_regions(self):
+
+        regions = [["RF00001", "chr1", "100", "200", "50.0", "1e-10", '', '', '0'],
+                   ["RF00002", "chr1", "120", "210", "40.0", "1e-08", '', '', '0'],
+                   ["RF00003", "chr1", "210", "120", "60.0", "1e-12", '', '', '0'],
+                   ["RF00004", "chr1", "300", "400", "60.0", "1e-12", '', '', '0']]
+
+        # regions on different strands or far apart do not compete
+        self.assertEqual(ccu.compete_seq_regions(regions, logging),
+                         [("RF00002", "chr1", "120")])
+
+        # bit scores break e-value ties
+        regions[1][ccu.EVAL] = "1e-10"
+        self.assertEqual(ccu.compete_seq_regions(regions, logging),
+                         [("RF00002", "chr1", "120")])
+
+        regions[1][ccu.BIT_SCORE] = "55.0"
+        self.assertEqual(ccu.compete_seq_regions(regions, logging),
+                         [("RF00001", "chr1", "100")])
+
+    # -----------------------------------------------------------------------
+
+    def test_compete_seq_regions_all_pairs(self):
+
+        random.seed(0)
+
+        for _ in range(200):
+            regions = []
+            for _ in range(random.randint(0, 30)):
+                start = random.randint(1, 500)
+                end = start + random.choice([-1, 1]) * random.randint(1, 80)
+                regions.append(["RF%05d" % random.randint(1, 5), "chr1", str(start), str(end),
+                                random.choice(["20.0", "30.0"]), random.choice(["1e-5", "1e-8"]),
+                                '', '', '0'])
+
+            self.assertEqual(ccu.compete_seq_regions(regions, logging),
+                             compete_all_pairs(regions))
+
+    # -----------------------------------------------------------------------
+
+    def test_compete_clan_regions(self):
+
+        # database rows, ordered by sequence accession
+        regions = [("RF00001", "chr1", 100, 200, 50.0, "1e-10", 1, 100, '0', "full", 1),
+                   ("RF00002", "chr1", 120, 210, 40.0, "1e-08", 1, 90, '0', "full", 1),
+                   ("RF00002", "chr2", 120, 210, 40.0, "1e-08", 1, 90, '0', "full", 1),
+                   ("RF00001", "chr3", 500, 400, 50.0, "1e-10", 1, 100, '0', "full", 1),
+                   ("RF00002", "chr3", 490, 400, 60.0, "1e-10", 1, 90, '0', "full", 1)]
+
+        self.assertEqual(list(ccu.compete_clan_regions(iter(regions), logging)),
+                         [("RF00002", "chr1", "120"), ("RF00001", "chr3", "500")])
+
+    # -----------------------------------------------------------------------
+
+    def test_significance_changes(self):
+
+        regions = [("RF00001", "chr1", 100, 200, 50.0, "1e-10", 1, 100, '0', "full", 0),
+                   ("RF00002", "chr1", 120, 210, 40.0, "1e-08", 1, 90, '0', "full", 1),
+                   ("RF00003", "chr1", 400, 500, 40.0, "1e-08", 1, 90, '0', "full", 1),
+                   ("RF00001", "chr2", 100, 200, 50.0, "1e-10", 1, 100, '0', "full", 0)]
+
+        # only regions whose is_significant value changes are returned
+        self.assertEqual(ccu.significance_changes(iter(regions), logging),
+                         ([("RF00002", "chr1", "120")],
+                          [("RF00001", "chr1", "100"), ("RF00001", "chr2", "100")]))
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
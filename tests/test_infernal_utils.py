@@ -0,0 +1,298 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import utils.infernal_utils as iu
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# -----------------------------------------------------------------------
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+HG19_TBLOUT = os.path.join(DATA_DIR, "hg19.tblout")
+
+HIT_TEMPLATE = """>> chr%(num)d  Homo sapiens chromosome %(num)d
+ rank     E-value  score  bias mdl mdl from   mdl to       seq from      seq to       acc trunc   gc
+ ----   --------- ------ ----- --- -------- --------    --------- ---------      ---- ----- ----
+  (%(num)d) !   %(num)de-20  %(num)d.5   0.0  cm        1       10 [] %(start)d %(end)d %(strand)s ..   0.99    no 0.45
+
+                         :<<---->>: CS
+         %(rna_type)s   1 AAGGGCCCUU 10
+                         AAGGGCCCUU
+         chr%(num)d %(start)d AAGGGCCCUU %(end)d
+                       ********** PP
+
+"""
+
+# -----------------------------------------------------------------------
+
+
+def write_infernal_output(inf_output_file, num_queries, num_hits):
+    """
+    Writes a synthetic Infernal detailed output file with num_hits hits for
+    each of num_queries queries
+    """
+
+    fp = open(inf_output_file, 'w')
+    fp.write("# cmsearch :: search CM(s) against a sequence database\n")
+
+    for query in range(1, num_queries + 1):
+        rna_type = "RNA%d" % query
+        fp.write("Query:       %s  [CLEN=10]\n" % rna_type)
+        fp.write("Accession:   RF%05d\n" % query)
+        fp.write("Hit alignments:\n")
+
+        for num in range(1, num_hits + 1):
+            start = num * 100
+            strand = '+'
+            end = start + 9
+            if num % 2 == 0:
+                strand = '-'
+                start, end = end, start
+
+            fp.write(HIT_TEMPLATE % {"num": num, "start": start, "end": end,
+                                     "strand": strand, "rna_type": rna_type})
+
+        fp.write("Internal CM pipeline statistics summary:\n//\n")
+
+    fp.write("[ok]\n")
+    fp.close()
+
+# -----------------------------------------------------------------------
+
+
+class TestInfernalUtilsFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.dest_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dest_dir)
+
+    # -----------------------------------------------------------------------
+
+    def test_tblout_hits(self):
+
+        hits = list(iu.tblout_hits(HG19_TBLOUT))
+
+        # every non comment line in the file is a hit
+        fp = open(HG19_TBLOUT, 'r')
+        num_hits = len([x for x in fp if x[0] != '#'])
+        fp.close()
+
+        self.assertEqual(len(hits), num_hits)
+
+        hit = hits[0]
+        self.assertEqual(hit.target_name, "chr1")
+        self.assertEqual(hit.query_acc, "RF00001")
+        self.assertEqual(hit.seq_from, "228746133")
+        self.assertEqual(hit.seq_to, "228746015")
+        self.assertEqual(hit.strand, '-')
+        self.assertEqual(hit.evalue, "6.6e-24")
+        self.assertEqual(hit.description, '-')
+
+    # -----------------------------------------------------------------------
+
+    def test_format_truncated(self):
+
+        self.assertEqual(iu.format_truncated("no"), '0')
+        self.assertEqual(iu.format_truncated('-'), '0')
+        self.assertEqual(iu.format_truncated("5'"), '5')
+        self.assertEqual(iu.format_truncated("5'&3'"), "53")
+
+    # -----------------------------------------------------------------------
+
+    def test_tblout_to_full_region(self):
+
+        iu.tblout_to_full_region(HG19_TBLOUT, dest_dir=self.dest_dir)
+
+        fp = open(os.path.join(self.dest_dir, "hg19.txt"), 'r')
+        first_line = fp.readline()
+        fp.close()
+
+        self.assertEqual(first_line, '\t'.join(("RF00001", "chr1", "228746133",
+                                                "228746015", "118.9", "6.6e-24",
+                                                '1', "119", '0', "full", '1')) + '\n')
+
+    # -----------------------------------------------------------------------
+
+    def test_infernal_hits(self):
+
+        inf_output_file = os.path.join(self.dest_dir, "synthetic.inf")
+        write_infernal_output(inf_output_file, 3, 50)
+
+        scores = list(iu.infernal_hits(inf_output_file, ss_notation="dbn"))
+
+        self.assertEqual(len(scores), 150)
+        self.assertEqual(scores[0]["rfam_acc"], "RF00001")
+        self.assertEqual(scores[0]["rfamseq_acc"], "chr1")
+        self.assertEqual(scores[0]["start"], "100")
+        self.assertEqual(scores[0]["rna_type"], "RNA1")
+        self.assertEqual(scores[0]["sec_struct"], ".((....)).")
+        self.assertEqual(scores[-1]["rfam_acc"], "RF00003")
+        self.assertEqual(scores[-1]["strand"], '-')
+
+        # the process pool must return the same hits in the same order
+        parallel_scores = list(iu.infernal_hits(inf_output_file, ss_notation="dbn",
+                                                processes=2, chunk_size=1024))
+
+        self.assertEqual(scores, parallel_scores)
+
+    # -----------------------------------------------------------------------
+
+    def test_infernal_hits_multibyte(self):
+
+        inf_output_file = os.path.join(self.dest_dir, "synthetic.inf")
+        write_infernal_output(inf_output_file, 3, 50)
+
+        # byte ranges must be read by length in bytes, not characters
+        fp = open(inf_output_file, 'rb')
+        content = fp.read().replace(b"Homo sapiens", b"Homo sapi\xc3\xa9ns")
+        fp.close()
+
+        fp = open(inf_output_file, 'wb')
+        fp.write(content)
+        fp.close()
+
+        scores = list(iu.infernal_hits(inf_output_file))
+        parallel_scores = list(iu.infernal_hits(inf_output_file, processes=2, chunk_size=1024))
+
+        self.assertEqual(len(scores), 150)
+        self.assertEqual(scores, parallel_scores)
+
+    # -----------------------------------------------------------------------
+
+    def test_split_infernal_output(self):
+
+        inf_output_file = os.path.join(self.dest_dir, "synthetic.inf")
+        write_infernal_output(inf_output_file, 2, 20)
+
+        chunks = iu.split_infernal_output(inf_output_file, 8)
+
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(inf_output_file))
+
+        fp = open(inf_output_file, 'r')
+        for (start, end, acc_offset) in chunks[1:]:
+            fp.seek(start)
+            self.assertTrue(fp.readline()[0:2] in (">>", "Qu"))
+        fp.close()
+
+    # -----------------------------------------------------------------------
+
+    def test_infernal_to_formats(self):
+
+        inf_output_file = os.path.join(self.dest_dir, "synthetic.inf")
+        write_infernal_output(inf_output_file, 2, 10)
+
+        iu.generate_bed_detail_file_with_ss(inf_output_file, self.dest_dir)
+        iu.infernal_to_full_region(inf_output_file, self.dest_dir, filename="single")
+
+        output_files = iu.infernal_to_formats(inf_output_file, ["bed.gz", "full_region"],
+                                              dest_dir=self.dest_dir, filename="multi",
+                                              input_format="out")
+
+        self.assertEqual(output_files, [os.path.join(self.dest_dir, "multi.bed.gz"),
+                                        os.path.join(self.dest_dir, "multi.txt")])
+
+        # a single pass must generate the same files as separate conversions
+        fp = open(os.path.join(self.dest_dir, "synthetic.bed"), 'r')
+        fp_gz = gzip.open(output_files[0], 'rt')
+        self.assertEqual(fp.read(), fp_gz.read())
+        fp.close()
+        fp_gz.close()
+
+        fp = open(os.path.join(self.dest_dir, "single.txt"), 'r')
+        fp_multi = open(output_files[1], 'r')
+        self.assertEqual(fp.read(), fp_multi.read())
+        fp.close()
+        fp_multi.close()
+
+        self.assertRaises(ValueError, iu.infernal_to_formats, inf_output_file, ["sam"],
+                          dest_dir=self.dest_dir)
+
+    # -----------------------------------------------------------------------
+
+    def test_compressed_io(self):
+
+        tblout_gz = os.path.join(self.dest_dir, "hg19.tblout.gz")
+        fp_in = open(HG19_TBLOUT, 'r')
+        fp_gz = gzip.open(tblout_gz, 'wt')
+        fp_gz.write(fp_in.read())
+        fp_gz.close()
+        fp_in.close()
+
+        self.assertEqual(iu.cio.file_compression(HG19_TBLOUT), None)
+        self.assertEqual(iu.cio.file_compression(tblout_gz), iu.cio.GZIP)
+
+        # gzipped input is detected from the file header
+        self.assertEqual(list(iu.tblout_hits(tblout_gz)), list(iu.tblout_hits(HG19_TBLOUT)))
+
+        iu.tblout_to_full_region(HG19_TBLOUT, dest_dir=self.dest_dir)
+        output_files = iu.infernal_to_formats(tblout_gz, ["full_region"], dest_dir=self.dest_dir,
+                                              filename="compressed", compression=iu.cio.GZIP,
+                                              compresslevel=1)
+
+        self.assertEqual(output_files, [os.path.join(self.dest_dir, "compressed.txt.gz")])
+
+        fp = open(os.path.join(self.dest_dir, "hg19.txt"), 'r')
+        fp_gz = gzip.open(output_files[0], 'rt')
+        self.assertEqual(fp.read(), fp_gz.read())
+        fp.close()
+        fp_gz.close()
+
+    # -----------------------------------------------------------------------
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_load_tblout(self):
+
+        tblout_file = os.path.join(self.dest_dir, "hg19.tblout")
+        shutil.copy(HG19_TBLOUT, tblout_file)
+
+        hits = iu.load_tblout(tblout_file)
+        tblout_hits = list(iu.tblout_hits(tblout_file))
+
+        self.assertTrue(os.path.exists(tblout_file + ".cache.npy"))
+        self.assertEqual(len(hits), len(tblout_hits))
+        self.assertEqual(hits["seq_from"][0], int(tblout_hits[0].seq_from))
+        self.assertEqual(hits["query_acc"][0], b"RF00001")
+        self.assertEqual(hits["evalue"][-1].decode(), tblout_hits[-1].evalue)
+
+        # the cache is rebuilt once the tblout file changes
+        fp = open(tblout_file, 'a')
+        fp.write(' '.join(tblout_hits[0]) + '\n')
+        fp.close()
+
+        self.assertEqual(len(iu.load_tblout(tblout_file)), len(tblout_hits) + 1)
+
+    # -----------------------------------------------------------------------
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_tblout_cache_conversion(self):
+
+        tblout_file = os.path.join(self.dest_dir, "cached.tblout")
+        shutil.copy(HG19_TBLOUT, tblout_file)
+
+        iu.tblout_to_full_region(HG19_TBLOUT, dest_dir=self.dest_dir)
+        iu.tblout_to_full_region(tblout_file, dest_dir=self.dest_dir, cache=True)
+        self.assertTrue(os.path.exists(tblout_file + ".cache.npy"))
+
+        # hits read from the cache are the ones parsed from the text
+        self.assertEqual(list(iu.tblout_hits(tblout_file)),
+                         list(iu.tblout_hits(tblout_file, use_cache=False)))
+
+        fp = open(os.path.join(self.dest_dir, "hg19.txt"), 'r')
+        fp_cached = open(os.path.join(self.dest_dir, "cached.txt"), 'r')
+        self.assertEqual(fp_cached.read(), fp.read())
+        fp.close()
+        fp_cached.close()
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
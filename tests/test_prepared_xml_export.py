@@ -0,0 +1,90 @@
+import datetime
+import io
+import os
+import unittest
+import xml.etree.ElementTree as ET
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rfam_schemas.rfam_schemas.settings")
+
+from config import rfam_search as rs
+from scripts.export import rfam_xml_dumper as xml_dumper
+from utils import RfamDB
+from utils.xml_dump_writer import XmlDumpWriter
+
+# -----------------------------------------------------------------------
+
+
+class FakePreparedCursor(object):
+    """
+    A prepared cursor returning rows as mysql.connector's binary protocol does,
+    with string columns as bytearrays
+    """
+
+    def __init__(self, column_names, rows):
+        self.column_names = column_names
+        self.rows = rows
+
+    def execute(self, query, params):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection(object):
+    python_charset = "utf8"
+
+# -----------------------------------------------------------------------
+
+
+class TestPreparedXmlExport(unittest.TestCase):
+
+    def setUp(self):
+
+        created = datetime.datetime(2019, 1, 1)
+        cursors = {
+            rs.CLAN_FIELDS: FakePreparedCursor(
+                ("id", "name", "description", "created", "updated", "author", "num_families"),
+                [(bytearray(b"CL00001"), bytearray(b"tRNA"), bytearray(b"tRNA clan & co"),
+                  created, created, bytearray(b"Gardner PP; Daub J"), 2)]),
+            rs.CLAN_FAMS: FakePreparedCursor(
+                ("rfam_acc",), [(bytearray(b"RF00005"),), (bytearray(b"RF00023"),)])}
+
+        self.prepared_cursor = RfamDB._prepared_cursor
+        RfamDB._prepared_cursor = lambda query: (FakeConnection(), cursors[query])
+
+    def tearDown(self):
+
+        RfamDB._prepared_cursor = self.prepared_cursor
+
+    # -----------------------------------------------------------------------
+
+    def test_fetch_prepared_decodes_text(self):
+
+        fields = RfamDB.fetch_prepared(rs.CLAN_FIELDS, ("CL00001",), dictionary=True)[0]
+
+        self.assertEqual(fields["name"], u"tRNA")
+        self.assertFalse(isinstance(fields["author"], bytearray))
+        self.assertEqual(fields["num_families"], 2)
+
+    # -----------------------------------------------------------------------
+
+    def test_clan_export(self):
+
+        fp_out = io.BytesIO()
+        writer = XmlDumpWriter(fp_out)
+
+        entries = ET.Element("entries")
+        xml_dumper.clan_xml_builder(entries, clan_acc="CL00001")
+        self.assertEqual(writer.write_children(entries), 1)
+
+        xml = fp_out.getvalue()
+        self.assertIn(b"<name>tRNA</name>", xml)
+        self.assertIn(b"<description>tRNA clan &amp; co</description>", xml)
+        self.assertIn(b"<field name=\"author\">Daub J</field>", xml)
+        self.assertIn(b"dbkey=\"RF00023\"", xml)
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import utils.query_profiler as qp
+
+# -----------------------------------------------------------------------
+
+
+class FakeCursor(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = -1
+
+    def execute(self, operation, params=None):
+        self.remaining = list(self.rows)
+
+    def fetchone(self):
+        return self.remaining.pop(0) if self.remaining else None
+
+    def fetchall(self):
+        rows, self.remaining = self.remaining, []
+        return rows
+
+    def close(self):
+        pass
+
+
+def profiled_query(acc):
+
+    cursor = qp.ProfiledCursor(FakeCursor([(1,)]), qp.get_profile())
+    cursor.execute("select x from family where rfam_acc='%s'" % acc)
+    cursor.fetchall()
+    cursor.close()
+
+    return os.getpid()
+
+# -----------------------------------------------------------------------
+
+
+class TestQueryProfiler(unittest.TestCase):
+
+    def test_normalise_sql(self):
+
+        self.assertEqual(qp.normalise_sql("select  count(*) from full_region\nwhere rfam_acc='RF00001' "
+                                          "and seq_start=120"),
+                         "select count(*) from full_region where rfam_acc=? and seq_start=?")
+        self.assertEqual(qp.normalise_sql("select * from genseq where upid in (%s,%s, %s)"),
+                         "select * from genseq where upid in (...)")
+        self.assertEqual(qp.normalise_sql("select * from family where rfam_acc=%s"),
+                         qp.normalise_sql("select * from family where rfam_acc='RF00005'"))
+
+    # -----------------------------------------------------------------------
+
+    def test_profiled_cursor(self):
+
+        profile = qp.QueryProfile()
+        cursor = qp.ProfiledCursor(FakeCursor([(1,), (2,), (3,)]), profile)
+
+        for acc in ("RF00001", "RF00002"):
+            cursor.execute("select x from family where rfam_acc='%s'" % acc)
+            self.assertEqual(len(cursor.fetchall()), 3)
+
+        cursor.execute("select x from family")
+        self.assertEqual([x for x in cursor], [(1,), (2,), (3,)])
+        cursor.close()
+
+        summary = dict([(x["statement"], x) for x in profile.summary()])
+
+        self.assertEqual(summary["select x from family where rfam_acc=?"]["calls"], 2)
+        self.assertEqual(summary["select x from family where rfam_acc=?"]["rows"], 6)
+        self.assertEqual(summary["select x from family"]["rows"], 3)
+
+    # -----------------------------------------------------------------------
+
+    def test_pool_worker_summaries(self):
+
+        dest_dir = tempfile.mkdtemp()
+        json_file = os.path.join(dest_dir, "profile.json")
+
+        profile = qp.enable(json_file=json_file)
+
+        try:
+            cursor = qp.ProfiledCursor(FakeCursor([(1,)]), profile)
+            for _ in range(5):
+                cursor.execute("select parent")
+                cursor.fetchall()
+            cursor.close()
+
+            pool = multiprocessing.Pool(2)
+            pids = set(pool.map(profiled_query, ["RF%05d" % x for x in range(20)]))
+            pool.close()
+            pool.join()
+
+            for pid in pids:
+                fp = open("%s.%d" % (json_file, pid), 'r')
+                statements = [x["statement"] for x in json.load(fp)]
+                fp.close()
+
+                # workers don't repeat the queries of the parent
+                self.assertEqual(statements, ["select x from family where rfam_acc=?"])
+
+            self.assertEqual(qp.get_profile().statements["select parent"]["calls"], 5)
+
+        finally:
+            qp._profile = None
+            shutil.rmtree(dest_dir)
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
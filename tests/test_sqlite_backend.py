@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import utils.sqlite_backend as sb
+
+# -----------------------------------------------------------------------
+
+
+class TestSQLiteBackend(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, "rfam_live.sqlite")
+        sb.create_database(self.db_file)
+
+        self.cnx = sb.connect(self.db_file)
+        cursor = self.cnx.cursor()
+        cursor.executemany("INSERT INTO genseq (rfamseq_acc, upid, chromosome_name, "
+                           "chromosome_type, version) VALUES (%s, %s, '1', 'chromosome', '14.0')",
+                           [("A.1", "UP1"), ("B.1", "UP1"), ("C.1", "UP2")])
+        cursor.executemany("INSERT INTO full_region (rfam_acc, rfamseq_acc, seq_start, seq_end, "
+                           "bit_score, evalue_score, cm_start, cm_end, truncated, type, "
+                           "is_significant) VALUES (%s, %s, %s, 100, 50.0, '1e-10', 1, 100, '0', "
+                           "'full', 1)",
+                           [("RF00001", "A.1", 1), ("RF00002", "A.1", 200), ("RF00001", "B.1", 1)])
+        cursor.close()
+        self.cnx.commit()
+
+    def tearDown(self):
+
+        self.cnx.close()
+        shutil.rmtree(self.tmp_dir)
+
+    # -----------------------------------------------------------------------
+
+    def test_schema(self):
+
+        cursor = self.cnx.cursor(buffered=True)
+        cursor.execute("SELECT * FROM genome")
+
+        self.assertIn("upid", cursor.column_names)
+        self.assertIn("ncbi_id", cursor.column_names)  # foreign key column
+        self.assertEqual(cursor.rowcount, 0)
+
+    # -----------------------------------------------------------------------
+
+    def test_update_left_join(self):
+
+        cursor = self.cnx.cursor(dictionary=True)
+        cursor.execute("update genseq g\n"
+                       "left join (select rfamseq_acc, count(*) as num_hits from full_region\n"
+                       "where is_significant=1 group by rfamseq_acc) c\n"
+                       "on c.rfamseq_acc=g.rfamseq_acc\n"
+                       "set g.chromosome_name=coalesce(c.num_hits, 0)\n"
+                       "where g.upid in (%s, %s)", ("UP1", "UP2"))
+        self.assertEqual(cursor.rowcount, 3)
+
+        cursor.execute("SELECT rfamseq_acc, chromosome_name FROM genseq ORDER BY rfamseq_acc")
+        self.assertEqual([(x["rfamseq_acc"], x["chromosome_name"]) for x in cursor.fetchall()],
+                         [("A.1", "2"), ("B.1", "1"), ("C.1", "0")])
+
+    # -----------------------------------------------------------------------
+
+    def test_update_join(self):
+
+        cursor = self.cnx.cursor()
+        cursor.execute("CREATE TEMPORARY TABLE tmp_keys SELECT rfam_acc, rfamseq_acc "
+                       "FROM full_region LIMIT 0")
+        cursor.execute("INSERT INTO tmp_keys VALUES (%s, %s)", ("RF00001", "A.1"))
+        cursor.execute("UPDATE full_region t JOIN tmp_keys k ON t.rfam_acc=k.rfam_acc AND "
+                       "t.rfamseq_acc=k.rfamseq_acc SET t.is_significant=0")
+        self.assertEqual(cursor.rowcount, 1)
+        cursor.execute("DROP TEMPORARY TABLE tmp_keys")
+
+        cursor.execute("SELECT count(*) FROM full_region WHERE is_significant=1")
+        self.assertEqual(cursor.fetchone(), (2,))
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
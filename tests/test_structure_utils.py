@@ -0,0 +1,40 @@
+import unittest
+
+import utils.structure_utils as su
+
+# -----------------------------------------------------------------------
+
+
+class TestStructureUtilsFunctions(unittest.TestCase):
+
+    def test_wuss_to_dbn(self):
+
+        wuss = ":::[[[_(((,,<<<____>>>-{{{~~}}}.)))]]]::AA::aa"
+
+        self.assertEqual(su.wuss_to_dbn(wuss), "...(((.(((..(((....))).(((..))).))))))..AA..aa")
+
+    # -----------------------------------------------------------------------
+
+    def test_batch_wuss_to_dbn(self):
+
+        wuss_strings = ["<<<___>>>", "", "::((--))::"]
+
+        self.assertEqual(su.batch_wuss_to_dbn(wuss_strings), [su.wuss_to_dbn(x) for x in wuss_strings])
+        self.assertEqual(su.batch_wuss_to_dbn([]), [])
+
+    # -----------------------------------------------------------------------
+
+    def test_pair_table(self):
+
+        pairs = su.pair_table("<[.>]Aa")
+
+        self.assertEqual(pairs, [3, 4, su.UNPAIRED, 0, 1, 6, 5])
+        self.assertEqual(su.dbn_from_pair_table(su.pair_table("::<<__>>::")), "..((..))..")
+
+        self.assertRaises(ValueError, su.pair_table, "((.)")
+        self.assertRaises(ValueError, su.pair_table, "(.))")
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import io
+import unittest
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from utils.xml_dump_writer import XmlDumpWriter
+
+# -----------------------------------------------------------------------
+
+
+def build_entries():
+
+    entries = ET.Element("entries")
+
+    entry = ET.SubElement(entries, "entry", id="AB000001.1_10_120")
+    ET.SubElement(entry, "name").text = "AB000001.1/10:120"
+    ET.SubElement(entry, "description").text = "Escherichia coli <5S> \"rRNA\" & tRNA's"
+    dates = ET.SubElement(entry, "dates")
+    ET.SubElement(dates, "date", value="01 Jan 2019", type="created")
+    ET.SubElement(dates, "date", value="a & b < \"c\"\nd", type="updated")
+    ET.SubElement(dates, "date", value="first\r\nsecond\rthird\tfourth", type="modified")
+    fields = ET.SubElement(entry, "additional_fields")
+    ET.SubElement(fields, "field", name="empty").text = ""
+    ET.SubElement(fields, "field", name="spaces").text = "  "
+    ET.SubElement(fields, "field", name="lines").text = "first\r\nsecond"
+
+    mixed = ET.SubElement(entries, "entry", id="mixed")
+    mixed.text = "text"
+    ET.SubElement(mixed, "name").tail = "tail"
+
+    ET.SubElement(entries, "entry", id="empty")
+
+    return entries
+
+# -----------------------------------------------------------------------
+
+
+class TestXmlDumpWriter(unittest.TestCase):
+
+    def minidom_dump(self, pretty):
+
+        db_xml = ET.Element("database")
+        ET.SubElement(db_xml, "name").text = "Rfam"
+        db_xml.append(build_entries())
+        ET.SubElement(db_xml, "entry_count").text = "3"
+
+        document = minidom.parseString(ET.tostring(db_xml, "utf-8"))
+        if pretty is True:
+            return document.toprettyxml(indent='\t').encode("utf-8")
+
+        return document.toxml().encode("utf-8")
+
+    def streamed_dump(self, pretty):
+
+        fp_out = io.BytesIO()
+        writer = XmlDumpWriter(fp_out, pretty=pretty)
+
+        writer.write_declaration()
+        writer.start("database")
+        writer.text_element("name", "Rfam")
+        writer.start("entries")
+
+        # written one entry at a time
+        entries = ET.Element("entries")
+        count = 0
+        for entry in build_entries():
+            entries.append(entry)
+            count += writer.write_children(entries)
+            self.assertEqual(len(entries), 0)
+
+        writer.end("entries")
+        writer.text_element("entry_count", str(count))
+        writer.end("database")
+
+        return fp_out.getvalue()
+
+    # -----------------------------------------------------------------------
+
+    def test_pretty(self):
+
+        self.assertEqual(self.streamed_dump(True), self.minidom_dump(True))
+
+    # -----------------------------------------------------------------------
+
+    def test_compact(self):
+
+        self.assertEqual(self.streamed_dump(False), self.minidom_dump(False))
+
+    # -----------------------------------------------------------------------
+
+    def test_unbalanced_end(self):
+
+        writer = XmlDumpWriter(io.BytesIO())
+        writer.start("database")
+
+        self.assertRaises(ValueError, writer.end, "entries")
+
+# -----------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
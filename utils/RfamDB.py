@@ -11,50 +11,179 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+"""
+Description: Database connections. Connections are taken from a pool per
+             database and process and are returned to it on disconnect, so
+             that scripts running many short queries don't pay for a new
+             connection every time. The database can be selected at runtime
+             among those in rfam_config, with select_database or the RFAM_DB
+             environment variable.
+
+Usage:  with RfamDB.session() as cursor:
+            cursor.execute(query)
+
+        or cnx = RfamDB.connect() ... RfamDB.disconnect(cnx)
 
- #Todo Need to generalize this to make the scripts independent and enable
-    # connecting to multiple databases simultaneously. Convert this to a class
+        Query profiling is enabled with the RFAM_DB_PROFILE environment
+        variable or enable_profiling (see query_profiler)
+
+        Large results can be streamed row by row with:
+        for row in RfamDB.stream(query, params):
+            ...
+
+        Queries run repeatedly with different values can use server-side
+        prepared statements, which are prepared once per process:
+        rows = RfamDB.fetch_prepared(query, params)
+
+        For offline runs and benchmarks, connections can be made to an SQLite
+        database instead with use_sqlite or the RFAM_DB_SQLITE environment
+        variable (see sqlite_backend)
+"""
 
 # ---------------------------------IMPORTS-------------------------------------
 
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import errorcode
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+
+from config import rfam_config
+from utils import query_profiler
+from utils import sqlite_backend
+
+# -----------------------------------------------------------------------------
+
+# databases that can be selected, as named in rfam_config
+DATABASES = ("RFAMLIVE", "RFAMLIVELOC", "RFAMLIVEPUB", "RFAMLOCAL", "RFAMREL")
+
+POOL_SIZE = 5  # connections kept open per database and process
+FETCH_SIZE = 1000  # rows fetched from the server at a time by streaming queries
+PREPARED_CACHE_SIZE = 100  # prepared statements kept open per database and process
+
+db_name = os.environ.get("RFAM_DB", "RFAMLIVE")
+db_conf = getattr(rfam_config, db_name)
+
+# an SQLite database used instead of MySQL, if set
+sqlite_path = os.environ.get("RFAM_DB_SQLITE") or None
+
+# connection pools by (database name, process id)
+_pools = {}
+
+# connections of prepared statements and their statements by (database, process id)
+_prepared = {}
+
+query_profiler.enable_from_environment()
+
+# -----------------------------------------------------------------------------
+
 
-# Todo - NEED TO CLEAN THIS UP
-# NEED TO CLEAN THIS UP AND PROFIDE A WAY
-#from config.rfam_config import RFAMLIVEPUB  # rfam_live on public host
-#from config.rfam_config import RFAMLIVE  # rfam_live on curation host
-from config.rfam_config import RFAMLIVELOC  # local instance of rfam_live
+def select_database(name):
+    """
+    Selects the database new connections are made to
+
+    name: The name of a database in rfam_config (e.g. RFAMLIVE, RFAMLIVELOC)
+
+    return: void
+    """
+
+    global db_name, db_conf
 
-#from config.rfam_config import XFAMDEV
-#from config.rfam_config import RFAMLOCAL
-from config.rfam_config import RFAMLIVE
-#from config.rfam_config import RFAMLIVEPUB
-#from config.rfam_config import RFAMREL
+    if name.upper() not in DATABASES:
+        raise ValueError("Unknown database %s. Choose one of %s" % (name, ', '.join(DATABASES)))
 
-# RfamLive
-from config.rfam_config import RFAMLIVE
+    db_name = name.upper()
+    db_conf = getattr(rfam_config, db_name)
 
 # -----------------------------------------------------------------------------
 
-# need to generalize this to enable DB setting upon implementation 
-db_conf = RFAMLIVE
+
+def use_sqlite(path):
+    """
+    Makes new connections to an SQLite database created with sqlite_backend
+    instead of MySQL, e.g. to run or benchmark database code offline
+
+    path: The path to the database file, or None to switch back to MySQL
+
+    return: void
+    """
+
+    global sqlite_path
+
+    sqlite_path = path
+
+# -----------------------------------------------------------------------------
+
+
+def _backend_key():
+    """
+    Returns a key identifying the database of new connections in this process
+    """
+
+    return (sqlite_path or db_name, os.getpid())
 
 # -----------------------------------------------------------------------------
 
 
-def connect():
+def _connection_args():
     """
-    Connects to a specific database and returns a mysql connection object
+    Returns the mysql.connector connection arguments of the selected database
     """
 
+    return {"user": db_conf["user"], "password": db_conf["pwd"], "host": db_conf["host"],
+            "database": db_conf["db"], "port": db_conf["port"]}
+
+# -----------------------------------------------------------------------------
+
+
+def _get_pool():
+    """
+    Returns the connection pool of the selected database, creating it on first
+    use. Pools are never shared with forked processes
+    """
+
+    key = (db_name, os.getpid())
+
+    if key not in _pools:
+        _pools[key] = pooling.MySQLConnectionPool(pool_name="%s_%d" % key,
+                                                  pool_size=POOL_SIZE,
+                                                  **_connection_args())
+
+    return _pools[key]
+
+# -----------------------------------------------------------------------------
+
+
+def connect(**connection_args):
+    """
+    Connects to a specific database and returns a mysql connection object.
+    Connections are taken from the pool of the selected database, or opened
+    directly if all pooled connections are in use
+
+    connection_args: Extra mysql.connector arguments (e.g.
+    allow_local_infile=True). Connections with extra arguments are never
+    pooled
+    """
+
+    if sqlite_path is not None:
+        return query_profiler.wrap(sqlite_backend.connect(sqlite_path, **connection_args))
+
     cnx = None
     try:
-        cnx = mysql.connector.connect(user=db_conf["user"],
-                                      password=db_conf["pwd"],
-                                      host=db_conf["host"],
-                                      database=db_conf["db"],
-                                      port=db_conf["port"])
+        if connection_args:
+            args = _connection_args()
+            args.update(connection_args)
+            cnx = mysql.connector.connect(**args)
+
+        else:
+            try:
+                cnx = _get_pool().get_connection()
+
+            except PoolError:
+                cnx = mysql.connector.connect(**_connection_args())
 
     except mysql.connector.Error as err:
 
@@ -67,14 +196,31 @@ def connect():
         else:
             print (err)
 
-    return cnx
+    return query_profiler.wrap(cnx)
+
+# -----------------------------------------------------------------------------
+
+
+def enable_profiling(json_file=None, slow_query_time=None):
+    """
+    Records the timing of all queries run on new connections and writes a
+    summary at exit. See query_profiler.enable
+
+    json_file: A path to write the summary to in JSON format. If None a table
+    is written to stderr
+    slow_query_time: Log queries taking at least this many seconds to stderr
+
+    return: A query_profiler.QueryProfile object
+    """
+
+    return query_profiler.enable(json_file=json_file, slow_query_time=slow_query_time)
 
 # -----------------------------------------------------------------------------
 
 
 def disconnect(cnx):
     """
-    Closes a database connection
+    Closes a database connection, returning pooled connections to their pool
 
     cnx: MySQL connection object
     """
@@ -86,3 +232,219 @@ def disconnect(cnx):
         print ("Error closing database connection")
 
 # -----------------------------------------------------------------------------
+
+
+@contextmanager
+def session(commit=False, **cursor_args):
+    """
+    Context manager providing a cursor on a pooled connection. The cursor is
+    closed and the connection returned to the pool on exit
+
+    commit: If True commit on exit, or roll back if an exception was raised
+    cursor_args: Arguments to pass to the cursor (e.g. buffered=True,
+    dictionary=True, raw=True)
+
+    Usage: with RfamDB.session(buffered=True) as cursor:
+               cursor.execute(query)
+    """
+
+    cnx = connect()
+    cursor = cnx.cursor(**cursor_args)
+
+    try:
+        yield cursor
+
+        if commit:
+            cnx.commit()
+
+    except:
+        if commit:
+            cnx.rollback()
+        raise
+
+    finally:
+        cursor.close()
+        disconnect(cnx)
+
+# -----------------------------------------------------------------------------
+
+
+def result_iterator(cursor, fetch_size=FETCH_SIZE):
+    """
+    An iterator over the results of an executed query that uses fetchmany to
+    keep memory usage down
+
+    cursor: A cursor a query has been executed on
+    fetch_size: The number of rows to fetch at a time
+    """
+
+    rows = cursor.fetchmany(fetch_size)
+    while rows:
+        for row in rows:
+            yield row
+
+        rows = cursor.fetchmany(fetch_size)
+
+# -----------------------------------------------------------------------------
+
+
+def stream(query, params=None, fetch_size=FETCH_SIZE, **cursor_args):
+    """
+    Runs a query on an unbuffered cursor and yields its rows as they are
+    fetched from the server, so that large results are never held in memory
+    in full. The connection is used by the stream until it is exhausted or
+    closed, and is released afterwards
+
+    query: The query to execute
+    params: Query parameters, if any
+    fetch_size: The number of rows to fetch from the server at a time
+    cursor_args: Arguments to pass to the cursor (e.g. raw=True). Rows are
+    tuples unless dictionary=True is passed
+
+    Usage: for row in RfamDB.stream(query, (clan_acc,)):
+               ...
+    """
+
+    cnx = connect()
+    cursor = cnx.cursor(buffered=False, **cursor_args)
+
+    try:
+        cursor.execute(query, params)
+
+        for row in result_iterator(cursor, fetch_size):
+            yield row
+
+    finally:
+        # discard any rows left if the stream was closed early
+        if cnx.unread_result:
+            cnx.consume_results()
+
+        cursor.close()
+        disconnect(cnx)
+
+# -----------------------------------------------------------------------------
+
+
+def _prepared_cursor(query):
+    """
+    Returns the prepared cursor of a query, preparing it on first use. Prepared
+    statements live on a dedicated connection per database and process, as
+    pooled connections are reset when returned to their pool, which discards
+    their prepared statements. The least recently used statements are closed
+    once PREPARED_CACHE_SIZE statements are open
+
+    query: An SQL statement with %s placeholders
+
+    return: A (connection, cursor) tuple
+    """
+
+    key = _backend_key()
+
+    if key not in _prepared:
+        # autocommit, so that reads on the long lived connection are never
+        # answered from a stale transaction snapshot
+        _prepared[key] = (connect(autocommit=True), OrderedDict())
+
+    (cnx, cursors) = _prepared[key]
+
+    if query in cursors:
+        cursor = cursors.pop(query)
+
+    else:
+        if len(cursors) >= PREPARED_CACHE_SIZE:
+            cursors.popitem(last=False)[1].close()
+
+        cursor = cnx.cursor(prepared=True)
+
+    cursors[query] = cursor
+
+    return cnx, cursor
+
+# -----------------------------------------------------------------------------
+
+
+def _execute_prepared(query, params):
+    """
+    Executes a prepared statement, reconnecting once if the connection of the
+    prepared statements was lost (e.g. after wait_timeout)
+
+    return: A (connection, cursor) tuple of the cursor the statement was
+    executed on
+    """
+
+    (cnx, cursor) = _prepared_cursor(query)
+
+    try:
+        cursor.execute(query, params)
+
+    except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+        if cnx.is_connected():
+            raise
+
+        # statements are prepared again on the new connection
+        del _prepared[_backend_key()]
+        (cnx, cursor) = _prepared_cursor(query)
+        cursor.execute(query, params)
+
+    return cnx, cursor
+
+# -----------------------------------------------------------------------------
+
+
+def _decode_row(row, charset):
+    """
+    Decodes the text values of a prepared statement row. Prepared cursors
+    return rows in the binary protocol, where string columns are bytearrays
+    rather than the unicode strings of other cursors
+
+    row: A row tuple
+    charset: The python name of the connection character set
+    """
+
+    return tuple([x.decode(charset) if isinstance(x, bytearray) else x for x in row])
+
+# -----------------------------------------------------------------------------
+
+
+def fetch_prepared(query, params=(), dictionary=False):
+    """
+    Runs a query as a server-side prepared statement and returns all of its
+    rows. The statement is prepared on first use and reused by later calls
+    with the same query
+
+    query: An SQL query with %s placeholders (unquoted)
+    params: A tuple of query parameters
+    dictionary: If True rows are returned as dictionaries keyed by column name
+
+    return: A list of rows
+    """
+
+    (cnx, cursor) = _execute_prepared(query, params)
+
+    # python_charset maps MySQL names such as utf8mb4 to python codecs
+    charset = getattr(cnx, "python_charset", "utf-8")
+    rows = [_decode_row(row, charset) for row in cursor.fetchall()]
+
+    if dictionary is True:
+        columns = cursor.column_names
+        rows = [dict(zip(columns, row)) for row in rows]
+
+    return rows
+
+# -----------------------------------------------------------------------------
+
+
+def execute_prepared(query, params=()):
+    """
+    Runs a statement that returns no rows (e.g. UPDATE) as a server-side
+    prepared statement. Statements are committed as they run
+
+    query: An SQL statement with %s placeholders (unquoted)
+    params: A tuple of statement parameters
+
+    return: The number of rows affected
+    """
+
+    return _execute_prepared(query, params)[1].rowcount
+
+# -----------------------------------------------------------------------------
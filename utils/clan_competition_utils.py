@@ -0,0 +1,360 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Clan competition engine. Competes the regions of clan families
+             on the same sequence and returns the ones that are not
+             significant. Has no database dependencies, see
+             scripts/processing/clan_competition.py for the database updates.
+"""
+
+# ---------------------------------IMPORTS-------------------------------------
+
+import heapq
+from itertools import groupby
+
+# -----------------------------------------------------------------------------
+
+RFAM_ACC = 0  # full region rfam_acc
+SEQ_ACC = 1  # full region rfamseq_acc
+START = 2  # full region seq_start
+END = 3  # full region seq_end
+BIT_SCORE = 4
+EVAL = 5  # full region evalue score
+TRUNC = 8  # full region truncated
+IS_SIGNIFICANT = 10  # full region is_significant
+
+OVERLAP = 0.5  # overlap cutoff
+COMP_OVL = 1.0  # complete overlap
+NO_OVL = 0.0    # no overlap
+
+# -----------------------------------------------------------------------------
+
+
+def get_strand(start, end):
+    """
+    Checks the start and end coordinates of a sequence and returns -1 if the
+    sequence comes from the 3' strand and 1 if it comes from the 5' strand
+
+    start: An integer indicating sequence start location
+    end: An integer indicating sequence end location
+    """
+
+    # -
+    if start > end:
+        return -1
+    # +
+    elif start <= end:
+        return 1
+
+    return 0
+
+# -----------------------------------------------------------------------------
+
+
+def calc_seq_overlap(s1, e1, s2, e2):
+    """
+    Calculate sequence overlaps
+
+    s1: SEQ1 start coordinate
+    e1: SEQ1 end coordinate
+    s2: SEQ2 start coordinate
+    e2: SEQ2 end coordinate
+    """
+
+    len1 = abs(e1 - s1)
+    len2 = abs(e2 - s2)
+
+    overlap = None
+
+    # get strand
+    strand = get_strand(s1, e1)
+
+    # full overlap
+    if s1 == s2 and len1 == len2:
+        return float(len1) / float(len2)
+
+    # check5'
+    elif strand == 1:
+        overlap = cal_overlap_pos_strand(s1, e1, s2, e2)
+
+    # check 3'
+    elif strand == -1:
+        overlap = cal_overlap_neg_strand(s1, e1, s2, e2)
+
+    # will return None in a case that we didn't capture
+    return overlap
+
+# -----------------------------------------------------------------------------
+
+
+def cal_overlap_pos_strand(s1, e1, s2, e2):
+    """
+    Calculates the region overlap between two regions on the 5' strand and
+    returns the degree of overlap
+
+    s1: Seq1 start coordinates
+    e1: Seq1 end coordinates
+    s2: Seq2 start coordinates
+    e2: Seq2 end coordinates
+    """
+
+    overlap = None
+
+    len1 = abs(e1 - s1)
+    len2 = abs(e2 - s2)
+
+    min_len = min(len1, len2)
+
+    # seq2 within seq1
+    if s1 < s2 and e2 < e1:
+        overlap = COMP_OVL
+
+    # partial overlap, seq1 before seq2
+    elif s1 <= s2 and s2 < e1 and e1 <= e2:
+        overlap = float(e1 - s2 + 1) / float(min_len)
+
+    # no overlap, seq1 before seq2
+    elif s1 < s2 and e1 <= s2:
+        overlap = NO_OVL
+
+    # seq1 within seq2 region
+    elif s2 < s1 and e1 < e2:
+        overlap = COMP_OVL
+
+    # no overlap, seq2 before seq1
+    elif s2 < s1 and e2 <= s1:
+        overlap = NO_OVL
+
+    # partial overlap, seq2 before seq1
+    elif s2 <= s1 and s1 < e2 and e2 <= e1:
+        overlap = float(e2 - s1 + 1) / float(min_len)
+
+    return overlap
+
+# -----------------------------------------------------------------------------
+
+
+def cal_overlap_neg_strand(s1, e1, s2, e2):
+    """
+    Calculates the region overlap between two regions on the 3' strand and
+    returns the degree of overlap
+
+    s1: Seq1 start coordinates
+    e1: Seq1 end coordinates
+    s2: Seq2 start coordinates
+    e2: Seq2 end coordinates
+
+    """
+
+    overlap = None
+
+    len1 = abs(e1 - s1)
+    len2 = abs(e2 - s2)
+
+    min_len = min(len1, len2)
+
+    # seq2 within seq1 region - this may match the partial overlap case
+    if s1 > s2 and e1 < e2:
+        overlap = COMP_OVL
+
+    # no overlap, seq1 before seq2
+    elif s1 > s2 and e1 >= s2:
+        overlap = NO_OVL
+
+    # partial overlap, seq1 before seq2
+    elif s1 >= s2 and s2 > e1 and e1 >= e2:
+        overlap = float(s2 - e1 + 1) / float(min_len)
+
+    # seq1 within seq2 region
+    elif s2 > s1 and e1 > e2:
+        overlap = COMP_OVL
+
+    # no overlap, seq2 before seq1
+    elif s2 > s1 and e2 >= s1:
+        overlap = NO_OVL
+
+    # partial overlap, seq2 before seq1
+    elif s2 >= s1 and s1 > e2 and e2 >= e1:
+        overlap = float(s1 - e2 + 1) / float(min_len)
+
+    return overlap
+
+# -----------------------------------------------------------------------------
+
+
+def overlapping_region_pairs(regions):
+    """
+    Finds all pairs of regions on the same strand whose coordinates intersect,
+    with a sweep over the regions of each strand sorted by their lowest
+    coordinate. Regions that do not intersect always have zero overlap, so these
+    are the only pairs that need to be competed.
+
+    regions: A list of regions as (start, end) integer tuples
+
+    return: A generator of (index1, index2) tuples with index1 < index2
+    """
+
+    strands = {}
+    for index, (start, end) in enumerate(regions):
+        strand = get_strand(start, end)
+        strands.setdefault(strand, []).append((min(start, end), max(start, end), index))
+
+    for strand in strands:
+        # heap of (highest coordinate, index) of the regions the sweep is in
+        active = []
+
+        for (low, high, index) in sorted(strands[strand]):
+            while len(active) > 0 and active[0][0] < low:
+                heapq.heappop(active)
+
+            for (active_high, active_index) in active:
+                yield (min(index, active_index), max(index, active_index))
+
+            heapq.heappush(active, (high, index))
+
+# -----------------------------------------------------------------------------
+
+
+def compete_seq_regions(regions, log):
+    """
+    Competes the regions of a sequence and returns the ones that are not
+    significant. Overlapping regions (>= OVERLAP) on the same strand are
+    competed by e-value and then bit score, with ties kept by the region
+    appearing first. Only intersecting regions are compared and the results
+    are the same, and in the same order, as comparing every pair of regions.
+
+    regions: A list of duplicate regions for seq_acc
+    log: log file pointer for tracking regions we haven't captured
+
+    return: A list of (rfam_acc, rfamseq_acc, seq_start) tuples
+    """
+
+    coords = [(int(region[START]), int(region[END])) for region in regions]
+
+    # the pair each non significant region lost in first, in input order
+    non_sig_regs = {}
+    missed_pairs = []
+
+    for (index1, index2) in overlapping_region_pairs(coords):
+        (s1, e1) = coords[index1]
+        (s2, e2) = coords[index2]
+
+        overlap = calc_seq_overlap(s1, e1, s2, e2)
+
+        if overlap is None:
+            missed_pairs.append((index1, index2))
+            continue
+
+        if overlap < OVERLAP:
+            continue
+
+        reg1 = regions[index1]
+        reg2 = regions[index2]
+
+        # at this point check the evalues and build the list for the non
+        # significant regions
+        if float(reg1[EVAL]) != float(reg2[EVAL]):
+            if float(reg1[EVAL]) < float(reg2[EVAL]):
+                loser = reg2
+            else:
+                loser = reg1
+
+        # check bit scores if e-values are equal
+        elif float(reg1[BIT_SCORE]) >= float(reg2[BIT_SCORE]):
+            loser = reg2
+        else:
+            loser = reg1
+
+        non_sig_reg = (loser[RFAM_ACC], loser[SEQ_ACC], loser[START])
+        if non_sig_reg not in non_sig_regs or (index1, index2) < non_sig_regs[non_sig_reg]:
+            non_sig_regs[non_sig_reg] = (index1, index2)
+
+    for (index1, index2) in sorted(missed_pairs):
+        log.debug("reg1: %s" % '\t'.join(regions[index1]))
+        log.debug("reg2: %s" % '\t'.join(regions[index2]))
+
+    return sorted(non_sig_regs, key=non_sig_regs.get)
+
+# -----------------------------------------------------------------------------
+
+
+def compete_clan_regions(regions, log):
+    """
+    Competes the regions of a clan, as they are read from a clan file or the
+    database, one sequence at a time. Only the regions of the current sequence
+    are kept in memory.
+
+    regions: An iterable of clan regions ordered by sequence accession. Fields
+    are converted to strings as in clan files
+    log: log file pointer for tracking regions we haven't captured
+
+    return: A generator of non significant (rfam_acc, rfamseq_acc, seq_start)
+    tuples
+    """
+
+    seq_regions = ([str(field) for field in region] for region in regions)
+
+    for seq_acc, group in groupby(seq_regions, key=lambda region: region[SEQ_ACC]):
+        group = list(group)
+
+        if len(group) > 1:
+            for non_sig_reg in compete_seq_regions(group, log):
+                yield non_sig_reg
+
+# -----------------------------------------------------------------------------
+
+
+def significance_changes(regions, log):
+    """
+    Recompetes the regions of a clan and compares the outcome with the current
+    is_significant values of the regions, so that only regions whose value
+    changes need to be updated. All clan regions of each sequence must be
+    provided.
+
+    regions: An iterable of full_region clan regions, including is_significant,
+    ordered by sequence accession
+    log: log file pointer for tracking regions we haven't captured
+
+    return: A tuple with two lists of (rfam_acc, rfamseq_acc, seq_start) tuples,
+    the regions to set to non significant and the regions to set to significant
+    """
+
+    to_zero = []
+    to_one = []
+
+    seq_regions = ([str(field) for field in region] for region in regions)
+
+    for seq_acc, group in groupby(seq_regions, key=lambda region: region[SEQ_ACC]):
+        group = list(group)
+
+        non_sig_regs = set()
+        if len(group) > 1:
+            non_sig_regs = set(compete_seq_regions(group, log))
+
+        for region in group:
+            reg = (region[RFAM_ACC], region[SEQ_ACC], region[START])
+            is_significant = region[IS_SIGNIFICANT] != '0'
+
+            if reg in non_sig_regs and is_significant:
+                to_zero.append(reg)
+            elif reg not in non_sig_regs and not is_significant:
+                to_one.append(reg)
+
+    return (to_zero, to_one)
+
+# -----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
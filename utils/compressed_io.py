@@ -0,0 +1,207 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Text file I/O with transparent gzip/bgzip support. Compressed
+             input is detected by its magic bytes rather than the file
+             extension. Multithreaded (de)compression is delegated to pigz or
+             bgzip when available, falling back to Python's gzip module.
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import gzip
+import shutil
+import subprocess
+
+try:
+    which = shutil.which
+except AttributeError:
+    from distutils.spawn import find_executable as which
+
+# --------------------------------------------------------------------------------------------------
+
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_FEXTRA = 0x04
+BGZF_SUBFIELD = b"BC"
+
+GZIP = "gzip"
+BGZIP = "bgzip"
+
+DEFAULT_COMPRESSLEVEL = 6
+
+# --------------------------------------------------------------------------------------------------
+
+
+def file_compression(path):
+    """
+    Detects the compression of a file from its header
+
+    path: The path to a file
+
+    return: BGZIP for BGZF files, GZIP for any other gzip file, or None for
+    uncompressed files
+    """
+
+    fp_in = open(path, 'rb')
+    header = fp_in.read(14)
+    fp_in.close()
+
+    if header[0:2] != GZIP_MAGIC:
+        return None
+
+    # BGZF blocks are gzip members with a BC extra subfield
+    if len(header) == 14 and ord(header[3:4]) & GZIP_FEXTRA and header[12:14] == BGZF_SUBFIELD:
+        return BGZIP
+
+    return GZIP
+
+# --------------------------------------------------------------------------------------------------
+
+
+def is_compressed(path):
+    """
+    Returns True if path is a gzip or bgzip compressed file, False otherwise
+    """
+
+    return file_compression(path) is not None
+
+# --------------------------------------------------------------------------------------------------
+
+
+def open_input(path, threads=1):
+    """
+    Opens a plain text, gzip or bgzip file for reading in text mode
+
+    path: The path to the input file
+    threads: The number of threads to decompress with. Values greater than 1
+    use pigz or bgzip if found in PATH
+
+    return: A file object
+    """
+
+    compression = file_compression(path)
+
+    if compression is None:
+        return open(path, 'r')
+
+    if threads is not None and threads > 1:
+        if compression == BGZIP and which("bgzip") is not None:
+            return PipeFile(["bgzip", "-dc", "-@", str(threads), path], 'r')
+
+        elif which("pigz") is not None:
+            return PipeFile(["pigz", "-dc", "-p", str(threads), path], 'r')
+
+    # bgzip files are valid multi-member gzip files
+    return gzip.open(path, 'rt')
+
+# --------------------------------------------------------------------------------------------------
+
+
+def open_output(path, compression=None, compresslevel=DEFAULT_COMPRESSLEVEL, threads=1):
+    """
+    Opens a file for writing in text mode, optionally compressing its contents
+
+    path: The path to the output file
+    compression: None for plain text, GZIP or BGZIP
+    compresslevel: The compression level, from 1 (fastest) to 9 (smallest)
+    threads: The number of threads to compress with. Values greater than 1 use
+    pigz for gzip output and bgzip for bgzip output
+
+    return: A file object
+    """
+
+    if compression is None:
+        return open(path, 'w')
+
+    if compression == BGZIP:
+        # BGZF can't be written with the gzip module
+        if which("bgzip") is None:
+            raise ValueError("bgzip compression requires bgzip in PATH")
+
+        return PipeFile(["bgzip", "-c", "-l", str(compresslevel), "-@", str(max(threads or 1, 1))],
+                        'w', path=path)
+
+    if compression != GZIP:
+        raise ValueError("Unknown compression: %s" % compression)
+
+    if threads is not None and threads > 1 and which("pigz") is not None:
+        return PipeFile(["pigz", "-c", "-%d" % compresslevel, "-p", str(threads)], 'w', path=path)
+
+    return gzip.open(path, 'wt', compresslevel=compresslevel)
+
+# --------------------------------------------------------------------------------------------------
+
+
+class PipeFile(object):
+    """
+    A text mode file object reading from or writing to an external
+    (de)compression process
+    """
+
+    def __init__(self, command, mode, path=None):
+        """
+        command: The command to run as a list of arguments
+        mode: 'r' to read the standard output of command, 'w' to write to its
+        standard input
+        path: The file the standard output of command is written to in 'w' mode
+        """
+
+        self.command = command
+        self.mode = mode
+        self.fp_file = None
+
+        if mode == 'r':
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                            universal_newlines=True)
+            self.fp_pipe = self.process.stdout
+        else:
+            self.fp_file = open(path, 'wb')
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.fp_file,
+                                            universal_newlines=True)
+            self.fp_pipe = self.process.stdin
+
+    def __iter__(self):
+        return iter(self.fp_pipe)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, *args):
+        return self.fp_pipe.read(*args)
+
+    def readline(self):
+        return self.fp_pipe.readline()
+
+    def write(self, data):
+        self.fp_pipe.write(data)
+
+    def close(self):
+        self.fp_pipe.close()
+        return_code = self.process.wait()
+
+        if self.fp_file is not None:
+            self.fp_file.close()
+
+        # a reader may stop before the end of the output
+        if return_code > 0 or (return_code != 0 and self.mode == 'w'):
+            raise IOError("%s exited with status %d" % (self.command[0], return_code))
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
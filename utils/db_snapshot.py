@@ -0,0 +1,384 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: A local SQLite snapshot of small reference tables (family,
+             clan_membership, taxonomy, genome and version) that lookups can
+             be answered from in-process instead of querying the database.
+             The snapshot records the Rfam release it was exported from and
+             is exported again when the release of the database changes, or
+             when refreshed explicitly.
+
+             The snapshot is opt-in, as the tables can change while a release
+             is being prepared. Set RFAM_DB_SNAPSHOT to 1, for the default
+             location, or to the path of the snapshot file. Set
+             RFAM_DB_SNAPSHOT_OFFLINE to 1 to use an existing snapshot without
+             checking the release of the database, e.g. in cluster jobs.
+
+Usage: python db_snapshot.py [--refresh] [--path <snapshot file>]
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import argparse
+import datetime
+import decimal
+import os
+import sqlite3
+
+from mysql.connector import FieldType
+
+from utils import RfamDB
+
+# --------------------------------------------------------------------------------------------------
+
+# snapshot tables and the columns indexed for lookups
+SNAPSHOT_TABLES = {"family": ("rfam_acc", "type"),
+                   "clan_membership": ("clan_acc", "rfam_acc"),
+                   "taxonomy": ("ncbi_id",),
+                   "genome": ("upid", "ncbi_id"),
+                   "version": ()}
+
+INSERT_BATCH_SIZE = 10000  # rows inserted to the snapshot at a time
+
+# MySQL column types and the SQLite types they are stored as. TIMESTAMP and
+# DATE columns are converted back to datetime objects when read
+SQLITE_TYPES = {"DATETIME": "TIMESTAMP", "TIMESTAMP": "TIMESTAMP", "DATE": "DATE",
+                "TINY": "INTEGER", "SHORT": "INTEGER", "LONG": "INTEGER", "INT24": "INTEGER",
+                "LONGLONG": "INTEGER", "FLOAT": "REAL", "DOUBLE": "REAL", "DECIMAL": "REAL",
+                "NEWDECIMAL": "REAL"}
+
+# --------------------------------------------------------------------------------------------------
+
+
+def default_path():
+    """
+    Returns the default location of the snapshot of the selected database
+    """
+
+    return os.path.join(os.path.expanduser("~"), ".rfam",
+                        "%s_snapshot.sqlite" % RfamDB.db_name.lower())
+
+# --------------------------------------------------------------------------------------------------
+
+
+def fetch_release():
+    """
+    Fetches the Rfam release of the database
+
+    return: The release as a string (e.g. '14.1')
+    """
+
+    with RfamDB.session(buffered=True) as cursor:
+        cursor.execute("SELECT rfam_release FROM version")
+        release = cursor.fetchone()[0]
+
+    return str(release)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _sqlite_value(value):
+    # converts mysql.connector values to types SQLite can store
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+
+    if isinstance(value, (bytearray, bytes)) and not isinstance(value, str):
+        return value.decode("utf-8")
+
+    return value
+
+# --------------------------------------------------------------------------------------------------
+
+
+def export_table(cnx, snapshot_cnx, table):
+    """
+    Copies a database table to the snapshot, streaming its rows
+
+    cnx: A database connection
+    snapshot_cnx: A sqlite3 connection to the snapshot being built
+    table: The name of the table to copy
+
+    return: The number of rows copied
+    """
+
+    cursor = cnx.cursor()
+    cursor.execute("SELECT * FROM %s" % table)
+
+    columns = []
+    for column in cursor.description:
+        sqlite_type = SQLITE_TYPES.get(FieldType.get_info(column[1]), "TEXT")
+        columns.append("\"%s\" %s" % (column[0], sqlite_type))
+
+    snapshot_cnx.execute("CREATE TABLE %s (%s)" % (table, ", ".join(columns)))
+
+    insert_query = "INSERT INTO %s VALUES (%s)" % (table, ",".join(["?"] * len(columns)))
+
+    num_rows = 0
+    rows = cursor.fetchmany(INSERT_BATCH_SIZE)
+    while rows:
+        snapshot_cnx.executemany(insert_query,
+                                 [tuple([_sqlite_value(x) for x in row]) for row in rows])
+        num_rows += len(rows)
+        rows = cursor.fetchmany(INSERT_BATCH_SIZE)
+
+    cursor.close()
+
+    for column in SNAPSHOT_TABLES[table]:
+        snapshot_cnx.execute("CREATE INDEX %s_%s ON %s (%s)" % (table, column, table, column))
+
+    return num_rows
+
+# --------------------------------------------------------------------------------------------------
+
+
+def export_snapshot(path):
+    """
+    Exports the snapshot tables from the database to a new snapshot file. The
+    file is built under a temporary name and renamed once complete, so that
+    processes reading the previous snapshot are not affected
+
+    path: The path to the snapshot file
+
+    return: The release of the snapshot
+    """
+
+    if os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    snapshot_cnx = sqlite3.connect(tmp_path)
+    cnx = RfamDB.connect()
+
+    try:
+        # the release is read first, so a snapshot is never newer than its release
+        release = fetch_release()
+
+        for table in sorted(SNAPSHOT_TABLES.keys()):
+            export_table(cnx, snapshot_cnx, table)
+
+        snapshot_cnx.execute("CREATE TABLE snapshot_meta (key TEXT PRIMARY KEY, value TEXT)")
+        snapshot_cnx.executemany("INSERT INTO snapshot_meta VALUES (?, ?)",
+                                 [("release", release), ("database", RfamDB.db_name),
+                                  ("created", datetime.datetime.now().isoformat())])
+        snapshot_cnx.commit()
+
+    except:
+        snapshot_cnx.close()
+        os.remove(tmp_path)
+        raise
+
+    finally:
+        RfamDB.disconnect(cnx)
+
+    snapshot_cnx.close()
+    os.rename(tmp_path, path)
+
+    return release
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Snapshot(object):
+    """
+    Read access to a snapshot file, exporting it first if missing or out of
+    date
+    """
+
+    def __init__(self, path=None, check_version=True):
+        """
+        path: The path to the snapshot file. Defaults to default_path()
+        check_version: If True the snapshot is exported again if its release
+        differs from the release of the database. If False an existing
+        snapshot is used without querying the database
+        """
+
+        self.path = path if path is not None else default_path()
+        self.cnx = None
+
+        if not os.path.exists(self.path):
+            export_snapshot(self.path)
+
+        self._open()
+
+        if check_version is True and self.release != fetch_release():
+            self.refresh()
+
+    def _open(self):
+        if self.cnx is not None:
+            self.cnx.close()
+
+        self.cnx = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.cnx.row_factory = sqlite3.Row
+
+        self.release = self.execute("SELECT value FROM snapshot_meta WHERE key='release'")[0][0]
+
+    def refresh(self):
+        """
+        Exports the snapshot from the database again
+        """
+
+        export_snapshot(self.path)
+        self._open()
+
+    def execute(self, query, params=()):
+        """
+        Runs a query on the snapshot
+
+        query: An SQL query with ? placeholders
+        params: The query parameters
+
+        return: A list of sqlite3.Row objects, which support access by index
+        and by column name
+        """
+
+        return self.cnx.execute(query, params).fetchall()
+
+    def fetch_taxonomy_fields(self, ncbi_id):
+        """
+        Returns a dictionary with the taxonomy fields of a tax id, or None if
+        the tax id is not in the taxonomy table
+        """
+
+        rows = self.execute("SELECT * FROM taxonomy WHERE ncbi_id=?", (int(ncbi_id),))
+
+        if len(rows) == 0:
+            return None
+
+        return dict(zip(rows[0].keys(), tuple(rows[0])))
+
+    def load_clans(self):
+        """
+        Returns a dictionary with the family accessions of every clan as
+        {clan_acc: [rfam_acc, ...]}
+        """
+
+        clans = {}
+        for row in self.execute("SELECT clan_acc, rfam_acc FROM clan_membership"):
+            clans.setdefault(str(row[0]), []).append(str(row[1]))
+
+        return clans
+
+    def load_clan_members(self, clan_acc):
+        """
+        Returns a list of the family accessions of a clan
+        """
+
+        rows = self.execute("SELECT rfam_acc FROM clan_membership WHERE clan_acc=?", (clan_acc,))
+
+        return [str(x[0]) for x in rows]
+
+    def fetch_type_specific_rfam_accessions(self, rna_type):
+        """
+        Returns a list of the accessions of the families with rna_type in their
+        type
+        """
+
+        rows = self.execute("SELECT rfam_acc FROM family WHERE type LIKE ?",
+                            ('%' + rna_type + '%',))
+
+        return [x[0] for x in rows]
+
+# --------------------------------------------------------------------------------------------------
+
+# snapshots by process id, as sqlite connections can't be shared with forked processes
+_snapshots = {}
+_settings = None
+
+
+def enable(path=None, check_version=True):
+    """
+    Enables lookups from a snapshot in this process
+
+    path: The path to the snapshot file. Defaults to default_path()
+    check_version: If False use an existing snapshot without checking the
+    release of the database
+
+    return: void
+    """
+
+    global _settings
+
+    _settings = {"path": path, "check_version": check_version}
+    _snapshots.clear()
+
+
+def disable():
+    """
+    Disables lookups from a snapshot in this process
+    """
+
+    global _settings
+
+    _settings = {}
+    _snapshots.clear()
+
+
+def get_snapshot():
+    """
+    Returns the snapshot of this process, or None if snapshots are not enabled
+    with enable or the RFAM_DB_SNAPSHOT environment variable
+    """
+
+    global _settings
+
+    if _settings is None:
+        setting = os.environ.get("RFAM_DB_SNAPSHOT")
+
+        _settings = {}
+        if setting:
+            _settings = {"path": None if setting == "1" else setting,
+                         "check_version": os.environ.get("RFAM_DB_SNAPSHOT_OFFLINE") != "1"}
+
+    if not _settings:
+        return None
+
+    if os.getpid() not in _snapshots:
+        _snapshots[os.getpid()] = Snapshot(**_settings)
+
+    return _snapshots[os.getpid()]
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_arguments():
+    """
+    Performs some basic argument parsing
+
+    return: parser object
+    """
+
+    parser = argparse.ArgumentParser(description='Exports a local snapshot of reference tables')
+
+    parser.add_argument("--path", help="Snapshot file. Defaults to %s" % default_path(),
+                        type=str, default=None)
+    parser.add_argument("--refresh", help="Export the snapshot even if it is up to date",
+                        action="store_true", default=False)
+
+    return parser
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    args = parse_arguments().parse_args()
+
+    if args.refresh is True:
+        export_snapshot(args.path if args.path is not None else default_path())
+
+    snapshot = Snapshot(path=args.path, check_version=not args.refresh)
+
+    print ("Snapshot of release %s at %s" % (snapshot.release, snapshot.path))
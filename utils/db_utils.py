@@ -33,13 +33,16 @@ Description: A set of database functions to ease processing and data
 
 # ---------------------------------IMPORTS---------------------------------
 
-impjson
+import json
 import os
 import string
-import sys
+import time
+
+import mysql.connector
 
 from scripts.export.genomes import fetch_gen_metadata as fgm
 from utils import RfamDB
+from utils import db_snapshot
 
 # -------------------------------------------------------------------------
 
@@ -50,6 +53,14 @@ END = 3  # full region seq_end
 EVAL = 4  # full region evalue
 version = '14.0'
 
+STREAM_BATCH_SIZE = 10000  # number of rows fetched at a time by streaming queries
+IN_LIST_SIZE = 1000  # number of accessions per IN (...) list
+BULK_UPDATE_CHUNK_SIZE = 50000  # number of rows updated per transaction
+
+# genome statistics set by refresh_genome_stats and the aggregates they are computed with
+GENOME_STATS = (("num_families", "count(distinct fr.rfam_acc)"),
+                ("num_rfam_regions", "sum(fr.is_significant=1)"))
+
 # -------------------------------------------------------------------------
 
 
@@ -64,22 +75,11 @@ def set_is_significant_to_zero(rfam_acc, rfamseq_acc):
 
     # maybe have this working out of the list which will be returned from
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
     # update is_significant field to 0
     query = ("UPDATE full_region SET is_significant=0 "
-       "WHERE rfam_acc=\'%s\' AND rfamseq_acc=\'%s\'") % (rfam_acc, rfamseq_acc)
-
-    cursor.execute(query)
+             "WHERE rfam_acc=%s AND rfamseq_acc=%s")
 
-    cnx.commit()
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    RfamDB.execute_prepared(query, (rfam_acc, rfamseq_acc))
 
 # -------------------------------------------------------------------------
 
@@ -95,22 +95,11 @@ def set_is_significant_to_zero_adv(rfam_acc, rfamseq_acc, region):
 
     # maybe have this working out of the list which will be returned from
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
     # update is_significant field to 0
     query = ("UPDATE full_region SET is_significant=0 "
-             "WHERE rfam_acc=\'%s\' AND rfamseq_acc=\'%s\' AND seq_start=%d") % (rfam_acc, rfamseq_acc, region)
+             "WHERE rfam_acc=%s AND rfamseq_acc=%s AND seq_start=%s")
 
-    cursor.execute(query)
-
-    cnx.commit()
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    RfamDB.execute_prepared(query, (rfam_acc, rfamseq_acc, region))
 
 # -------------------------------------------------------------------------
 
@@ -128,28 +117,19 @@ def load_clan_seqs_from_db(clan_acc):  # tested
 
     fam_seqs = {}
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(raw=True)
-
     # Fetch clan specific family full_region data
     query = ("SELECT full_region.rfam_acc, full_region.rfamseq_acc, \
       full_region.seq_start, full_region.seq_end, full_region.evalue_score\n"
       "FROM full_region\n"
-      "JOIN (SELECT rfam_acc FROM clan_membership WHERE clan_acc=\'%s\') as CLAN_FAMS\n"
-      "ON CLAN_FAMS.rfam_acc=full_region.rfam_acc") % (clan_acc)
-
-    # execute the query
-    cursor.execute(query)
+      "JOIN (SELECT rfam_acc FROM clan_membership WHERE clan_acc=%s) as CLAN_FAMS\n"
+      "ON CLAN_FAMS.rfam_acc=full_region.rfam_acc")
 
     # build family dictionary of sequences
-    for row in cursor:
+    for row in RfamDB.stream(query, (clan_acc,), raw=True):
 
-      if str(row[RFAM_ACC]) in fam_seqs.keys():
+      if str(row[RFAM_ACC]) in fam_seqs:
 
-        if str(row[SEQ_ACC]) in fam_seqs[str(row[RFAM_ACC])].keys():
+        if str(row[SEQ_ACC]) in fam_seqs[str(row[RFAM_ACC])]:
 
           fam_seqs[str(row[RFAM_ACC])][str(row[SEQ_ACC])].append(
             (int(row[START]), int(row[END]), float(row[EVAL])))
@@ -160,10 +140,6 @@ def load_clan_seqs_from_db(clan_acc):  # tested
           fam_seqs[str(row[RFAM_ACC])] = {
           str(row[SEQ_ACC]): [(int(row[START]), int(row[END]), float(row[EVAL]))]}
 
-    # close cursor and DB connection
-    cursor.close()
-    RfamDB.disconnect(cnx)
-
     return fam_seqs
 
 # -------------------------------------------------------------------------
@@ -177,25 +153,20 @@ def load_clan_members_from_db(clan_acc):
     clan_acc: Clan accession as in Rfam
     """
 
-    clan_members = []
-
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(raw=True)
-
-    query = ("SELECT rfam_acc FROM clan_membership "
-       "WHERE clan_acc=\'%s\'") % (clan_acc)
+    snapshot = db_snapshot.get_snapshot()
+    if snapshot is not None:
+        return snapshot.load_clan_members(clan_acc)
 
-    cursor.execute(query)
+    clan_members = []
 
-    rows = cursor.fetchall()
+    query = "SELECT rfam_acc FROM clan_membership WHERE clan_acc=%s"
 
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    rows = RfamDB.fetch_prepared(query, (clan_acc,))
 
     for fam in rows:
-      clan_members.append(str(fam[0]))
+        clan_members.append(str(fam[0]))
 
-      return clan_members
+    return clan_members
 
 # -------------------------------------------------------------------------
 
@@ -208,30 +179,29 @@ def load_clans_from_db():
     clan_acc: Clan accession as in Rfam
     """
 
-    clans = {}
+    snapshot = db_snapshot.get_snapshot()
+    if snapshot is not None:
+        return snapshot.load_clans()
 
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(raw=True)
-
-    query = "SELECT * FROM clan_membership"
+    clans = {}
 
-    # execute query
-    cursor.execute(query)
+    with RfamDB.session(raw=True) as cursor:
+        query = "SELECT * FROM clan_membership"
 
-    # fetch the data
-    rows = cursor.fetchall()
+        # execute query
+        cursor.execute(query)
 
-    cursor.close()
-    RfamDB.disconnect(cnx)
+        # fetch the data
+        rows = cursor.fetchall()
 
     # create the dictionary
     for row in rows:
-      if str(row[0]) not in clans.keys():
-        clans[str(row[0])] = [str(row[1])]
-    else:
-        clans[str(row[0])].append(str(row[1]))
+        if str(row[0]) not in clans:
+            clans[str(row[0])] = [str(row[1])]
+        else:
+            clans[str(row[0])].append(str(row[1]))
 
-        return clans
+    return clans
 
 # -------------------------------------------------------------------------
 
@@ -246,92 +216,122 @@ def set_is_singificant_to_zero_multi(non_sig_seqs):
     non_sig_seqs: A list of the non significant regions to be set to zero.
                   The list is product of clan competition.
 
-                  """
+    returns: The number of rows updated
+    """
 
-    # connect to db
-    cnx = RfamDB.connect()
+    return bulk_update_regions("full_region", ("rfam_acc", "rfamseq_acc", "seq_start"),
+                               non_sig_seqs, "is_significant=0")
 
-    # get a new buffered cursor
-    cursor = cnx.cursor(raw=True)
+# -------------------------------------------------------------------------
 
-    # query to update is_significant field to 0
-    query = ("UPDATE full_region SET is_significant=0 "
-       "WHERE rfam_acc=%s AND rfamseq_acc=%s AND seq_start=%s")
 
-    try:
-        # execute query batched
-        cursor.executemany(query, non_sig_seqs)
-        cnx.commit()
+def bulk_update_regions(table, key_columns, keys, set_clause, chunk_size=BULK_UPDATE_CHUNK_SIZE):
+    """
+    Updates the rows of a table matching a list of keys with a single joined
+    UPDATE per chunk of keys, instead of one UPDATE per key. Each chunk of keys
+    is loaded in a temporary table with a multi-row INSERT and updated in its
+    own transaction.
 
-    except:
-        print ("MySQL Update Error. Rolling back...")
-        cnx.rollback()
-        cursor.close()
-        RfamDB.disconnect(cnx)
+    table: The name of the table to update (e.g. full_region)
+    key_columns: A tuple with the names of the columns keys are matched on
+    keys: A list of tuples with a value for each column in key_columns
+    set_clause: The assignment to apply to matching rows (e.g. is_significant=0)
+    chunk_size: The number of keys to update per transaction
 
-        cursor.close()
-        RfamDB.disconnect(cnx)
+    returns: The number of rows updated. Raises mysql.connector.Error if a chunk
+    fails, after rolling it back. Chunks updated before it remain committed
+    """
 
-# -------------------------------------------------------------------------
+    if len(keys) == 0:
+        return 0
 
+    num_rows = 0
 
-def reset_is_significant(clan_comp_type='FULL'):
-    """
-    This function resets full_region's is_singificant field's back to 1.
-    This should be able to update all or part of the table for clan
-    competition initialization and restoration.
-    """
-    seq_regs = []
+    # executemany sends INSERT statements as a single multi-row INSERT
+    insert_query = ("INSERT INTO tmp_update_keys (%s) VALUES (%s)" %
+                    (', '.join(key_columns), ', '.join(["%s"] * len(key_columns))))
+
+    update_query = ("UPDATE %s t JOIN tmp_update_keys k ON %s SET t.%s" %
+                    (table, " AND ".join(["t.%s=k.%s" % (x, x) for x in key_columns]),
+                     set_clause))
 
     cnx = RfamDB.connect()
+    cursor = cnx.cursor()
 
-    # cursor to fetch data
-    d_cursor = cnx.cursor(buffered=True)
+    try:
+        # same column types as the table, but no rows
+        cursor.execute("CREATE TEMPORARY TABLE tmp_update_keys "
+                       "SELECT %s FROM %s LIMIT 0" % (', '.join(key_columns), table))
+
+        for index in range(0, len(keys), chunk_size):
+            cursor.executemany(insert_query, keys[index:index + chunk_size])
+            cursor.execute(update_query)
+            num_rows += cursor.rowcount
+            cursor.execute("DELETE FROM tmp_update_keys")
+            cnx.commit()
 
-    # query to fetch all non significant sequences
-    if clan_comp_type.upper() == 'FULL':
-        select_query = ("SELECT rfam_acc, rfamseq_acc, seq_start FROM full_region "
-                        "WHERE is_significant=0")
+    except mysql.connector.Error as err:
+        print ("MySQL Update Error. Rolling back...")
+        print (err)
+        cnx.rollback()
 
-        # query to update 0 fields from s_query
-        update_query = ("UPDATE full_region SET is_significant=1 "
-                        "WHERE rfam_acc=%s AND rfamseq_acc=%s AND seq_start=%s")
+        # earlier chunks are already committed, so the caller must not carry
+        # on as if all keys were updated
+        raise
 
-    elif clan_comp_type.upper() == 'PDB':
-        select_query = ("SELECT rfam_acc, pdb_id, chain, pdb_start from pdb_full_region "
-                        "WHERE is_significant=0")
+    finally:
+        try:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_update_keys")
+            cursor.close()
 
-        update_query = ("UPDATE pdb_full_region SET is_significant=1 "
-                        "WHERE rfam_acc=%s AND pdb_id=%s AND chain=%s AND pdb_start=%s")
+        except mysql.connector.Error:
+            # e.g. lost connection, don't hide the error of the update. The
+            # temporary table is dropped when the connection is closed or reset
+            pass
 
-        d_cursor.execute(select_query)
+        RfamDB.disconnect(cnx)
 
-    # construct region list here
-    for row in d_cursor:
-        if clan_comp_type.upper() == 'FULL':
-            seq_regs.append((str(row[0]), str(row[1]), int(row[2])))
+    return num_rows
 
-        elif clan_comp_type.upper() == 'PDB':
-            seq_regs.append((str(row[0]), str(row[1]), str(row[2]), int(row[3])))
+# -------------------------------------------------------------------------
 
-    d_cursor.close()
 
-    # get a new cursor for db updates
-    u_cursor = cnx.cursor(raw=True)
+def reset_is_significant(clan_comp_type='FULL'):
+    """
+    This function resets full_region's is_singificant field's back to 1
+    with a single UPDATE statement, for clan competition initialization and
+    restoration.
+
+    clan_comp_type: FULL to reset full_region or PDB to reset pdb_full_region
+
+    returns: The number of rows updated
+    """
+
+    if clan_comp_type.upper() == 'PDB':
+        update_query = "UPDATE pdb_full_region SET is_significant=1 WHERE is_significant=0"
+    else:
+        update_query = "UPDATE full_region SET is_significant=1 WHERE is_significant=0"
+
+    num_rows = 0
+
+    cnx = RfamDB.connect()
+    cursor = cnx.cursor()
 
-    # update db
     try:
-        u_cursor.executemany(update_query, seq_regs)
+        cursor.execute(update_query)
+        num_rows = cursor.rowcount
         cnx.commit()
-    except:
+
+    except mysql.connector.Error as err:
         print ("MySQL Update Error. Rolling back...")
+        print (err)
         cnx.rollback()
-        u_cursor.close()
-        RfamDB.disconnect(cnx)
 
-    u_cursor.close()
+    cursor.close()
     RfamDB.disconnect(cnx)
 
+    return num_rows
+
 # -------------------------------------------------------------------------
 
 
@@ -384,52 +384,28 @@ def update_post_process(jobs_file):
 
 def set_number_of_species():
     """
-    Updates number_of_species in family table
-    """
-
-    cnx = RfamDB.connect()
-
-    cursor = cnx.cursor(buffered=True)
-    c_cursor = cnx.cursor(buffered=True)
-
-    cursor.execute("Select rfam_acc from family")
-
-    rfam_accs = cursor.fetchall()
-
-    cursor.close()
-
-    count_query = ("select count(distinct ncbi_id)\n"
-       "from full_region f, rfamseq r\n"
-       "where r.rfamseq_acc=f.rfamseq_acc\n"
-       "and is_significant=1 and rfam_acc=\'%s\'")
-
-    # counts list
-    counts = []
-    for acc in rfam_accs:
-        c_cursor.execute(count_query % str(acc[0]))
-        count = c_cursor.fetchall()
-
-        counts.append((count[0][0], str(acc[0])))
-
-        count = 0
+    Updates number_of_species in family table with the number of distinct
+    species of the significant hits of every family, in a single grouped
+    query
 
-    c_cursor.close()
-    c_cursor = cnx.cursor(buffered=True)
+    return: The number of family rows updated
+    """
 
-    # query to update number_of_species in the family table
-    update_query = ("update family set number_of_species=%s where rfam_acc=%s")
+    query = ("update family f\n"
+             "left join (\n"
+             "  select fr.rfam_acc, count(distinct rs.ncbi_id) as num_species\n"
+             "  from full_region fr, rfamseq rs\n"
+             "  where rs.rfamseq_acc=fr.rfamseq_acc\n"
+             "  and fr.is_significant=1\n"
+             "  group by fr.rfam_acc) c\n"
+             "on c.rfam_acc=f.rfam_acc\n"
+             "set f.number_of_species=coalesce(c.num_species, 0)")
 
-    try:
-        c_cursor.executemany(update_query, counts)
-        cnx.commit()
+    with RfamDB.session(commit=True) as cursor:
+        cursor.execute(query)
+        num_rows = cursor.rowcount
 
-    except:
-        cnx.rollback()
-
-    c_cursor.close()
-    RfamDB.disconnect(cnx)
-
-    print ("Done")
+    return num_rows
 
 # ----------------------------------------------------------------------------
 
@@ -437,110 +413,77 @@ def set_number_of_species():
 def set_num_full_sig_seqs():
     """
     Updates num_full in family table to hold the number of significant
-    sequences rather than the number of sequences in the full alignment
-    """
-
-    cnx = RfamDB.connect()
-
-    cursor = cnx.cursor(buffered=True)
-    c_cursor = cnx.cursor(buffered=True)
+    sequences rather than the number of sequences in the full alignment.
+    All families are counted with a single grouped query
 
-    cursor.execute("Select rfam_acc from family")
-
-    rfam_accs = cursor.fetchall()
-
-    cursor.close()
-
-    # query to count all significant sequences of a family
-
-    count_query = ("select count(*)\n"
-       "from full_region f\n"
-       "where is_significant=1\n"
-       "and type=\'full\'\n"
-       "and rfam_acc=\'%s\'")
-
-    # counts list
-    counts = []
-    for acc in rfam_accs:
-        c_cursor.execute(count_query % str(acc[0]))
-        count = c_cursor.fetchall()[0][0]
-
-        counts.append((count, str(acc[0])))
-
-        count = 0
-
-    c_cursor.close()
-    c_cursor = cnx.cursor(buffered=True)
-
-    update_query = ("update family set num_full=%s where rfam_acc=%s")
-
-    try:
-        c_cursor.executemany(update_query, counts)
-        cnx.commit()
+    return: The number of family rows updated
+    """
 
-    except:
-        cnx.rollback()
+    query = ("update family f\n"
+             "left join (\n"
+             "  select rfam_acc, count(*) as num_full\n"
+             "  from full_region\n"
+             "  where is_significant=1\n"
+             "  and type=\'full\'\n"
+             "  group by rfam_acc) c\n"
+             "on c.rfam_acc=f.rfam_acc\n"
+             "set f.num_full=coalesce(c.num_full, 0)")
 
-    c_cursor.close()
-    RfamDB.disconnect(cnx)
+    with RfamDB.session(commit=True) as cursor:
+        cursor.execute(query)
+        num_rows = cursor.rowcount
 
-    print ("Done")
+    return num_rows
 
 # ----------------------------------------------------------------------------
 
 
 def update_family_ncbi():
     """
-    Updates table family ncbi by adding all distinct taxonomic ids per family
+    Rebuilds table family_ncbi with all distinct taxonomic ids per family.
+    Existing entries are deleted and replaced in the same transaction, so the
+    table no longer needs to be truncated beforehand
 
-    :return: void
+    return: The number of family_ncbi rows inserted
     """
 
-    cnx = RfamDB.connect()
-
-    cursor = cnx.cursor(buffered=True)
-    c_cursor = cnx.cursor(buffered=True)
-
-    cursor.execute("Select rfam_acc from family")
-
-    rfam_accs = cursor.fetchall()
-
-    cursor.close()
-
-    # family_ncbi query
-    get_ncbi_ids = ("select distinct rs.ncbi_id, f.rfam_id, "
-                    "f.rfam_acc from full_region fr, rfamseq rs, family f "
-                    "where fr.rfamseq_acc=rs.rfamseq_acc "
-                    "and f.rfam_acc=fr.rfam_acc "
-                    "and fr.rfam_acc=\'%s\' "
+    insert_query = ("insert into family_ncbi (ncbi_id, rfam_id, rfam_acc)\n"
+                    "select distinct rs.ncbi_id, f.rfam_id, f.rfam_acc\n"
+                    "from full_region fr, rfamseq rs, family f\n"
+                    "where fr.rfamseq_acc=rs.rfamseq_acc\n"
+                    "and f.rfam_acc=fr.rfam_acc\n"
                     "and fr.is_significant=1")
 
-    insert_query = "insert into family_ncbi (ncbi_id, rfam_id, rfam_acc) values (%s,%s,%s)"
+    with RfamDB.session(commit=True) as cursor:
+        cursor.execute("delete from family_ncbi")
+        cursor.execute(insert_query)
+        num_rows = cursor.rowcount
 
-    family_ncbi_entries = []
-    cursor = cnx.cursor(buffered=True)
+    return num_rows
 
-    for rfam_acc in rfam_accs:
-        c_cursor.execute(get_ncbi_ids % rfam_acc[0])
-        family_ncbi_entries = list(c_cursor.fetchall())
-        entries_reformatted = [(str(x[0]), str(x[1]), str(x[2])) for x in family_ncbi_entries]
+# ----------------------------------------------------------------------------
 
-        try:
-            cursor.executemany(insert_query, entries_reformatted)
-            cnx.commit()
 
-        except:
-            cnx.rollback()
-            sys.exit("\nError updating family_ncbi table for family %s." % rfam_acc[0])
+def refresh_family_stats():
+    """
+    Refreshes all family statistics derived from full_region: num_full and
+    number_of_species in the family table and the family_ncbi table. Prints
+    the time taken by each step
 
-        family_ncbi_entries = []
-        entries_reformatted = []
+    return: void
+    """
 
-    cursor.close()
-    c_cursor.close()
-    RfamDB.disconnect(cnx)
+    steps = (("num_full", set_num_full_sig_seqs),
+             ("number_of_species", set_number_of_species),
+             ("family_ncbi", update_family_ncbi))
+
+    total_start = time.time()
+    for (name, update_function) in steps:
+        start = time.time()
+        num_rows = update_function()
+        print ("%s: %d rows updated in %.1fs" % (name, num_rows, time.time() - start))
 
-    print ("Done updating family_ncbi.")
+    print ("Family statistics refreshed in %.1fs" % (time.time() - total_start))
 
 # ----------------------------------------------------------------------------
 
@@ -591,7 +534,7 @@ def set_pdb_is_significant_to_zero(non_sig_seqs):
     non_sig_seqs: A list of the non significant regions to be set to zero.
     The list is product of clan competition.
 
-    returns: void
+    returns: The number of rows updated
     """
 
     # reformat list by splitting pdb_id and chain
@@ -604,30 +547,8 @@ def set_pdb_is_significant_to_zero(non_sig_seqs):
         pdb_reformatted_regions.append((str(competed_region[0]), str(pdb_id_chain_pairs[0]),
           str(pdb_id_chain_pairs[2]), int(competed_region[2])))
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(raw=True)
-
-    # query to update is_significant field to 0
-    query = ("update pdb_full_region set is_significant=0 "
-             "where rfam_acc=%s and pdb_id=%s and chain=%s and pdb_start=%s")
-
-    try:
-        # execute query batched
-        cursor.executemany(query, pdb_reformatted_regions)
-        cnx.commit()
-
-    except:
-        print ("MySQL Update Error. Rolling back...")
-        cnx.rollback()
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    return bulk_update_regions("pdb_full_region", ("rfam_acc", "pdb_id", "chain", "pdb_start"),
+                               pdb_reformatted_regions, "is_significant=0")
 
 # ----------------------------------------------------------------------------
 
@@ -639,17 +560,12 @@ def fetch_clan_accessions():
 
     returns: A list of all clan accessions
     """
-    cnx = RfamDB.connect()
-    clan_cursor = cnx.cursor(buffered=True)
+    with RfamDB.session(buffered=True) as clan_cursor:
+        clan_query = "SELECT clan_acc FROM clan"
 
-    clan_query = "SELECT clan_acc FROM clan"
-
-    # fetch clans
-    clan_cursor.execute(clan_query)
-    clans = [str(x[0]) for x in clan_cursor.fetchall()]
-
-    clan_cursor.close()
-    RfamDB.disconnect(cnx)
+        # fetch clans
+        clan_cursor.execute(clan_query)
+        clans = [str(x[0]) for x in clan_cursor.fetchall()]
 
     return clans
 
@@ -662,24 +578,15 @@ def fetch_clan_full_region_records(clan_acc):
 
     param clan_acc: A valid Rfam clan accession
 
-    returns: A list with all regions from full_region table for a specific  clan
+    returns: A generator of all regions from full_region table for a specific
+    clan, streamed from the server
     """
 
-    cnx = RfamDB.connect()
-    clan_cursor = cnx.cursor(buffered=True)
-
     clan_region_query = ("SELECT * FROM full_region\n"
-       "JOIN (SELECT rfam_acc FROM clan_membership WHERE clan_acc=\'%s\') as CLAN_FAMS\n"
-                         "ON CLAN_FAMS.rfam_acc=full_region.rfam_acc")  # % (clan_acc)
-
-    clan_cursor.execute(clan_region_query % clan_acc)
+       "JOIN (SELECT rfam_acc FROM clan_membership WHERE clan_acc=%s) as CLAN_FAMS\n"
+                         "ON CLAN_FAMS.rfam_acc=full_region.rfam_acc")
 
-    clan_sequence_regions = clan_cursor.fetchall()
-
-    clan_cursor.close()
-    RfamDB.disconnect(cnx)
-
-    return clan_sequence_regions
+    return RfamDB.stream(clan_region_query, (clan_acc,))
 
 # ----------------------------------------------------------------------------
 
@@ -693,24 +600,180 @@ def fetch_clan_pdb_full_region_records(clan_acc):
     returns: A list with all pdb regions per clan
     """
 
-    cnx = RfamDB.connect()
-    clan_cursor = cnx.cursor(buffered=True)
-
     clan_pdb_region_query = ("select pfr.rfam_acc, concat(pfr.pdb_id,'_',pfr.chain) as seq_acc, "
-       "pfr.pdb_start, pfr.pdb_end, pfr.bit_score, pfr.evalue_score "
-       "from pdb_full_region pfr, clan_membership cm "
-       "where cm.rfam_acc=pfr.rfam_acc "
-       "and cm.clan_acc=\'%s\' "
-       "order by seq_acc")
+                             "pfr.pdb_start, pfr.pdb_end, pfr.bit_score, pfr.evalue_score "
+                             "from pdb_full_region pfr, clan_membership cm "
+                             "where cm.rfam_acc=pfr.rfam_acc "
+                             "and cm.clan_acc=%s "
+                             "order by seq_acc")
 
-    clan_cursor.execute(clan_pdb_region_query % clan_acc)
+    return RfamDB.fetch_prepared(clan_pdb_region_query, (clan_acc,))
 
-    clan_sequence_regions = clan_cursor.fetchall()
+# ----------------------------------------------------------------------------
 
-    clan_cursor.close()
-    RfamDB.disconnect(cnx)
 
-    return clan_sequence_regions
+def stream_clan_region_records(clan_acc, clan_comp_type='FULL', batch_size=STREAM_BATCH_SIZE):
+    """
+    Streams the regions of a clan from full_region or pdb_full_region, ordered
+    by sequence accession, using an unbuffered cursor so that rows are fetched
+    from the server as they are consumed. The columns are the same as those of
+    the clan files generated by clan_file_generator.py
+
+    clan_acc: A valid Rfam clan accession
+    clan_comp_type: FULL for full_region regions or PDB for pdb_full_region
+    batch_size: The number of rows to fetch from the server at a time
+
+    returns: A generator of region tuples
+    """
+
+    if clan_comp_type.upper() == 'FULL':
+        clan_region_query = ("SELECT fr.rfam_acc, fr.rfamseq_acc, fr.seq_start, fr.seq_end, "
+                             "fr.bit_score, fr.evalue_score, fr.cm_start, fr.cm_end, fr.truncated, "
+                             "fr.type, fr.is_significant "
+                             "FROM full_region fr "
+                             "JOIN clan_membership cm ON cm.rfam_acc=fr.rfam_acc "
+                             "WHERE cm.clan_acc=%s "
+                             "ORDER BY fr.rfamseq_acc, fr.seq_start, fr.rfam_acc")
+
+    else:
+        clan_region_query = ("SELECT pfr.rfam_acc, concat(pfr.pdb_id,'_',pfr.chain) as seq_acc, "
+                             "pfr.pdb_start, pfr.pdb_end, pfr.bit_score, pfr.evalue_score "
+                             "FROM pdb_full_region pfr "
+                             "JOIN clan_membership cm ON cm.rfam_acc=pfr.rfam_acc "
+                             "WHERE cm.clan_acc=%s "
+                             "ORDER BY seq_acc, pfr.pdb_start, pfr.rfam_acc")
+
+    return RfamDB.stream(clan_region_query, (clan_acc,), fetch_size=batch_size)
+
+# ----------------------------------------------------------------------------
+
+
+def _fetch_distinct_values(query, accessions):
+    """
+    Runs a single column query with an IN (...) list once per IN_LIST_SIZE
+    accessions and returns the distinct values
+
+    query: A query with an IN %s placeholder for the accession list
+    accessions: A list of accessions
+
+    returns: A set of strings
+    """
+
+    accessions = list(accessions)
+    values = set()
+
+    with RfamDB.session(buffered=True) as cursor:
+        for index in range(0, len(accessions), IN_LIST_SIZE):
+            acc_chunk = accessions[index:index + IN_LIST_SIZE]
+            in_list = "(" + ','.join(["%s"] * len(acc_chunk)) + ")"
+
+            cursor.execute(query % in_list, tuple(acc_chunk))
+            values.update([str(x[0]) for x in cursor.fetchall()])
+
+    return values
+
+# ----------------------------------------------------------------------------
+
+
+def fetch_family_clan_accessions(rfam_accs):
+    """
+    Fetches the clans the families in rfam_accs are members of
+
+    rfam_accs: A list of Rfam family accessions
+
+    returns: A set of clan accessions
+    """
+
+    query = "SELECT DISTINCT clan_acc FROM clan_membership WHERE rfam_acc IN %s"
+
+    return _fetch_distinct_values(query, rfam_accs)
+
+# ----------------------------------------------------------------------------
+
+
+def fetch_family_rfamseq_accessions(rfam_accs):
+    """
+    Fetches the accessions of the sequences with full_region regions of the
+    families in rfam_accs
+
+    rfam_accs: A list of Rfam family accessions
+
+    returns: A set of rfamseq accessions
+    """
+
+    query = "SELECT DISTINCT rfamseq_acc FROM full_region WHERE rfam_acc IN %s"
+
+    return _fetch_distinct_values(query, rfam_accs)
+
+# ----------------------------------------------------------------------------
+
+
+def fetch_rfamseq_clan_accessions(rfamseq_accs):
+    """
+    Fetches the clans with full_region regions on the sequences in rfamseq_accs
+
+    rfamseq_accs: A list of rfamseq accessions
+
+    returns: A set of clan accessions
+    """
+
+    query = ("SELECT DISTINCT cm.clan_acc FROM full_region fr "
+             "JOIN clan_membership cm ON cm.rfam_acc=fr.rfam_acc "
+             "WHERE fr.rfamseq_acc IN %s")
+
+    return _fetch_distinct_values(query, rfamseq_accs)
+
+# ----------------------------------------------------------------------------
+
+
+def stream_clan_rfamseq_region_records(clan_acc, rfamseq_accs, batch_size=STREAM_BATCH_SIZE):
+    """
+    Streams the full_region regions of a clan on the sequences in rfamseq_accs,
+    ordered by sequence accession. The columns are the same as those returned
+    by stream_clan_region_records
+
+    clan_acc: A valid Rfam clan accession
+    rfamseq_accs: A list of rfamseq accessions
+    batch_size: The number of rows to fetch from the server at a time
+
+    returns: A generator of region tuples
+    """
+
+    # sorting the accessions keeps the rows of all lists ordered by accession
+    rfamseq_accs = sorted(rfamseq_accs)
+
+    clan_region_query = ("SELECT fr.rfam_acc, fr.rfamseq_acc, fr.seq_start, fr.seq_end, "
+                         "fr.bit_score, fr.evalue_score, fr.cm_start, fr.cm_end, fr.truncated, "
+                         "fr.type, fr.is_significant "
+                         "FROM full_region fr "
+                         "JOIN clan_membership cm ON cm.rfam_acc=fr.rfam_acc "
+                         "WHERE cm.clan_acc=%%s AND fr.rfamseq_acc IN %s "
+                         "ORDER BY fr.rfamseq_acc, fr.seq_start, fr.rfam_acc")
+
+    for index in range(0, len(rfamseq_accs), IN_LIST_SIZE):
+        acc_chunk = rfamseq_accs[index:index + IN_LIST_SIZE]
+        in_list = "(" + ','.join(["%s"] * len(acc_chunk)) + ")"
+
+        for row in RfamDB.stream(clan_region_query % in_list, tuple([clan_acc] + acc_chunk),
+                                 fetch_size=batch_size):
+            yield row
+
+# ----------------------------------------------------------------------------
+
+
+def set_is_significant_to_one_multi(sig_seqs):
+    """
+    Sets full_region is_significant field back to one (1) for the list of
+    regions passed in the form of (rfam_acc, rfamseq_acc, seq_start) tuples.
+    Used by incremental clan competition for regions that became significant.
+
+    sig_seqs: A list of the regions to be set to one
+
+    returns: The number of rows updated
+    """
+
+    return bulk_update_regions("full_region", ("rfam_acc", "rfamseq_acc", "seq_start"),
+                               sig_seqs, "is_significant=1")
 
 # ----------------------------------------------------------------------------
 
@@ -723,23 +786,15 @@ def fetch_rfam_accs_sorted(order='DESC'):
     returns: void
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    # update is_significant field to 0
-    query = ("select rfam_acc from seed_region\n"
-       "group by rfam_acc\n"
-       "order by count(*) %s" % order)
-
-    cursor.execute(query)
+    with RfamDB.session(buffered=True) as cursor:
+        # update is_significant field to 0
+        query = ("select rfam_acc from seed_region\n"
+           "group by rfam_acc\n"
+           "order by count(*) %s" % order)
 
-    rfam_accs = [str(x[0]) for x in cursor.fetchall()]
+        cursor.execute(query)
 
-    cursor.close()
-    RfamDB.disconnect(cnx)
+        rfam_accs = [str(x[0]) for x in cursor.fetchall()]
 
     return rfam_accs
 
@@ -753,21 +808,13 @@ def fetch_all_upids():
     return: A list of UP/RG ids as stored in genome
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    # update is_significant field to 0
-    query = "select upid from genome"
-
-    cursor.execute(query)
+    with RfamDB.session(buffered=True) as cursor:
+        # update is_significant field to 0
+        query = "select upid from genome"
 
-    genome_accs = [str(x[0]) for x in cursor.fetchall()]
+        cursor.execute(query)
 
-    cursor.close()
-    RfamDB.disconnect(cnx)
+        genome_accs = [str(x[0]) for x in cursor.fetchall()]
 
     return genome_accs
 
@@ -812,125 +859,114 @@ def set_genome_size(genome_sizes):
 # ----------------------------------------------------------------------------
 
 
-def set_number_of_distinct_families_in_genome(upid):
+def refresh_genome_stats(upids=None, columns=("num_families", "num_rfam_regions")):
     """
-    Sets the number distinct families with hits in a specific genome defined
-    by its corresponding upid
+    Sets num_families and num_rfam_regions of genomes from a single grouped
+    pass over full_region and genseq, applied with one multi-row update.
+    Genomes without any hits are set to 0
 
-    upid: A specific genome upid to update the number of distinct families
+    upids: A list of genome upids to update. If None all genomes are updated.
+    Large lists are updated IN_LIST_SIZE genomes at a time
+    columns: The genome columns to set, num_families and/or num_rfam_regions.
+    Other columns are left unchanged
 
-    return: void
+    return: The number of genome rows updated
     """
 
-    upids = []
-    # connect to db
-    cnx = RfamDB.connect()
+    stats = [x for x in GENOME_STATS if x[0] in columns]
 
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    if upid is None:
-        upids = fetch_all_upids()
+    if len(stats) != len(set(columns)):
+        raise ValueError("Unknown genome columns: %s" % ', '.join(
+            sorted(set(columns) - set([x[0] for x in GENOME_STATS]))))
 
-        for upid in upids:
-            select_query = ("select count(distinct rfam_acc) from full_region fr, genseq gs\n"
-                            "where fr.rfamseq_acc=gs.rfamseq_acc\n"
-                            "and gs.upid=\'%s\'\n"
-                            "and gs.version=\'%s\'")
-
-            cursor.execute(select_query % (upid, version))
-            count = cursor.fetchone()[0]
-
-            # update is_significant field to 0
-            update_query = "update genome set num_families=%d where upid=\'%s\'"
-
-            # execute query
-            cursor.execute(update_query % (count, upid))
-
-
-    else:
-        select_query = ("select count(distinct rfam_acc) from full_region fr, genseq gs\n"
-                         "where fr.rfamseq_acc=gs.rfamseq_acc\n"
-                         "and gs.upid=\'%s\'\n"
-                         "and gs.version=\'%s\'")
+    query = ("update genome g\n"
+             "left join (\n"
+             "  select gs.upid, " + ", ".join(["%s as %s" % (x[1], x[0]) for x in stats]) + "\n"
+             "  from full_region fr, genseq gs\n"
+             "  where fr.rfamseq_acc=gs.rfamseq_acc\n"
+             "  and gs.version=%%s%s\n"
+             "  group by gs.upid) c\n"
+             "on c.upid=g.upid\n"
+             "set " + ",\n".join(["g.%s=coalesce(c.%s, 0)" % (x[0], x[0]) for x in stats]) + "%s")
 
-        cursor.execute(select_query % (upid, version))
-        count = cursor.fetchone()[0]
+    num_rows = 0
+    with RfamDB.session(commit=True) as cursor:
+        if upids is None:
+            cursor.execute(query % ('', ''), (version,))
+            num_rows = cursor.rowcount
 
-        # update is_significant field to 0
-        update_query = "update genome set num_families=%d where upid=\'%s\'"
+        else:
+            upids = list(upids)
+            for index in range(0, len(upids), IN_LIST_SIZE):
+                upid_chunk = upids[index:index + IN_LIST_SIZE]
+                in_list = "(" + ','.join(["%s"] * len(upid_chunk)) + ")"
 
-        # execute query
-        cursor.execute(update_query % (count, upid))
+                cursor.execute(query % ("\n  and gs.upid in " + in_list,
+                                        "\nwhere g.upid in " + in_list),
+                               tuple([version] + upid_chunk + upid_chunk))
+                num_rows += cursor.rowcount
 
-    # commit changes and disconnect
-    cnx.commit()
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    return num_rows
 
 # ----------------------------------------------------------------------------
 
 
-def set_number_of_genomic_significant_hits(upid):
+def set_number_of_distinct_families_in_genome(upid):
     """
-    Sets the number of significant hits for a specific genome according to
-    its corresponding upid id
+    Sets the number distinct families with hits in a specific genome defined
+    by its corresponding upid
 
-    upid: A specific genome upid to update the number of significant hits
+    upid: A specific genome upid to update the number of distinct families.
+    If None the num_families of all genomes is updated with refresh_genome_stats
 
     return: void
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
+    if upid is None:
+        refresh_genome_stats(columns=("num_families",))
+        return
 
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
+    select_query = ("select count(distinct rfam_acc) from full_region fr, genseq gs\n"
+                    "where fr.rfamseq_acc=gs.rfamseq_acc\n"
+                    "and gs.upid=%s\n"
+                    "and gs.version=%s")
 
-    if upid is None:
+    count = RfamDB.fetch_prepared(select_query, (upid, version))[0][0]
 
-        upids = fetch_all_upids()
+    update_query = "update genome set num_families=%s where upid=%s"
 
-        for upid in upids:
+    RfamDB.execute_prepared(update_query, (count, upid))
 
+# ----------------------------------------------------------------------------
 
-            count_query = ("select count(fr.rfamseq_acc)\n"
-                           "from full_region fr, genseq gs\n"
-                           "where fr.rfamseq_acc=gs.rfamseq_acc\n"
-                           "and fr.is_significant=1\n"
-                           "and gs.upid=\'%s\'\n"
-                           "and gs.version=\'%s\'")
 
-            cursor.execute(count_query % (upid, version))
-            count = cursor.fetchone()[0]
+def set_number_of_genomic_significant_hits(upid):
+    """
+    Sets the number of significant hits for a specific genome according to
+    its corresponding upid id
 
-            # update is_significant field to 0
-            update_query = "update genome set num_rfam_regions=%d where upid=\'%s\'"
+    upid: A specific genome upid to update the number of significant hits.
+    If None the num_rfam_regions of all genomes is updated with refresh_genome_stats
 
-            # execute query
-            cursor.execute(update_query % (count, upid))
-    else:
+    return: void
+    """
 
-        count_query = ("select count(fr.rfamseq_acc)\n"
-                       "from full_region fr, genseq gs\n"
-                       "where fr.rfamseq_acc=gs.rfamseq_acc\n"
-                       "and fr.is_significant=1\n"
-                       "and gs.upid=\'%s\'\n"
-                       "and gs.version=\'%s\'")
+    if upid is None:
+        refresh_genome_stats(columns=("num_rfam_regions",))
+        return
 
-        cursor.execute(count_query % (upid, version))
-        count = cursor.fetchone()[0]
+    count_query = ("select count(fr.rfamseq_acc)\n"
+                   "from full_region fr, genseq gs\n"
+                   "where fr.rfamseq_acc=gs.rfamseq_acc\n"
+                   "and fr.is_significant=1\n"
+                   "and gs.upid=%s\n"
+                   "and gs.version=%s")
 
-        # update is_significant field to 0
-        update_query = "update genome set num_rfam_regions=%d where upid=\'%s\'"
+    count = RfamDB.fetch_prepared(count_query, (upid, version))[0][0]
 
-        # execute query
-        cursor.execute(update_query % (count, upid))
+    update_query = "update genome set num_rfam_regions=%s where upid=%s"
 
-    # commit changes and disconnect
-    cnx.commit()
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    RfamDB.execute_prepared(update_query, (count, upid))
 
 # ----------------------------------------------------------------------------
 
@@ -943,25 +979,18 @@ def fetch_author_orcid(author_name):
     """
 
     orcid = None
-    cnx = RfamDB.connect()
-
-    # Get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
 
     query = """
     Select orcid from author
-    where name like '%s%s%s' or synonyms like '%s%s%s'
+    where name like %s or synonyms like %s
     """
 
-    cursor.execute(query % (chr(37), author_name, chr(37),
-      chr(37), author_name, chr(37)))
+    pattern = "%" + author_name + "%"
 
-    result = cursor.fetchone()
-    if result is not None:
-        orcid = result[0]
+    rows = RfamDB.fetch_prepared(query, (pattern, pattern))
 
-        cursor.close()
-        RfamDB.disconnect(cnx)
+    if len(rows) > 0:
+        orcid = rows[0][0]
 
     # This will return none if there's no ORCiD available
     return orcid
@@ -969,49 +998,30 @@ def fetch_author_orcid(author_name):
 
 
 def update_chromosome_info_in_genseq():
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True, dictionary=True)
-
     genome_query = "select upid, assembly_acc from genome where assembly_acc is not NULL"
 
     update_query = """
-    update genseq set chromosome_type=\'%s\', chromosome_name=\'%s\'
-    where upid=\'%s\' and rfamseq_acc=\'%s\' and version=14.0
+    update genseq set chromosome_type=%s, chromosome_name=%s
+    where upid=%s and rfamseq_acc=%s and version=14.0
     """
 
-    cursor.execute(genome_query)
-    accessions = cursor.fetchall()
-    cursor.close()
-
-    upid_gca_dict = {}
+    upid_gca_dict = dict(RfamDB.fetch_prepared(genome_query))
 
-    cursor = cnx.cursor(buffered=True)
+    # each genome once, the ENA assembly data is fetched per genome
+    for upid in upid_gca_dict.keys():
 
-    for pair in accessions:
-        upid_gca_dict[pair["upid"]] = pair["assembly_acc"]
+        if upid_gca_dict[upid][0:3] == 'GCF' or upid_gca_dict[upid] == '':
+            continue
 
-        for upid in upid_gca_dict.keys():
+        data = fgm.fetch_gca_data(upid, upid_gca_dict[upid], 'kingdom')
 
-            upid_gca_dict[upid]
-
-            if upid_gca_dict[upid][0:3] == 'GCF' or upid_gca_dict[upid] == '':
-                continue
-
-            data = fgm.fetch_gca_data(upid, upid_gca_dict[upid], 'kingdom')
-
-            if "fields" in data:
-                fields = data["fields"]
-                if "chromosomes" in fields:
-                    for chromosome in fields["chromosomes"]:
-                        cursor.execute(update_query % (str(chromosome["type"]), str(chromosome["name"]),
-                        str(upid), str(chromosome["accession"])))
-
-    cnx.commit()
-    cursor.close()
-    RfamDB.disconnect(cnx)
+        if "fields" in data:
+            fields = data["fields"]
+            if "chromosomes" in fields:
+                for chromosome in fields["chromosomes"]:
+                    RfamDB.execute_prepared(update_query, (str(chromosome["type"]),
+                                                           str(chromosome["name"]), str(upid),
+                                                           str(chromosome["accession"])))
 
 # ----------------------------------------------------------------------------
 
@@ -1067,20 +1077,9 @@ def get_number_of_seed_sequences(rfam_acc):
     return (int): Number of SEED sequences
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-     # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    query = "Select count(*) from seed_region where rfam_acc=\'%s\'" % rfam_acc
+    query = "Select count(*) from seed_region where rfam_acc=%s"
 
-    cursor.execute(query)
-
-    number_seed_seqs = int(cursor.fetchone()[0])
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    number_seed_seqs = int(RfamDB.fetch_prepared(query, (rfam_acc,))[0][0])
 
     return number_seed_seqs
 
@@ -1097,20 +1096,9 @@ def get_number_of_full_hits(rfam_acc):
     return (int): Number of FULL hits from full_region table
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    query = "Select count(*) from full_region where rfam_acc=\'%s\' and type=\'full\' and is_significant=1" % rfam_acc
+    query = "Select count(*) from full_region where rfam_acc=%s and type='full' and is_significant=1"
 
-    cursor.execute(query)
-
-    number_full_hits = int(cursor.fetchone()[0])
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
+    number_full_hits = int(RfamDB.fetch_prepared(query, (rfam_acc,))[0][0])
 
     return number_full_hits
 
@@ -1119,29 +1107,16 @@ def get_number_of_full_hits(rfam_acc):
 
 def fetch_metagenomic_regions():
     """
-    Fetches all seed_region entries
+    Fetches all meta_full_region entries
 
-    return: A list of tuples with all seed_region entries
+    return: A generator of tuples with all meta_full_region entries, streamed
+    from the server
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    # update is_significant field to 0
     query = ("Select rfam_acc, umgseq_acc, seq_start, seq_end "
              "from meta_full_region")
 
-    cursor.execute(query)
-
-    region_rows = cursor.fetchall()
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
-
-    return region_rows
+    return RfamDB.stream(query)
 
 # ----------------------------------------------------------------------------
 
@@ -1161,35 +1136,22 @@ def get_family_unique_ncbi_ids(rfam_acc):
     select distinct rs.ncbi_id 
     from seed_region sr, rfamseq rs
     where sr.rfamseq_acc=rs.rfamseq_acc
-    and sr.rfam_acc = '%s'
+    and sr.rfam_acc = %s
     """
 
     full_query = """
     select distinct rs.ncbi_id 
     from full_region fr, rfamseq rs
     where fr.rfamseq_acc=rs.rfamseq_acc
-    and fr.rfam_acc = '%s'
+    and fr.rfam_acc = %s
     and fr.type = 'full'
     """
 
-    cnx = RfamDB.connect()
-
-    cursor_seed = cnx.cursor(buffered=True)
-    cursor_full = cnx.cursor(buffered=True)
-
-    cursor_seed.execute(seed_query % rfam_acc)
-
-    seed_ncbi_ids = [x[0] for x in cursor_seed.fetchall()]
-
-    cursor_full.execute(full_query % rfam_acc)
-    full_ncbi_ids = [x[0] for x in cursor_full.fetchall()]
+    seed_ncbi_ids = [x[0] for x in RfamDB.fetch_prepared(seed_query, (rfam_acc,))]
+    full_ncbi_ids = [x[0] for x in RfamDB.fetch_prepared(full_query, (rfam_acc,))]
 
     unique_family_ncbi_ids = list(set(full_ncbi_ids).union(set(seed_ncbi_ids)))
 
-    cursor_seed.close()
-    cursor_full.close()
-    RfamDB.disconnect(cnx)
-
     return unique_family_ncbi_ids
 
 # ----------------------------------------------------------------------------
@@ -1207,26 +1169,25 @@ def fetch_type_specific_rfam_accessions(rna_type, return_type = "list"):
 
     query = """
     select rfam_acc from family
-    where type like '%s%s%s'
+    where type like %s
     """
 
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(buffered=True)
+    snapshot = db_snapshot.get_snapshot()
+    if snapshot is not None:
+        accessions = snapshot.fetch_type_specific_rfam_accessions(rna_type)
 
-    cursor.execute(query % (chr(37), rna_type, chr(37)))
+    else:
+        accessions = [x[0] for x in RfamDB.fetch_prepared(query, ("%" + rna_type + "%",))]
 
     rfam_accs = {}
 
     # process accessions
     if return_type == "list":
-        rfam_accs = [x[0] for x in cursor.fetchall()]
+        rfam_accs = accessions
     elif return_type == "dict":
-        for rfam_acc in [x[0] for x in cursor.fetchall()]:
+        for rfam_acc in accessions:
             rfam_accs[rfam_acc] = ''
 
-    cursor.close()
-    RfamDB.disconnect(cnx)
-
     return rfam_accs
 
 # ----------------------------------------------------------------------------
@@ -1242,14 +1203,15 @@ def fetch_taxonomy_fields(tax_id):
     return: A dictionary with all taxonomy fields
     """
 
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(dictionary=True)
+    snapshot = db_snapshot.get_snapshot()
+    if snapshot is not None:
+        return snapshot.fetch_taxonomy_fields(tax_id)
 
     query = "Select * from taxonomy where ncbi_id=%s"
 
-    cursor.execute(query % tax_id)
-
-    fields = cursor.fetchall()[0]
+    with RfamDB.session(dictionary=True) as cursor:
+        cursor.execute(query % tax_id)
+        fields = cursor.fetchall()[0]
 
     return fields
 
@@ -1266,14 +1228,11 @@ def fetch_max_RG_accession_from_genome():
     table
     """
 
-    cnx = RfamDB.connect()
-    cursor = cnx.cursor(buffered=True)
-
     query = "Select max(upid) from genome where upid like \'RG%\'"
 
-    cursor.execute(query)
-
-    rfam_genome_id = cursor.fetchone()[0]
+    with RfamDB.session(buffered=True) as cursor:
+        cursor.execute(query)
+        rfam_genome_id = cursor.fetchone()[0]
 
     return rfam_genome_id
 
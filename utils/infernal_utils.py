@@ -15,19 +15,41 @@ limitations under the License.
 
 import os
 import sys
-import re
+import mmap
+import random
+import datetime
+import multiprocessing
+from collections import deque, namedtuple
+
+from utils import compressed_io as cio
+from utils import structure_utils as su
 
 START = 9
 END = 10
 STRAND = 11
 EVAL = 2
 BSCORE = 3
-DBN_REGEX = {r"\(|\[|<|\{": '(', r"\)|\]|>|\}": ')', r"_|-|\.|,|~|:": '.'}
+INF_CHUNK_SIZE = 67108864  # bytes of Infernal output per parsing task (64MB)
+INF_CHUNKS_AHEAD = 2  # parsing tasks queued per process ahead of the hits being consumed
+
+# Rfam website hex colours to randomly choose from for pdb_full_region
+PDB_HEX_COLOURS = ["1fc01f", "c00f0f", "bdc000", "c008ae", "00bac0", "8484c0",
+                   "93c090", "c0af92", "8e2511", "f29242", "8585e6", "ff87fa",
+                   "008700", "454545", "0003c0", "ebeb30", "ff87a4", "0064f4"]
+
+# tblout columns in the order Infernal writes them (cmsearch/cmscan --tblout)
+TBLOUT_FIELDS = ("target_name", "target_acc", "query_name", "query_acc", "mdl",
+                 "mdl_from", "mdl_to", "seq_from", "seq_to", "strand", "trunc",
+                 "pass_num", "gc", "bias", "score", "evalue", "inc", "description")
+
+# A single tblout hit. Values are kept as the strings found in the file so that
+# the converters write them out unchanged
+TbloutHit = namedtuple("TbloutHit", TBLOUT_FIELDS)
 
 # --------------------------------------------------------------------------------------------------
 
 
-def generate_bed_detail_file_with_ss(inf_output_file, dest_dir, ss_notation="wuss"):
+def generate_bed_detail_file_with_ss(inf_output_file, dest_dir, ss_notation="wuss", processes=1):
     """
     Parses Infernal's detailed output and generates a bed file in detailed format
     with the last column containing the secondary structure string in the specified
@@ -37,28 +59,13 @@ def generate_bed_detail_file_with_ss(inf_output_file, dest_dir, ss_notation="wus
     dest_dir: The path to the output directory
     ss_notation: A string indicating the the notation in which to output the
     secondary structure string (wuss or dbn)
+    processes: The number of processes to parse the file with (see infernal_hits)
 
     return: Void
     """
 
-    scores = infernal_output_parser(inf_output_file, ss_notation=ss_notation)
-
-    filename = os.path.basename(inf_output_file).partition('.')[0]
-    fp_out = open(os.path.join(dest_dir, filename + '.bed'), 'w')
-
-    for score in scores:
-        # write output to file
-        if score["strand"] == '+':
-            fp_out.write(
-                "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfamseq_acc"], score["start"], score["end"],
-                                                      score["rna_type"], score["bit_score"], score["strand"],
-                                                      score["e_value"], score["sec_struct"]))
-        else:
-            fp_out.write(
-                "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfamseq_acc"], score["end"], score["start"],
-                                                      score["rna_type"], score["bit_score"], score["strand"],
-                                                      score["e_value"], score["sec_struct"]))
-    fp_out.close()
+    infernal_to_formats(inf_output_file, ["bed"], dest_dir=dest_dir, input_format="out",
+                        ss_notation=ss_notation, processes=processes)
 
 # --------------------------------------------------------------------------------------------------
 
@@ -69,27 +76,219 @@ def infernal_output_parser(inf_output_file, ss_notation="wuss"):
     for each hit found in the file
 
     inf_output_file: Infernal's output file (-o)
-    dest_dir: The path to the output directory
     ss_notation: A string indicating the the notation in which to output the
     secondary structure string (wuss or dbn)
 
     return: A list of dictionaries
     """
 
-    rna_type = ''
-    ss_str_list = []
+    return list(infernal_hits(inf_output_file, ss_notation=ss_notation))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def infernal_hits(inf_output_file, ss_notation="wuss", processes=1, chunk_size=INF_CHUNK_SIZE):
+    """
+    Parses Infernal's detailed output file (-o) and yields a dictionary for each
+    hit found in the file, in the order the hits appear in the file.
+
+    With more than one process the file is split in byte ranges starting on a
+    hit (>>) or query (Query:) line, which are parsed in a process pool. At most
+    INF_CHUNKS_AHEAD ranges per process are parsed ahead of the one being
+    consumed, so that only the hits of those ranges are kept in memory when
+    the consumer is slower than the parsing. Compressed files can't be split
+    and are read in a single stream, decompressed with up to processes threads.
+
+    inf_output_file: Infernal's output file (-o), plain text, gzip or bgzip
+    ss_notation: A string indicating the the notation in which to output the
+    secondary structure string (wuss or dbn)
+    processes: The number of processes to parse the file with. Defaults to 1
+    chunk_size: The approximate size of each byte range in bytes
+
+    return: A generator of dictionaries
+    """
+
+    if processes is None or processes <= 1 or cio.is_compressed(inf_output_file):
+        fp_in = cio.open_input(inf_output_file, threads=processes)
+
+        for score in _parse_infernal_hits(iter(fp_in), ss_notation=ss_notation):
+            yield score
+
+        fp_in.close()
+
+    else:
+        num_chunks = max(processes, os.path.getsize(inf_output_file) // chunk_size)
+        chunks = [(inf_output_file, start, end, acc_offset, ss_notation) for (start, end, acc_offset)
+                  in split_infernal_output(inf_output_file, num_chunks)]
+
+        pool = multiprocessing.Pool(processes=processes)
+
+        try:
+            # a window of chunks is submitted and refilled as chunks are consumed,
+            # as imap would parse all chunks ahead and buffer their hits
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_parse_infernal_output_chunk, (chunk,)))
+
+                if len(pending) < processes * INF_CHUNKS_AHEAD:
+                    continue
 
-    scores = []
+                for score in pending.popleft().get():
+                    yield score
+
+            while len(pending) > 0:
+                for score in pending.popleft().get():
+                    yield score
+
+        finally:
+            pool.terminate()
+            pool.join()
+
+# --------------------------------------------------------------------------------------------------
+
+
+def split_infernal_output(inf_output_file, num_chunks):
+    """
+    Splits Infernal's detailed output file (-o) in up to num_chunks byte ranges.
+    Every range starts at the beginning of the file or on a line starting a new
+    hit (>>) or query (Query:), so that no hit spans two ranges.
+
+    inf_output_file: Infernal's output file (-o)
+    num_chunks: The number of ranges to split the file in
+
+    return: A list of (start, end, acc_offset) tuples where acc_offset is the
+    offset of the last Accession: line preceding start, or None if there is not one
+    """
+
+    file_size = os.path.getsize(inf_output_file)
+
+    if file_size == 0:
+        return []
+
+    fp_in = open(inf_output_file, 'rb')
+    inf_map = mmap.mmap(fp_in.fileno(), 0, access=mmap.ACCESS_READ)
+
+    offsets = [0]
+    for index in range(1, num_chunks):
+        position = max(offsets[-1], (file_size * index) // num_chunks)
+
+        # find the closest hit or query start past this position
+        boundaries = [x for x in (inf_map.find(b"\n>>", position), inf_map.find(b"\nQuery:", position))
+                      if x != -1]
+
+        if len(boundaries) == 0:
+            break
+
+        boundary = min(boundaries) + 1
+        if boundary > offsets[-1]:
+            offsets.append(boundary)
+
+    offsets.append(file_size)
+
+    chunks = []
+    for index in range(0, len(offsets) - 1):
+        acc_offset = inf_map.rfind(b"\nAccession:", 0, offsets[index])
+
+        if acc_offset == -1:
+            acc_offset = None
+        else:
+            acc_offset += 1
+
+        chunks.append((offsets[index], offsets[index + 1], acc_offset))
+
+    inf_map.close()
+    fp_in.close()
+
+    return chunks
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _parse_infernal_output_chunk(chunk):
+    """
+    Parses a byte range of Infernal's detailed output file as returned by
+    split_infernal_output. Used by the process pool in infernal_hits
 
-    fp_in = open(inf_output_file, 'r')
+    chunk: A (inf_output_file, start, end, acc_offset, ss_notation) tuple
 
-    line = fp_in.readline()
+    return: A list of dictionaries
+    """
+
+    (inf_output_file, start, end, acc_offset, ss_notation) = chunk
+
+    # binary, so that the offsets and the range length are counted in bytes
+    fp_in = open(inf_output_file, 'rb')
+
+    # the query accession the range starts in
     rfam_acc = ''
+    if acc_offset is not None:
+        fp_in.seek(acc_offset)
+        rfam_acc = _decode_line(fp_in.readline()).split()[1]
+
+    fp_in.seek(start)
+
+    scores = list(_parse_infernal_hits(_read_byte_range(fp_in, end - start),
+                                       rfam_acc=rfam_acc, ss_notation=ss_notation))
+
+    fp_in.close()
+
+    return scores
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _read_byte_range(fp_in, length):
+    """
+    Yields lines from the current position of fp_in until length bytes are read
+
+    fp_in: A file object opened in binary mode
+    length: The number of bytes to read
+    """
+
+    while length > 0:
+        line = fp_in.readline()
+
+        if not line:
+            break
+
+        length -= len(line)
+
+        yield _decode_line(line)
+
+
+def _decode_line(line):
+    # lines read in binary mode are already str in python 2
+    if str is bytes:
+        return line
+
+    return line.decode("utf-8")
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _parse_infernal_hits(lines, rfam_acc='', ss_notation="wuss"):
+    """
+    Parses the lines of Infernal's detailed output (-o) and yields a dictionary
+    for each hit
+
+    lines: An iterator over the lines to parse
+    rfam_acc: The query accession in case lines start within a query section
+    ss_notation: A string indicating the the notation in which to output the
+    secondary structure string (wuss or dbn)
+
+    return: A generator of dictionaries
+    """
+
+    rna_type = ''
+    ss_str_list = []
+
+    line = next(lines, '')
+
     while line != '':
 
         # look for a new hit section and fetch rfam_acc
         if line.find("Accession:") != -1:
-            rfam_acc = [x for x in line.strip().split(' ') if x != ''][1]
+            rfam_acc = line.split()[1]
 
         # new hit
         if line[0:2] == ">>":
@@ -100,34 +299,27 @@ def infernal_output_parser(inf_output_file, ss_notation="wuss"):
             # get hit region
             index = 0
             while index < 3:
-                line = fp_in.readline().strip()
+                line = next(lines, '').strip()
                 index += 1
 
             # bed file fields
-            score_line = [x for x in line.strip().split(' ') if x != '']
+            score_line = line.split()
             start = score_line[START]
             end = score_line[END]
-            strand = score_line[11]
-            e_value = score_line[2]
-            bit_score = score_line[3]
+            strand = score_line[STRAND]
+            e_value = score_line[EVAL]
+            bit_score = score_line[BSCORE]
             cm_start = score_line[6]
             cm_end = score_line[7]
-            raw_trunc = score_line[14]
-            truncated = ''
-
-            if raw_trunc == 'no' or raw_trunc == '-':
-                truncated = '0'
-            elif raw_trunc.find('&') != -1:
-                truncated = raw_trunc.replace('&', '').replace('\'', '')
-            else:
-                truncated = raw_trunc.replace('\'', '')
+            truncated = format_truncated(score_line[14])
 
             rfamseq_acc = seq_id.split(' ')[0].split('|')[-1]
 
-            # get secondary structure
-            line = fp_in.readline()
+            # get secondary structure, up to the next hit or query section
+            line = next(lines, '')
 
-            while line[0:2] != '>>' and line[0] != '#':
+            while (line != '' and line[0:2] != '>>' and line[0] != '#' and
+                    line[0:6] != "Query:"):
 
                 if line.find("CS") != -1:
                     line = line.strip()
@@ -136,217 +328,475 @@ def infernal_output_parser(inf_output_file, ss_notation="wuss"):
                     ss_str_list.append(ss_line)
 
                     if rna_type == '':  # 1st time we hit this
-                        line = fp_in.readline().strip()  # read next line
+                        line = next(lines, '').strip()  # read next line
                         rna_type = line.split(' ')[0].strip()
 
-                line = fp_in.readline()  # read the rest
+                line = next(lines, '')  # read the rest
 
             sec_struct = ''.join(ss_str_list)
 
             if ss_notation.lower() == "dbn":
-                sec_struct = convert_short_wuss_to_dbn(sec_struct)
+                sec_struct = su.wuss_to_dbn(sec_struct)
 
-            score_dict = {"rfam_acc": rfam_acc, "rfamseq_acc": rfamseq_acc, "start": start,
-                          "end": end, "bit_score": bit_score, "e_value": e_value,
-                          "strand": strand, "sec_struct": sec_struct, "rna_type": rna_type,
-                          "truncated": truncated, "cm_start": cm_start, "cm_end": cm_end,
-                          }
-
-            scores.append(score_dict)
+            yield {"rfam_acc": rfam_acc, "rfamseq_acc": rfamseq_acc, "start": start,
+                   "end": end, "bit_score": bit_score, "e_value": e_value,
+                   "strand": strand, "sec_struct": sec_struct, "rna_type": rna_type,
+                   "truncated": truncated, "cm_start": cm_start, "cm_end": cm_end,
+                   }
 
             ss_str_list = []
             rna_type = ''
 
         else:
-            line = fp_in.readline()
+            line = next(lines, '')
 
-    fp_in.close()
+# --------------------------------------------------------------------------------------------------
+
+
+def tblout_hits(tblout_file, use_cache=True):
+    """
+    Parses Infernal's tblout file in a single pass and yields a TbloutHit record
+    for every hit. Comment and blank lines are skipped. If the file has an up to
+    date binary cache (see load_tblout), hits are read from the cache instead of
+    parsing the text.
+
+    tblout_file: A valid Infernal's output file in .tblout format, plain text,
+    gzip or bgzip
+    use_cache: If True, read hits from a fresh cache when there is one
+
+    return: A generator of TbloutHit records
+    """
+
+    if use_cache:
+        try:
+            from utils import tblout_cache as tc
+
+        except ImportError:
+            # numpy is optional, without it files are always parsed
+            tc = None
+
+        if tc is not None and tc.is_fresh(tblout_file):
+            return _read_tblout_cache(tc.read_cache(tblout_file))
+
+    return _read_tblout_text(tblout_file)
+
+
+def _read_tblout_text(tblout_file):
+    # parses the hits of a tblout file
+    num_columns = len(TBLOUT_FIELDS)
+
+    with cio.open_input(tblout_file) as tblout_fp:
+        for line in tblout_fp:
+            if line[0] == '#':
+                continue
+
+            # description of target is the only column that may contain spaces
+            columns = line.rstrip().split(None, num_columns - 1)
+
+            if len(columns) == num_columns:
+                yield TbloutHit._make(columns)
+
+            # tolerate a missing description column
+            elif len(columns) == num_columns - 1:
+                columns.append('-')
+                yield TbloutHit._make(columns)
 
-    return scores
+
+def _read_tblout_cache(hits, block_size=100000):
+    # converts cached hits back to TbloutHit records of strings, as parsed from
+    # the text. Blocks are converted a column at a time, as tolist on a column
+    # is much faster than converting the array per hit
+    for start in range(0, len(hits), block_size):
+        block = hits[start:start + block_size]
+
+        columns = []
+        for field in block.dtype.names:
+            column = block[field].tolist()
+
+            if block.dtype[field].kind != 'S':
+                column = [str(x) for x in column]
+            elif str is not bytes:
+                column = [x.decode("utf-8") for x in column]
+
+            columns.append(column)
+
+        for record in zip(*columns):
+            yield TbloutHit._make(record)
 
 # --------------------------------------------------------------------------------------------------
 
 
-def infernal_to_rfam(inf_tblout_file, dest_dir, file_format='tsv'):
+def load_tblout(tblout_file, use_cache=True, mmap=True):
     """
-    Parses Infernal's output file and exports results in Rfam's genome full region format
-    (tsv option is used by default)
+    Loads all hits of a tblout file in a NumPy structured array with a field per
+    tblout column. Coordinate columns are stored as integers and all others as
+    the byte strings found in the file. A binary cache is written next to the
+    tblout file on first load and is reused while the size and modification
+    time of the tblout file are unchanged. Once written, tblout_hits and the
+    converters read the cache instead of parsing the file. Requires numpy.
 
-    inf_tblout_file: Infernal's output file in tabular format
-    format: This is an option whether to output results in  tabular format or create a json file
+    tblout_file: A valid Infernal's output file in .tblout format
+    use_cache: If True, load hits from a fresh cache or create one
+    mmap: If True the cache is memory mapped read only instead of loaded in
+    memory
+
+    return: A NumPy structured array with a record per hit
     """
 
-    in_file = open(inf_tblout_file, 'r')
-    filename = os.path.basename(inf_tblout_file).partition('.')[0]
+    from utils import tblout_cache as tc
 
-    out_file = None
-    if file_format == "tsv":
-        out_file = open(os.path.join(dest_dir, filename + ".tsv"), 'w')
-    else:
-        out_file = open(os.path.join(dest_dir, filename + ".json"), 'w')
+    if not use_cache:
+        return tc.build_hits(tblout_file, TBLOUT_FIELDS, _read_tblout_text)
 
-    upid = filename
-    is_significant = 1  # always the same before clan competition
-    #seq_type = "null"
-    seq_type = "full" # set all to full until we update seed sequences
+    if not tc.is_fresh(tblout_file):
+        try:
+            tc.write_cache(tblout_file, TBLOUT_FIELDS, _read_tblout_text)
 
-    line = in_file.readline().strip()
+        except (IOError, OSError):
+            # e.g. read only directory
+            sys.stderr.write("Unable to write cache for %s\n" % tblout_file)
+            return tc.build_hits(tblout_file, TBLOUT_FIELDS, _read_tblout_text)
 
-    while line != '':
-        if line[0] != '#':
-            line = line.split(' ')
-            line_cont = [x for x in line if x != '']
-
-            genseq_acc = line_cont[2].split('|') # could also be position 0 for cmsearch
-            genseq_acc = genseq_acc[len(genseq_acc) - 1]  # get last field
-            rfam_acc = line_cont[1] # 1 or 3 for cmscan
-            cm_start = line_cont[5]
-            cm_end = line_cont[6]
-            seq_start = line_cont[7]
-            seq_end = line_cont[8]
-
-            trunc = line_cont[10].replace('\'', '')
-            if trunc == "no" or trunc == '-':
-                trunc = str(0)
-
-            elif trunc.find('&') != -1:
-                trunc = trunc.replace('&', '')
-
-            bit_score = line_cont[14]
-            evalue = line_cont[15]
-
-            out_file.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (rfam_acc, genseq_acc,
-                                                                                 upid, seq_start,
-                                                                                 seq_end, bit_score,
-                                                                                 evalue, cm_start,
-                                                                                 cm_end, trunc,
-                                                                                 seq_type, is_significant))
-            line = in_file.readline().strip()
+    return tc.read_cache(tblout_file, mmap=mmap)
 
-        else:
-            line = in_file.readline().strip()
+# --------------------------------------------------------------------------------------------------
 
-    in_file.close()
-    out_file.close()
 
+def format_truncated(trunc):
+    """
+    Converts Infernal's trunc column to the truncated value stored in full_region
+
+    trunc: The trunc value as reported by Infernal (no, 5', 3', 5'&3', -)
+
+    return: A string with the full_region truncated value (0, 5, 3, 53)
+    """
+
+    trunc = trunc.replace('\'', '')
+
+    if trunc == "no" or trunc == '-':
+        return '0'
+
+    return trunc.replace('&', '')
 
 # --------------------------------------------------------------------------------------------------
 
 
-def tblout_to_full_region(tblout_file, dest_dir=None):
+def tblout_scores(tblout_file, program="cmsearch", use_cache=True):
     """
-    Parses Infernal's tblout file and generates a .txt file that is compatible with full_region
-    table.
+    Parses Infernal's tblout file and yields a dictionary for each hit with the
+    same fields as the ones returned by infernal_hits. The secondary structure
+    is not available in tblout format and is left empty.
 
     tblout_file: A valid Infernal's output file in .tblout format
-    dest_dir: The path to the output directory
+    program: The Infernal program that generated the file (cmsearch or cmscan).
+    cmsearch reports the sequences as targets, cmscan reports the models
+    use_cache: If True, read hits from a fresh cache when there is one (see
+    tblout_hits)
 
-    return: True if successful, False otherwise
+    return: A generator of dictionaries
     """
 
-    tblout_fp = open(tblout_file, 'r')
-    filename = os.path.split(tblout_file)[1].partition('.')[0]
+    cmscan = program == "cmscan"
+
+    for hit in tblout_hits(tblout_file, use_cache=use_cache):
+        if cmscan:
+            seq_name, rfam_acc, rna_type = hit.query_name, hit.target_acc, hit.target_name
+        else:
+            seq_name, rfam_acc, rna_type = hit.target_name, hit.query_acc, hit.query_name
+
+        yield {"rfam_acc": rfam_acc, "rfamseq_acc": seq_name.split('|')[-1],
+               "start": hit.seq_from, "end": hit.seq_to, "bit_score": hit.score,
+               "e_value": hit.evalue, "strand": hit.strand, "sec_struct": '',
+               "rna_type": rna_type, "truncated": format_truncated(hit.trunc),
+               "cm_start": hit.mdl_from, "cm_end": hit.mdl_to}
+
+# --------------------------------------------------------------------------------------------------
+
+
+def infernal_to_formats(infernal_file, formats, dest_dir=None, filename=None, input_format="tblout",
+                        program="cmsearch", ss_notation="wuss", processes=1, compression=None,
+                        compresslevel=cio.DEFAULT_COMPRESSLEVEL, threads=1, cache=False):
+    """
+    Parses Infernal's output once and writes every hit to each of the requested
+    output formats, so that all files of a genome are generated in a single pass.
+
+    infernal_file: Infernal's output file in tabular (--tblout) or detailed (-o) format.
+    Gzip and bgzip compressed files are detected automatically
+    formats: A list of output formats as registered in HIT_WRITERS (full_region, tsv,
+    json, bed, pdb_full_region). Append .gz to a format to gzip the output file
+    dest_dir: The path to the output directory. Defaults to the input file directory
+    filename: A filename for the outputs. Defaults to the input file name
+    input_format: The format of infernal_file (tblout or out)
+    program: The Infernal program that generated a tblout file (cmsearch or cmscan)
+    ss_notation: The secondary structure notation of bed files (wuss or dbn)
+    processes: The number of processes to parse detailed output with (see infernal_hits)
+    compression: Compress all output files with gzip or bgzip. Defaults to None
+    compresslevel: The compression level of compressed output files (1-9)
+    threads: The number of threads to compress each output file with
+    cache: For tblout input, write or refresh the binary cache of the file first
+    (see load_tblout), so that this and later conversions of the file read the
+    cache instead of parsing the text. An existing fresh cache is always used
+
+    return: A list with the paths to the output files
+    """
 
     if dest_dir is None:
-        dest_dir = os.path.split(tblout_file)[0]
-        #filename = os.path.split(tblout_file)[1].partition('.')[0]
+        dest_dir = os.path.split(infernal_file)[0]
+
+    if filename is None:
+        filename = os.path.basename(infernal_file).partition('.')[0]
 
-    full_region_fp = open(os.path.join(dest_dir, filename+'.txt'), 'w')
+    writers = []
+    for file_format in formats:
+        format_compression = compression
+        if file_format.endswith(".gz"):
+            file_format = file_format[:-3]
+            format_compression = compression or cio.GZIP
 
-    # set to 1 on update and correct with clan competition
-    is_significant = 1
+        if file_format not in HIT_WRITERS:
+            raise ValueError("Unknown output format: %s" % file_format)
 
-    # set all to full until we update seed sequences
-    seq_type = "full"
+        writers.append(HIT_WRITERS[file_format](dest_dir, filename, compression=format_compression,
+                                                compresslevel=compresslevel, threads=threads))
 
-    line = tblout_fp.readline().strip()
+    if input_format == "tblout":
+        if cache:
+            load_tblout(infernal_file)
 
-    while line != '':
-        # skip comment lines
-        if str(line[0]) != '#':
-            line = line.split(' ')
-            line_cont = [x for x in line if x != '']
-            if len(line_cont) > 1:
-                seq_acc = ''
-                if line[0].find('|') != -1:
-                        seq_acc = line_cont[0].split('|')  # could also be position 0 for cmsearch
-                        seq_acc = seq_acc[-1]  # get last field
-                else:
-                        seq_acc = line[0].strip()
-
-                rfam_acc = line_cont[3]  # 1 or 3 for cmscan
-                cm_start = line_cont[5]
-                cm_end = line_cont[6]
-                seq_start = line_cont[7]
-                seq_end = line_cont[8]
-
-                trunc = line_cont[10].replace('\'', '')
-                if trunc == "no" or trunc == '-':
-                        trunc = str(0)
-
-                elif trunc.find('&') != -1:
-                        trunc = trunc.replace('&', '')
-
-                bit_score = line_cont[14]
-                evalue = line_cont[15]
-
-                full_region_fp.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (rfam_acc,
-                                                                                   seq_acc,
-                                                                                   seq_start,
-                                                                                   seq_end,
-                                                                                   bit_score,
-                                                                                   evalue,
-                                                                                   cm_start,
-                                                                                   cm_end,
-                                                                                   trunc,
-                                                                                   seq_type,
-                                                                                   str(is_significant)))
-            line = tblout_fp.readline().strip()
+        scores = tblout_scores(infernal_file, program=program)
+    else:
+        scores = infernal_hits(infernal_file, ss_notation=ss_notation, processes=processes)
 
-        else:
-            line = tblout_fp.readline().strip()
+    for score in scores:
+        for writer in writers:
+            writer.write(score)
 
-    tblout_fp.close()
-    full_region_fp.close()
+    for writer in writers:
+        writer.close()
 
+    return [writer.path for writer in writers]
 
 # --------------------------------------------------------------------------------------------------
 
 
-def infernal_to_full_region(inf_output_file, dest_dir, filename=None):
+def infernal_to_rfam(inf_tblout_file, dest_dir, file_format='tsv', compression=None,
+                     compresslevel=cio.DEFAULT_COMPRESSLEVEL, threads=1):
+    """
+    Parses Infernal's output file and exports results in Rfam's genome full region format
+    (tsv option is used by default)
+
+    inf_tblout_file: Infernal's output file in tabular format, plain text, gzip or bgzip
+    format: This is an option whether to output results in  tabular format or create a json file
+    compression: Compress the output file with gzip or bgzip. Defaults to None
+    compresslevel: The compression level of the output file (1-9)
+    threads: The number of threads to compress the output file with
+    """
+
+    if file_format != "tsv":
+        file_format = "json"
+
+    infernal_to_formats(inf_tblout_file, [file_format], dest_dir=dest_dir, program="cmscan",
+                        compression=compression, compresslevel=compresslevel, threads=threads)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def tblout_to_full_region(tblout_file, dest_dir=None, compression=None,
+                          compresslevel=cio.DEFAULT_COMPRESSLEVEL, threads=1, cache=False):
+    """
+    Parses Infernal's tblout file and generates a .txt file that is compatible with full_region
+    table.
+
+    tblout_file: A valid Infernal's output file in .tblout format, plain text, gzip or bgzip
+    dest_dir: The path to the output directory
+    compression: Compress the output file with gzip or bgzip. Defaults to None
+    compresslevel: The compression level of the output file (1-9)
+    threads: The number of threads to compress the output file with
+    cache: Write or refresh the binary cache of the tblout file first (see
+    infernal_to_formats)
+
+    return: True if successful, False otherwise
+    """
+
+    infernal_to_formats(tblout_file, ["full_region"], dest_dir=dest_dir, program="cmsearch",
+                        compression=compression, compresslevel=compresslevel, threads=threads,
+                        cache=cache)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def infernal_to_full_region(inf_output_file, dest_dir, filename=None, processes=1, compression=None,
+                            compresslevel=cio.DEFAULT_COMPRESSLEVEL, threads=1):
     """
     Parses Inferna's detailed output (-o option) and generates a file in tabular format, which is
     compatible with the full_region table
 
-    inf_output_file: Infernal's output file (-o option)
+    inf_output_file: Infernal's output file (-o option), plain text, gzip or bgzip
     dest_dir: The path to the output directory
     filename: A filename for the output
+    processes: The number of processes to parse the file with (see infernal_hits)
+    compression: Compress the output file with gzip or bgzip. Defaults to None
+    compresslevel: The compression level of the output file (1-9)
+    threads: The number of threads to compress the output file with
 
     returns: Void
     """
 
-    scores = infernal_output_parser(inf_output_file, ss_notation="wuss")
+    infernal_to_formats(inf_output_file, ["full_region"], dest_dir=dest_dir, filename=filename,
+                        input_format="out", processes=processes, compression=compression,
+                        compresslevel=compresslevel, threads=threads)
 
-    if dest_dir is None:
-        dest_dir = os.path.split(inf_output_file)[0]
 
-    if filename is None:
-        filename = os.path.basename(inf_output_file).partition('.')[0]
+# --------------------------------------------------------------------------------------------------
 
-    fp_out = open(os.path.join(dest_dir, filename + '.txt'), 'w')
 
-    for score in scores:
-        fp_out.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfam_acc"],
-                                                                       score["rfamseq_acc"],
-                                                                       score["start"],
-                                                                       score["end"],
-                                                                       score["bit_score"],
-                                                                       score["e_value"],
-                                                                       score["cm_start"],
-                                                                       score["cm_end"],
-                                                                       score["truncated"],
-                                                                       "full", '1'))
-    fp_out.close()
+class HitWriter(object):
+    """
+    Writes the hits returned by infernal_hits and tblout_scores to an output file.
+    Subclasses implement format_hit and are registered in HIT_WRITERS
+    """
+
+    extension = ".txt"
+
+    def __init__(self, dest_dir, filename, compression=None, compresslevel=cio.DEFAULT_COMPRESSLEVEL,
+                 threads=1):
+        """
+        dest_dir: The path to the output directory
+        filename: The name of the Infernal file the hits come from (e.g. upid)
+        compression: None for a plain text file, gzip or bgzip
+        compresslevel: The compression level (1-9)
+        threads: The number of threads to compress the output file with
+        """
+
+        self.filename = filename
+        self.path = os.path.join(dest_dir, self.output_filename(filename))
+
+        if compression is not None:
+            self.path += ".gz"
+
+        self.fp_out = cio.open_output(self.path, compression=compression,
+                                      compresslevel=compresslevel, threads=threads)
+
+    def output_filename(self, filename):
+        return filename + self.extension
+
+    def format_hit(self, score):
+        raise NotImplementedError
+
+    def write(self, score):
+        self.fp_out.write(self.format_hit(score))
+
+    def close(self):
+        self.fp_out.close()
+
+
+class FullRegionWriter(HitWriter):
+    """
+    full_region table dump
+    """
+
+    def format_hit(self, score):
+        # full until we update seed sequences, significant until clan competition
+        return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfam_acc"],
+                                                                score["rfamseq_acc"],
+                                                                score["start"],
+                                                                score["end"],
+                                                                score["bit_score"],
+                                                                score["e_value"],
+                                                                score["cm_start"],
+                                                                score["cm_end"],
+                                                                score["truncated"],
+                                                                "full", '1')
+
+
+class GenomeTsvWriter(HitWriter):
+    """
+    Rfam's genome full region format, with the file name as the genome upid
+    """
+
+    extension = ".tsv"
+
+    def format_hit(self, score):
+        return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfam_acc"],
+                                                                    score["rfamseq_acc"],
+                                                                    self.filename,
+                                                                    score["start"],
+                                                                    score["end"],
+                                                                    score["bit_score"],
+                                                                    score["e_value"],
+                                                                    score["cm_start"],
+                                                                    score["cm_end"],
+                                                                    score["truncated"],
+                                                                    "full", '1')
+
+
+class GenomeJsonWriter(GenomeTsvWriter):
+    """
+    Same as GenomeTsvWriter with a .json extension
+    """
+
+    extension = ".json"
+
+
+class BedDetailWriter(HitWriter):
+    """
+    bed file in detailed format with the secondary structure in the last column
+    """
+
+    extension = ".bed"
+
+    def format_hit(self, score):
+        # bed coordinates go from the lowest to the highest
+        if score["strand"] == '+':
+            start, end = score["start"], score["end"]
+        else:
+            start, end = score["end"], score["start"]
+
+        return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (score["rfamseq_acc"], start, end,
+                                                      score["rna_type"], score["bit_score"],
+                                                      score["strand"], score["e_value"],
+                                                      score["sec_struct"])
+
+
+class PdbFullRegionWriter(HitWriter):
+    """
+    pdb_full_region table dump, with sequence names in the form of pdbid_chain
+    """
+
+    def __init__(self, dest_dir, filename, **kwargs):
+        # Rfam website hex colour, one for all regions in the file
+        self.hex_colour = random.choice(PDB_HEX_COLOURS)
+        HitWriter.__init__(self, dest_dir, filename, **kwargs)
+
+    def output_filename(self, filename):
+        # mark the date the file has been generated
+        return "pdb_full_region_" + str(datetime.date.today()) + self.extension
+
+    def format_hit(self, score):
+        pdb_info = score["rfamseq_acc"].partition('_')
+
+        return '\t'.join((score["rfam_acc"], pdb_info[0], pdb_info[2],
+                          score["start"], score["end"], score["bit_score"],
+                          score["e_value"], score["cm_start"], score["cm_end"],
+                          self.hex_colour, '1')) + '\n'
+
+
+HIT_WRITERS = {"full_region": FullRegionWriter, "tsv": GenomeTsvWriter,
+               "json": GenomeJsonWriter, "bed": BedDetailWriter,
+               "pdb_full_region": PdbFullRegionWriter}
+
+
+def register_hit_writer(file_format, writer_class):
+    """
+    Makes a new output format available to infernal_to_formats
+
+    file_format: The name of the output format
+    writer_class: A HitWriter subclass
+    """
+
+    HIT_WRITERS[file_format] = writer_class
 
 
 # --------------------------------------------------------------------------------------------------
@@ -359,10 +809,7 @@ def convert_short_wuss_to_dbn(ss_string):
     ss_string: Secondary structure string
     """
 
-    for regex in DBN_REGEX.keys():
-        ss_string = re.sub(regex, DBN_REGEX[regex], ss_string)
-
-    return ss_string
+    return su.wuss_to_dbn(ss_string)
 
 
 # --------------------------------------------------------------------------------------------------
@@ -0,0 +1,588 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Bulk import of table dumps with LOAD DATA LOCAL INFILE. Dumps
+             are loaded in chunks of CHUNK_SIZE rows, each in its own
+             transaction, and progress is recorded in a state file next to
+             the dump so that an interrupted load resumes after the last
+             committed chunk. Supported dumps are those generated by
+             infernal_utils.tblout_to_full_region (.txt), fasta2rfamseq
+             (.rfamseq) and rfamseq2genseq (.genseq), plain or gzipped.
+
+Usage: Use scripts/processing/load_table_dumps.py
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import timeit
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from utils import RfamDB
+from utils import compressed_io as cio
+
+# --------------------------------------------------------------------------------------------------
+
+# dump columns in file order
+TABLE_COLUMNS = {"full_region": ("rfam_acc", "rfamseq_acc", "seq_start", "seq_end", "bit_score",
+                                 "evalue_score", "cm_start", "cm_end", "truncated", "type",
+                                 "is_significant"),
+                 "rfamseq": ("rfamseq_acc", "accession", "version", "ncbi_id", "mol_type", "length",
+                             "description", "previous_acc", "source"),
+                 "genseq": ("upid", "rfamseq_acc")}
+
+# dump file extensions and the tables they are loaded to
+FILE_TABLES = {".txt": "full_region", ".rfamseq": "rfamseq", ".genseq": "genseq"}
+
+CHUNK_SIZE = 1000000  # rows loaded per transaction
+STATE_EXTENSION = ".load.json"
+INDEX_STATE_EXTENSION = ".indexes.json"
+
+# --------------------------------------------------------------------------------------------------
+
+
+def table_for_file(dump_file):
+    """
+    Returns the table a dump file is loaded to based on its extension
+
+    dump_file: The path to a .txt, .rfamseq or .genseq dump, optionally
+    ending in .gz
+
+    return: A table name from TABLE_COLUMNS
+    """
+
+    filename = dump_file[:-3] if dump_file.endswith(".gz") else dump_file
+    extension = os.path.splitext(filename)[1]
+
+    if extension not in FILE_TABLES:
+        raise ValueError("Unknown dump type %s. Provide the table name" % dump_file)
+
+    return FILE_TABLES[extension]
+
+# --------------------------------------------------------------------------------------------------
+
+
+def state_path(dump_file):
+    """
+    Returns the path to the load state file of a dump file
+    """
+
+    return dump_file + STATE_EXTENSION
+
+# --------------------------------------------------------------------------------------------------
+
+
+def source_signature(dump_file):
+    """
+    Returns the size and modification time of a dump file, which the load
+    state is validated against
+    """
+
+    file_stat = os.stat(dump_file)
+
+    return {"size": file_stat.st_size, "mtime": file_stat.st_mtime}
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_state(dump_file, table, chunk_size, restart=False):
+    """
+    Reads the load state of a dump file, or creates a new one
+
+    dump_file: The path to the dump file
+    table: The table the dump is loaded to
+    chunk_size: The number of rows loaded per transaction
+    restart: If True any previous state is discarded
+
+    return: A dictionary with the load state
+    """
+
+    state = {"table": table, "chunk_size": chunk_size, "source": source_signature(dump_file),
+             "chunks_loaded": 0, "rows_read": 0, "rows_loaded": 0, "table_rows_before": None,
+             "complete": False}
+
+    if not os.path.exists(state_path(dump_file)):
+        return state
+
+    fp = open(state_path(dump_file), 'r')
+    previous_state = json.load(fp)
+    fp.close()
+
+    if restart is True:
+        return state
+
+    for key in ("table", "chunk_size", "source"):
+        if previous_state.get(key) != state[key]:
+            raise ValueError("%s does not match the previous load of %s. "
+                             "Restart the load to discard it" % (key, dump_file))
+
+    return previous_state
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_state(path, state):
+    """
+    Writes a state file, replacing the previous one only once it has been
+    written in full
+    """
+
+    tmp_state = path + ".tmp"
+
+    fp = open(tmp_state, 'w')
+    json.dump(state, fp)
+    fp.close()
+
+    os.rename(tmp_state, path)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def iter_chunks(dump_file, chunk_size, skip_rows=0):
+    """
+    Reads a dump file in chunks of rows. Empty lines are ignored
+
+    dump_file: The path to a plain text or gzipped dump file
+    chunk_size: The number of rows per chunk
+    skip_rows: The number of rows at the start of the file to skip, as loaded
+    by a previous run
+
+    return: A generator of lists of lines
+    """
+
+    fp_in = cio.open_input(dump_file)
+
+    chunk = []
+    num_rows = 0
+    for line in fp_in:
+        if line.strip() == '':
+            continue
+
+        num_rows += 1
+        if num_rows <= skip_rows:
+            continue
+
+        chunk.append(line if line.endswith('\n') else line + '\n')
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    fp_in.close()
+
+    if len(chunk) > 0:
+        yield chunk
+
+# --------------------------------------------------------------------------------------------------
+
+
+def fetch_secondary_indexes(cursor, table):
+    """
+    Fetches the non unique secondary indexes of a table
+
+    cursor: A cursor on the target database
+    table: The table name
+
+    return: A list of dictionaries with the name and the columns of each index
+    """
+
+    query = ("SELECT index_name, column_name, sub_part "
+             "FROM information_schema.statistics "
+             "WHERE table_schema=DATABASE() AND table_name=%s "
+             "AND index_name != 'PRIMARY' AND non_unique=1 "
+             "ORDER BY index_name, seq_in_index")
+
+    cursor.execute(query, (table,))
+
+    indexes = []
+    for (index_name, column_name, sub_part) in cursor.fetchall():
+        column = "`%s`" % column_name
+        if sub_part is not None:
+            column += "(%d)" % sub_part
+
+        if len(indexes) == 0 or indexes[-1]["name"] != index_name:
+            indexes.append({"name": index_name, "columns": []})
+
+        indexes[-1]["columns"].append(column)
+
+    return indexes
+
+# --------------------------------------------------------------------------------------------------
+
+
+def drop_indexes(cursor, table, indexes):
+    """
+    Drops the secondary indexes of a table. Indexes foreign keys depend on
+    can't be dropped and are kept
+
+    cursor: A cursor on the target database
+    table: The table name
+    indexes: A list of indexes as returned by fetch_secondary_indexes
+
+    return: The list of the indexes dropped
+    """
+
+    dropped = []
+    for index in indexes:
+        try:
+            cursor.execute("ALTER TABLE `%s` DROP INDEX `%s`" % (table, index["name"]))
+            dropped.append(index)
+
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_DROP_INDEX_FK:
+                raise
+
+            print ("Keeping index %s needed in a foreign key constraint" % index["name"])
+
+    return dropped
+
+# --------------------------------------------------------------------------------------------------
+
+
+def create_indexes(cursor, table, indexes):
+    """
+    Rebuilds dropped secondary indexes with a single ALTER TABLE, so that the
+    table is scanned once
+
+    cursor: A cursor on the target database
+    table: The table name
+    indexes: A list of indexes as returned by fetch_secondary_indexes
+
+    return: void
+    """
+
+    if len(indexes) == 0:
+        return
+
+    add_clauses = ["ADD INDEX `%s` (%s)" % (x["name"], ', '.join(x["columns"])) for x in indexes]
+
+    cursor.execute("ALTER TABLE `%s` %s" % (table, ", ".join(add_clauses)))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def count_table_rows(cursor, table):
+    """
+    Returns the number of rows in a table
+    """
+
+    cursor.execute("SELECT COUNT(*) FROM `%s`" % table)
+
+    return cursor.fetchone()[0]
+
+# --------------------------------------------------------------------------------------------------
+
+
+def load_chunk(cursor, table, chunk, tmp_dir=None):
+    """
+    Loads a chunk of dump lines to a table with LOAD DATA LOCAL INFILE. The
+    transaction is left open for the caller to commit
+
+    cursor: A cursor on a connection opened with allow_local_infile=True
+    table: The table name
+    chunk: A list of tab separated lines
+    tmp_dir: The directory to write the chunk file to. Defaults to the system
+    temporary directory
+
+    return: The number of rows loaded
+    """
+
+    query = ("LOAD DATA LOCAL INFILE %%s INTO TABLE `%s` "
+             "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)") % (
+        table, ', '.join(TABLE_COLUMNS[table]))
+
+    (fd, chunk_file) = tempfile.mkstemp(suffix=".tsv", prefix=table + "_", dir=tmp_dir)
+
+    try:
+        fp_out = os.fdopen(fd, 'w')
+        fp_out.writelines(chunk)
+        fp_out.close()
+
+        cursor.execute(query, (chunk_file,))
+
+    finally:
+        os.remove(chunk_file)
+
+    return cursor.rowcount
+
+# --------------------------------------------------------------------------------------------------
+
+
+def disable_indexes(table, index_state_file):
+    """
+    Drops the secondary indexes of a table before a bulk load. Their
+    definitions are saved to index_state_file so that they can be rebuilt
+    with enable_indexes, also after an interrupted load. If the file already
+    exists the indexes have been dropped by a previous run and are left as is
+
+    table: The table name
+    index_state_file: The path to the file to save the index definitions to
+
+    return: void
+    """
+
+    if os.path.exists(index_state_file):
+        return
+
+    cnx = RfamDB.connect()
+    cursor = cnx.cursor(buffered=True)
+
+    try:
+        indexes = fetch_secondary_indexes(cursor, table)
+
+        # saved before dropping, enable_indexes only rebuilds missing indexes
+        write_state(index_state_file, {"table": table, "indexes": indexes})
+
+        dropped = drop_indexes(cursor, table, indexes)
+
+    finally:
+        cursor.close()
+        RfamDB.disconnect(cnx)
+
+    print ("%d indexes dropped from %s" % (len(dropped), table))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def enable_indexes(index_state_file):
+    """
+    Rebuilds the indexes dropped by disable_indexes that are missing from the
+    table and deletes their state file
+
+    index_state_file: The path to the file the index definitions were saved to
+
+    return: void
+    """
+
+    if not os.path.exists(index_state_file):
+        return
+
+    fp = open(index_state_file, 'r')
+    index_state = json.load(fp)
+    fp.close()
+
+    cnx = RfamDB.connect()
+    cursor = cnx.cursor(buffered=True)
+
+    try:
+        index_start = timeit.default_timer()
+
+        existing = set([x["name"] for x in fetch_secondary_indexes(cursor, index_state["table"])])
+        missing = [x for x in index_state["indexes"] if x["name"] not in existing]
+
+        create_indexes(cursor, index_state["table"], missing)
+
+    finally:
+        cursor.close()
+        RfamDB.disconnect(cnx)
+
+    os.remove(index_state_file)
+
+    print ("%d indexes rebuilt on %s in %.1fs" % (len(missing), index_state["table"],
+                                                  timeit.default_timer() - index_start))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def commit_pending_chunk(state):
+    """
+    Adds the chunk pending commit to the rows loaded of a load state
+    """
+
+    pending_chunk = state.pop("pending_chunk")
+
+    state["chunks_loaded"] += 1
+    state["rows_read"] += pending_chunk["rows_read"]
+    state["rows_loaded"] += pending_chunk["rows_loaded"]
+
+
+def resolve_pending_chunk(cursor, state):
+    """
+    Decides whether the chunk pending commit when a previous load stopped was
+    committed, by comparing the number of rows in the table with the numbers
+    expected with and without the chunk. Like verify_load, this relies on
+    nothing else writing to the table
+
+    cursor: A cursor on the target database
+    state: The load state of the interrupted load
+
+    return: void
+    """
+
+    table_rows = count_table_rows(cursor, state["table"])
+    rows_without_chunk = state["table_rows_before"] + state["rows_loaded"]
+
+    if table_rows == rows_without_chunk:
+        # rolled back, the chunk is loaded again
+        del state["pending_chunk"]
+
+    elif table_rows == rows_without_chunk + state["pending_chunk"]["rows_loaded"]:
+        print ("Chunk %d was committed before the load stopped" % (state["chunks_loaded"] + 1))
+        commit_pending_chunk(state)
+
+    else:
+        raise ValueError("%s has %d rows, expected %d before the last chunk. Unable to tell "
+                         "whether it was committed. Restart the load" % (
+                             state["table"], table_rows, rows_without_chunk))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def load_dump(dump_file, table=None, chunk_size=CHUNK_SIZE, disable_checks=False, verify=True,
+              restart=False, tmp_dir=None):
+    """
+    Loads a dump file to its table in chunks of chunk_size rows, resuming
+    after the last chunk committed by a previous run
+
+    dump_file: The path to a .txt, .rfamseq or .genseq dump, plain or gzipped
+    table: The table to load the dump to. Guessed from the file extension if
+    None
+    chunk_size: The number of rows loaded per transaction
+    disable_checks: If True disable unique and foreign key checks during the
+    load
+    verify: If True compare the number of rows in the file with the number of
+    rows loaded and the increase in table rows
+    restart: If True ignore any previous load of the file
+    tmp_dir: The directory to write chunk files to
+
+    return: A dictionary with the load state and, if verified, the result of
+    the verification under "verified". The result is saved with the state. A
+    rerun on a loaded file returns it, and reports files that failed or missed
+    verification as failed
+    """
+
+    if table is None:
+        table = table_for_file(dump_file)
+
+    if table not in TABLE_COLUMNS:
+        raise ValueError("Unsupported table %s" % table)
+
+    state = read_state(dump_file, table, chunk_size, restart=restart)
+
+    if state["complete"] is True:
+        print ("%s has already been loaded to %s" % (dump_file, table))
+
+        # the table may have changed since, e.g. with the next dumps loaded, so
+        # files that failed or missed verification are not verified again
+        if verify is True and state.get("verified") is not True:
+            print ("%s was not verified after its load. Restart the load to "
+                   "reload it" % dump_file)
+            state["verified"] = False
+
+        return state
+
+    cnx = RfamDB.connect(allow_local_infile=True)
+    cursor = cnx.cursor()
+
+    try:
+        if disable_checks is True:
+            cursor.execute("SET SESSION unique_checks=0")
+            cursor.execute("SET SESSION foreign_key_checks=0")
+
+        if state["table_rows_before"] is None:
+            state["table_rows_before"] = count_table_rows(cursor, table)
+            write_state(state_path(dump_file), state)
+
+        else:
+            if state.get("pending_chunk") is not None:
+                resolve_pending_chunk(cursor, state)
+                write_state(state_path(dump_file), state)
+
+            print ("Resuming %s after %d rows" % (dump_file, state["rows_read"]))
+
+        load_start = timeit.default_timer()
+        rows_this_run = 0
+
+        for chunk in iter_chunks(dump_file, chunk_size, skip_rows=state["rows_read"]):
+            chunk_start = timeit.default_timer()
+
+            try:
+                num_rows = load_chunk(cursor, table, chunk, tmp_dir=tmp_dir)
+
+                # recorded before the commit, so that a rerun after a crash
+                # between the two can tell whether the chunk was committed
+                state["pending_chunk"] = {"rows_read": len(chunk), "rows_loaded": num_rows}
+                write_state(state_path(dump_file), state)
+
+                cnx.commit()
+
+            except:
+                cnx.rollback()
+                raise
+
+            # recorded right after the commit, so a rerun starts at the next chunk
+            commit_pending_chunk(state)
+            write_state(state_path(dump_file), state)
+
+            rows_this_run += len(chunk)
+            elapsed = timeit.default_timer() - load_start
+            print ("chunk %d: %d rows in %.1fs, %d rows total at %d rows/s" % (
+                state["chunks_loaded"], num_rows, timeit.default_timer() - chunk_start,
+                state["rows_loaded"], rows_this_run / max(elapsed, 1e-6)))
+
+        state["complete"] = True
+        write_state(state_path(dump_file), state)
+
+        if verify is True:
+            state["verified"] = verify_load(cursor, state)
+            write_state(state_path(dump_file), state)
+
+    finally:
+        cursor.close()
+        RfamDB.disconnect(cnx)
+
+    return state
+
+# --------------------------------------------------------------------------------------------------
+
+
+def verify_load(cursor, state):
+    """
+    Checks that all rows of a dump have been loaded. The table row count is
+    only expected to match if nothing else writes to the table during the
+    load
+
+    cursor: A cursor on the target database
+    state: The load state returned by load_dump
+
+    return: True if the row counts match, False otherwise
+    """
+
+    table_rows = count_table_rows(cursor, state["table"])
+    table_increase = table_rows - state["table_rows_before"]
+
+    verified = True
+    if state["rows_loaded"] != state["rows_read"]:
+        print ("%d rows in file, but %d rows loaded" % (state["rows_read"], state["rows_loaded"]))
+        verified = False
+
+    if table_increase != state["rows_loaded"]:
+        print ("%d rows loaded, but %s has %d more rows" % (state["rows_loaded"], state["table"],
+                                                             table_increase))
+        verified = False
+
+    if verified is True:
+        print ("Verified %d rows in %s" % (state["rows_loaded"], state["table"]))
+
+    return verified
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
@@ -18,6 +18,11 @@ Modifications: - name_object passed as param to Node's method get_linage
 import os
 import sys
 
+try:
+    intern
+except NameError:
+    from sys import intern
+
 # ----------------------------------------------------------------------------
 
 
@@ -134,3 +139,71 @@ def read_ncbi_taxonomy_nodes(name_dict, nodes_dmp):
     return name_object
 
 # -----------------------------------------------------------------------------
+
+
+class LineageCache:
+    """
+    Memoised lineages of the nodes of an NCBI taxonomy tree. Lineages are
+    tuples of interned tax ids, from leaf to root as returned by
+    Node.get_lineage, and are built on top of the cached lineage of the first
+    cached ancestor, so that the tree is only walked once per node
+    """
+
+    def __init__(self, name_object):
+        self.name_object = name_object
+        self.lineages = {}
+
+    def get_lineage(self, tax_id):
+        """
+        Returns the lineage of a tax id as a tuple, which is empty if the tax
+        id is not in the tree
+        """
+        if tax_id in self.lineages:
+            return self.lineages[tax_id]
+
+        path = []      # nodes without a cached lineage, from leaf up
+        lineage = ()   # the lineage above them
+
+        node_id = tax_id
+        while 1:
+            if node_id in self.lineages:
+                lineage = self.lineages[node_id]
+                break
+            if node_id not in self.name_object:
+                break
+            path.append(node_id)
+            node_id = self.name_object[node_id].parent
+            if node_id == "1":
+                # the root ends every lineage
+                lineage = (intern("1"),)
+                break
+
+        for node_id in reversed(path):
+            lineage = (intern(node_id),) + lineage
+            self.lineages[node_id] = lineage
+
+        if tax_id not in self.lineages:
+            self.lineages[tax_id] = lineage
+
+        return lineage
+
+# -----------------------------------------------------------------------------
+
+_lineage_cache = None
+
+
+def get_lineage_cache(name_object):
+    """
+    Returns the lineage cache of a taxonomy tree, creating it on first use.
+    The cache is kept for the tree last requested
+
+    name_object: NCBI taxonomy nodes returned by read_ncbi_taxonomy_nodes
+    """
+    global _lineage_cache
+
+    if _lineage_cache is None or _lineage_cache.name_object is not name_object:
+        _lineage_cache = LineageCache(name_object)
+
+    return _lineage_cache
+
+# -----------------------------------------------------------------------------
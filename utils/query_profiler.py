@@ -0,0 +1,394 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Opt-in query instrumentation for RfamDB connections. Queries are
+             grouped by normalised SQL, with literals and parameters replaced
+             by ?, and for each statement the number of calls, the total and
+             maximum latency and the number of rows are recorded. Latency
+             covers execute and all fetches of a query, so unbuffered reads
+             are timed in full. A summary is written at process exit, either
+             as a table on stderr or to a JSON file, and queries slower than
+             a threshold can be logged as they complete.
+
+             Forked multiprocessing children, e.g. pool workers, write their
+             own summary when they exit normally. Pool workers only exit
+             normally when the pool is closed and joined. Workers stopped
+             with Pool.terminate, or processes killed by a signal, write no
+             summary.
+
+Usage: Set RFAM_DB_PROFILE to 1 for a summary on stderr or to the path of a
+       JSON file, and optionally RFAM_DB_SLOW_QUERY to a number of seconds to
+       log slow queries. Alternatively call
+       RfamDB.enable_profiling(json_file=None, slow_query_time=None)
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import re
+import sys
+import timeit
+from multiprocessing import util as mp_util
+
+# --------------------------------------------------------------------------------------------------
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+PARAMETER = re.compile(r"%\(\w+\)s|%s")
+VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+SUMMARY_SIZE = 50  # number of statements in the stderr summary
+
+# priority of the summary among multiprocessing's exit finalizers. Finalizers
+# with higher priorities run first, and pools and queues use none or 0
+EXIT_PRIORITY = 10
+
+# --------------------------------------------------------------------------------------------------
+
+
+def normalise_sql(query):
+    """
+    Normalises a query so that executions differing only in their values are
+    grouped together
+
+    query: An SQL statement
+
+    return: The statement with literals and parameters replaced by ?, value
+    lists collapsed to (...) and whitespace collapsed to single spaces
+    """
+
+    if isinstance(query, bytes) and not isinstance(query, str):
+        query = query.decode("utf-8", "replace")
+
+    query = STRING_LITERAL.sub("?", query)
+    query = PARAMETER.sub("?", query)
+    query = NUMBER_LITERAL.sub("?", query)
+    query = VALUE_LIST.sub("(...)", query)
+
+    return WHITESPACE.sub(" ", query).strip()
+
+# --------------------------------------------------------------------------------------------------
+
+
+class QueryProfile(object):
+    """
+    Statistics of the queries run by a process
+    """
+
+    def __init__(self, slow_query_time=None, log=sys.stderr):
+        """
+        slow_query_time: Log queries taking longer than this many seconds. None
+        disables the slow query log
+        log: A file object slow queries are logged to
+        """
+
+        self.slow_query_time = slow_query_time
+        self.log = log
+        self.statements = {}
+
+    def record(self, query, elapsed, num_rows):
+        """
+        Adds an execution of a query to the statistics of its statement
+
+        query: The SQL statement as executed
+        elapsed: The time taken by the query in seconds
+        num_rows: The number of rows returned or affected by the query
+        """
+
+        statement = normalise_sql(query)
+
+        if statement not in self.statements:
+            self.statements[statement] = {"calls": 0, "total_time": 0.0, "max_time": 0.0,
+                                          "rows": 0}
+
+        stats = self.statements[statement]
+        stats["calls"] += 1
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        stats["rows"] += max(num_rows, 0)
+
+        if self.slow_query_time is not None and elapsed >= self.slow_query_time:
+            self.log.write("Slow query (%.3fs, %d rows): %s\n" % (elapsed, num_rows,
+                                                                   WHITESPACE.sub(" ", query).strip()))
+
+    def summary(self):
+        """
+        Returns the statement statistics sorted by total time, slowest first
+        """
+
+        statements = []
+        for (statement, stats) in self.statements.items():
+            entry = dict(stats)
+            entry["statement"] = statement
+            statements.append(entry)
+
+        return sorted(statements, key=lambda x: x["total_time"], reverse=True)
+
+    def write_json(self, json_file):
+        """
+        Writes the statement statistics to a JSON file
+        """
+
+        fp_out = open(json_file, 'w')
+        json.dump(self.summary(), fp_out, indent=2)
+        fp_out.close()
+
+    def write_table(self, fp_out=sys.stderr, limit=SUMMARY_SIZE):
+        """
+        Writes the statistics of the slowest statements as a table
+        """
+
+        statements = self.summary()
+        total_time = sum([x["total_time"] for x in statements])
+
+        fp_out.write("\nQuery profile: %d statements, %d calls, %.2fs\n" % (
+            len(statements), sum([x["calls"] for x in statements]), total_time))
+        fp_out.write("%10s %8s %10s %10s %12s  %s\n" % ("total(s)", "%", "calls", "max(s)", "rows",
+                                                        "statement"))
+
+        for stats in statements[:limit]:
+            fp_out.write("%10.2f %8.1f %10d %10.3f %12d  %s\n" % (
+                stats["total_time"], 100.0 * stats["total_time"] / max(total_time, 1e-9),
+                stats["calls"], stats["max_time"], stats["rows"], stats["statement"][:200]))
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ProfiledCursor(object):
+    """
+    A cursor wrapper timing each query from execute until the next query is
+    executed or the cursor is closed, and counting the rows fetched
+    """
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._query = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        # records the previous query of the cursor, if any
+        if self._query is not None:
+            rows = self._rows
+            if rows == 0 and self._cursor.rowcount is not None:
+                # rows affected by statements that return no result set
+                rows = self._cursor.rowcount
+
+            self._profile.record(self._query, self._elapsed, rows)
+            self._query = None
+
+    def _timed(self, method, *args, **kwargs):
+        start = timeit.default_timer()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._elapsed += timeit.default_timer() - start
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._finish()
+        self._query = operation
+        self._elapsed = 0.0
+        self._rows = 0
+
+        return self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._finish()
+        self._query = operation
+        self._elapsed = 0.0
+        self._rows = 0
+
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed(self._cursor.fetchmany, *args, **kwargs)
+        self._rows += len(rows)
+
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+
+        return rows
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __del__(self):
+        # cursors that are never closed
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ProfiledConnection(object):
+    """
+    A connection wrapper returning profiled cursors
+    """
+
+    def __init__(self, cnx, profile):
+        self._cnx = cnx
+        self._profile = profile
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self._cnx.cursor(*args, **kwargs), self._profile)
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+# --------------------------------------------------------------------------------------------------
+
+# the profile of this process, if profiling is enabled
+_profile = None
+_profile_pid = None
+_json_file = None
+_summary_pid = None  # the process the summary was last written by
+
+
+def enable(json_file=None, slow_query_time=None):
+    """
+    Enables query profiling in this process and registers writing the summary
+    at exit, in this process and in the multiprocessing children forked from it
+
+    json_file: A path to write the summary to in JSON format. If None a table
+    is written to stderr. Processes other than the one profiling was enabled
+    in write to json_file.<pid>
+    slow_query_time: Log queries taking at least this many seconds to stderr
+
+    return: The QueryProfile object
+    """
+
+    global _profile, _profile_pid, _json_file
+
+    if _profile is None:
+        atexit.register(_write_summary)
+
+        # multiprocessing children exit with os._exit, skipping atexit handlers,
+        # but run the finalizers registered in them
+        mp_util.register_after_fork(_write_summary, _register_finalizer)
+
+    _profile = QueryProfile(slow_query_time=slow_query_time)
+    _profile_pid = os.getpid()
+    _json_file = json_file
+
+    return _profile
+
+
+def enable_from_environment():
+    """
+    Enables profiling if RFAM_DB_PROFILE is set. Its value is either 1 for a
+    summary on stderr or a JSON file path. RFAM_DB_SLOW_QUERY sets the slow
+    query threshold in seconds
+    """
+
+    setting = os.environ.get("RFAM_DB_PROFILE")
+    if not setting:
+        return
+
+    slow_query_time = os.environ.get("RFAM_DB_SLOW_QUERY")
+    if slow_query_time:
+        slow_query_time = float(slow_query_time)
+    else:
+        slow_query_time = None
+
+    enable(json_file=None if setting == "1" else setting, slow_query_time=slow_query_time)
+
+
+def get_profile():
+    """
+    Returns the QueryProfile of this process, or None if profiling is disabled
+    """
+
+    return _profile
+
+
+def wrap(cnx):
+    """
+    Wraps a connection so that its queries are profiled, if profiling is
+    enabled
+    """
+
+    if _profile is None or cnx is None:
+        return cnx
+
+    return ProfiledConnection(cnx, _profile)
+
+
+def _register_finalizer(write_summary):
+    # after fork handler, run in each multiprocessing child
+    global _profile
+
+    if _profile is None:
+        return
+
+    # children start with an empty profile, so that their summaries don't
+    # repeat the queries the parent ran before forking
+    _profile = QueryProfile(slow_query_time=_profile.slow_query_time, log=_profile.log)
+
+    mp_util.Finalize(None, write_summary, exitpriority=EXIT_PRIORITY)
+
+
+def _write_summary():
+    # exit handler
+    global _summary_pid
+
+    if _profile is None or len(_profile.statements) == 0:
+        return
+
+    # processes forked with os.fork from a multiprocessing child inherit its
+    # finalizer as well as the atexit handler, and run both at exit
+    if _summary_pid == os.getpid():
+        return
+
+    _summary_pid = os.getpid()
+
+    if _json_file is None:
+        _profile.write_table()
+
+    elif os.getpid() != _profile_pid:
+        _profile.write_json("%s.%d" % (_json_file, os.getpid()))
+
+    else:
+        _profile.write_json(_json_file)
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
@@ -37,26 +37,13 @@ def fetch_seed_regions():
     """
     Fetches all seed_region entries
 
-    return: A list of tuples with all seed_region entries
+    return: A generator of tuples with all seed_region entries, streamed from
+    the server
     """
 
-    # connect to db
-    cnx = RfamDB.connect()
-
-    # get a new buffered cursor
-    cursor = cnx.cursor(buffered=True)
-
-    # update is_significant field to 0
     query = ("Select rfam_acc, rfamseq_acc, seq_start, seq_end "
              "from seed_region")
 
-    cursor.execute(query)
-
-    seed_region_rows = cursor.fetchall()
-
-    cursor.close()
-    RfamDB.disconnect(cnx)
-
-    return seed_region_rows
+    return RfamDB.stream(query)
 
 # -------------------------------------------------------------------------
\ No newline at end of file
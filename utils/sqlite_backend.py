@@ -0,0 +1,544 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: An SQLite stand-in for the rfam_live MySQL database, so that the
+             database code can be run and timed without a MySQL server. The
+             schema is built from the Django models in rfam_schemas/RfamLive,
+             and connections behave like mysql.connector connections: queries
+             use %s parameters and the MySQL statements used by db_utils
+             (e.g. UPDATE ... JOIN ... SET) are rewritten for SQLite.
+
+             The backend is selected with RfamDB.use_sqlite(path) or the
+             RFAM_DB_SQLITE environment variable. See
+             scripts/support/synthetic_rfam_db.py to populate a database.
+
+Usage: python sqlite_backend.py <database file>
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import ast
+import datetime
+import os
+import re
+import sqlite3
+import sys
+
+# --------------------------------------------------------------------------------------------------
+
+MODELS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "rfam_schemas", "RfamLive", "models.py")
+
+# Django field classes and the SQLite types their columns are created with.
+# DATETIME columns are declared TIMESTAMP so that they are read as datetime
+# objects, as with MySQL
+SQLITE_TYPES = {"AutoField": "INTEGER", "BigIntegerField": "INTEGER", "IntegerField": "INTEGER",
+                "SmallIntegerField": "INTEGER", "FloatField": "REAL", "DecimalField": "NUMERIC",
+                "CharField": "VARCHAR(%d)", "TextField": "TEXT", "DateTimeField": "TIMESTAMP"}
+
+# tables and columns of rfam_live that models.py doesn't describe, as
+# {table: [(column, type), ...]}. Columns of tables in models.py are added to
+# the table
+SCHEMA_EXTRAS = {"genseq": [("version", "VARCHAR(6)")],
+                 "pdb_full_region": [("is_significant", "INTEGER NOT NULL DEFAULT 1")],
+                 "version": [("rfam_release", "REAL"), ("rfam_release_date", "TIMESTAMP"),
+                             ("number_families", "INTEGER"), ("embl_release", "TEXT")],
+                 "author": [("author_id", "INTEGER PRIMARY KEY"), ("name", "VARCHAR(100)"),
+                            ("last_name", "VARCHAR(50)"), ("initials", "VARCHAR(4)"),
+                            ("orcid", "VARCHAR(19)"), ("synonyms", "VARCHAR(100)")],
+                 "family_author": [("rfam_acc", "VARCHAR(7)"), ("author_id", "INTEGER"),
+                                   ("desc_order", "INTEGER")],
+                 "pseudoknot": [("rfam_acc", "VARCHAR(7)"), ("pseudoknot_id", "VARCHAR(50)"),
+                                ("source", "VARCHAR(6)"), ("covariation", "INTEGER")]}
+
+# secondary indexes of rfam_live that don't follow from models.py
+EXTRA_INDEXES = {"genseq": ("upid",), "family_author": ("rfam_acc",),
+                 "pseudoknot": ("rfam_acc",)}
+
+QUERY_CACHE_SIZE = 1000  # translated queries kept per process
+
+PARAMETER = re.compile(r"%\((\w+)\)s|%s")
+CREATE_TEMPORARY_SELECT = re.compile(r"^(\s*create\s+temporary\s+table\s+\w+\s+)(select\b)",
+                                     re.I)
+DROP_TEMPORARY = re.compile(r"^(\s*drop\s+)temporary\s+", re.I)
+UPDATE_JOIN = re.compile(r"^\s*update\s+(\w+)\s+(?:as\s+)?(\w+)\s+((?:left\s+|inner\s+)?join)\s+",
+                         re.I)
+UPDATE_JOIN_REST = re.compile(r"^\s*(?:as\s+)?(\w+)\s+on\s+(.*?)\s+set\s+(.*?)"
+                              r"(?:\s+where\s+(.*?))?\s*;?\s*$", re.I | re.S)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _literal(node):
+    # the value of a literal in models.py, or the name of a model
+    try:
+        return ast.literal_eval(node)
+
+    except ValueError:
+        return node.id
+
+
+def parse_models(models_file=MODELS_FILE):
+    """
+    Reads the tables of a Django models module without importing it, so that
+    Django isn't needed
+
+    models_file: The path to a models.py file
+
+    return: A list of dictionaries with the table name, its columns as a
+    list of (column, field class, field arguments) tuples, the columns of its
+    fields by field name, its primary key column and unique_together
+    constraints, in the order of the models
+    """
+
+    fp_in = open(models_file, 'r')
+    tree = ast.parse(fp_in.read())
+    fp_in.close()
+
+    models = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        model = {"model": node.name, "table": node.name.lower(), "columns": [],
+                 "fields": {}, "primary_key": None, "unique_together": ()}
+
+        for statement in node.body:
+            if isinstance(statement, ast.ClassDef) and statement.name == "Meta":
+                for meta in statement.body:
+                    if isinstance(meta, ast.Assign) and meta.targets[0].id == "db_table":
+                        model["table"] = _literal(meta.value)
+                    elif isinstance(meta, ast.Assign) and meta.targets[0].id == "unique_together":
+                        model["unique_together"] = _literal(meta.value)
+
+            elif (isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Call) and
+                  isinstance(statement.value.func, ast.Attribute)):
+                field_class = statement.value.func.attr
+                args = dict([(x.arg, _literal(x.value)) for x in statement.value.keywords])
+
+                if field_class == "ForeignKey":
+                    args["to"] = _literal(statement.value.args[0])
+
+                # Django appends _id to foreign key columns without a db_column
+                column = statement.targets[0].id
+                if "db_column" in args:
+                    column = args["db_column"]
+                elif field_class == "ForeignKey":
+                    column += "_id"
+
+                model["columns"].append((column, field_class, args))
+                model["fields"][statement.targets[0].id] = column
+                if args.get("primary_key") is True:
+                    model["primary_key"] = column
+
+        if len(model["columns"]) > 0:
+            models.append(model)
+
+    return models
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _column_type(field_class, args, models_by_name):
+    # the SQLite type of a column. Foreign keys take the type of the key they reference
+    if field_class == "ForeignKey":
+        target = models_by_name.get(args["to"])
+        if target is None or target["primary_key"] is None:
+            return "INTEGER"
+
+        for (column, target_class, target_args) in target["columns"]:
+            if column == target["primary_key"]:
+                return _column_type(target_class, target_args, models_by_name)
+
+    sqlite_type = SQLITE_TYPES.get(field_class, "TEXT")
+    if "%d" in sqlite_type:
+        sqlite_type = sqlite_type % args.get("max_length", 255)
+
+    return sqlite_type
+
+
+def create_schema(cnx, models_file=MODELS_FILE):
+    """
+    Creates the tables of the models, along with SCHEMA_EXTRAS, and the
+    indexes MySQL would have for their keys. Models without a primary key
+    get none; SQLite rowids identify their rows
+
+    cnx: A sqlite3 connection
+    models_file: The path to a models.py file
+
+    return: A list of the tables created
+    """
+
+    models = parse_models(models_file)
+    models_by_name = dict([(x["model"], x) for x in models])
+
+    tables = []
+    for model in models:
+        columns = []
+        indexes = []
+        for (column, field_class, args) in model["columns"]:
+            definition = "\"%s\" %s" % (column, _column_type(field_class, args, models_by_name))
+
+            if column == model["primary_key"]:
+                definition += " PRIMARY KEY"
+            elif args.get("null") is not True:
+                definition += " NOT NULL"
+
+            if args.get("unique") is True and column != model["primary_key"]:
+                definition += " UNIQUE"
+
+            columns.append(definition)
+
+            # InnoDB indexes foreign key columns
+            if field_class == "ForeignKey" and args.get("unique") is not True:
+                indexes.append((column,))
+
+        for (column, column_type) in SCHEMA_EXTRAS.get(model["table"], []):
+            columns.append("\"%s\" %s" % (column, column_type))
+
+        for unique_columns in model["unique_together"]:
+            columns.append("UNIQUE (%s)" % ', '.join([model["fields"][x] for x in unique_columns]))
+
+        cnx.execute("CREATE TABLE \"%s\" (%s)" % (model["table"], ", ".join(columns)))
+
+        for (index, index_columns) in enumerate(indexes):
+            cnx.execute("CREATE INDEX \"%s_%d\" ON \"%s\" (%s)" % (model["table"], index,
+                                                                 model["table"],
+                                                                 ', '.join(index_columns)))
+        tables.append(model["table"])
+
+    for table in sorted(SCHEMA_EXTRAS.keys()):
+        if table not in tables:
+            columns = ["\"%s\" %s" % x for x in SCHEMA_EXTRAS[table]]
+            cnx.execute("CREATE TABLE \"%s\" (%s)" % (table, ", ".join(columns)))
+            tables.append(table)
+
+    for table in sorted(EXTRA_INDEXES.keys()):
+        for column in EXTRA_INDEXES[table]:
+            cnx.execute("CREATE INDEX \"%s_%s\" ON \"%s\" (%s)" % (table, column, table, column))
+
+    cnx.commit()
+
+    return tables
+
+
+def create_database(path, models_file=MODELS_FILE):
+    """
+    Creates a new, empty database file with the rfam_live schema
+
+    path: The path of the database file. Must not exist
+    models_file: The path to a models.py file
+
+    return: void
+    """
+
+    if os.path.exists(path):
+        raise IOError("Database file %s already exists" % path)
+
+    cnx = sqlite3.connect(path)
+    create_schema(cnx, models_file)
+    cnx.close()
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _split_joined_table(query):
+    # splits the joined table, or a parenthesised derived table, off the start of query
+    query = query.lstrip()
+
+    if not query.startswith("("):
+        match = re.match(r"\w+", query)
+        return query[:match.end()], query[match.end():]
+
+    depth = 0
+    for (index, char) in enumerate(query):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                break
+
+    return query[:index + 1], query[index + 1:]
+
+
+def _translate_update_join(query):
+    """
+    Rewrites a MySQL UPDATE with a JOIN to SQLite's UPDATE ... FROM. An inner
+    join becomes a FROM of the joined table. For a left join, the updated
+    table is left joined to the joined table in a derived table, under the
+    alias of the joined table, and matched to the updated rows by rowid, so
+    that rows without a match are updated too
+    """
+
+    match = UPDATE_JOIN.match(query)
+    if match is None:
+        return query
+
+    (table, alias, join) = match.groups()
+    (joined_table, rest) = _split_joined_table(query[match.end():])
+
+    match = UPDATE_JOIN_REST.match(rest)
+    if match is None:
+        return query
+
+    (joined_alias, condition, assignments, where) = match.groups()
+
+    # SQLite doesn't allow qualified columns on the left of SET
+    assignments = re.sub(r"(^|,)(\s*)%s\.(\w+)(\s*=)" % alias, r"\1\2\3\4", assignments)
+
+    if join.lower().startswith("left"):
+        self_alias = alias + "__self"
+        condition = re.sub(r"\b%s\." % alias, self_alias + ".", condition)
+
+        query = ("UPDATE %s AS %s SET %s FROM (SELECT %s.rowid AS update_rowid, %s.* FROM %s AS %s "
+                 "LEFT JOIN %s AS %s ON %s) AS %s WHERE %s.update_rowid=%s.rowid" % (
+                     table, alias, assignments, self_alias, joined_alias, table, self_alias,
+                     joined_table, joined_alias, condition, joined_alias, joined_alias, alias))
+    else:
+        query = ("UPDATE %s AS %s SET %s FROM %s AS %s WHERE %s" % (table, alias, assignments,
+                                                                   joined_table, joined_alias,
+                                                                   condition))
+
+    if where is not None:
+        query += " AND (%s)" % where
+
+    return query
+
+
+_translations = {}
+
+
+def translate_query(query, parameters=True):
+    """
+    Translates a MySQL statement, as run through mysql.connector, to SQLite
+
+    query: An SQL statement
+    parameters: True if the statement is executed with parameters, in which
+    case %s and %(name)s placeholders are replaced by ? and :name
+
+    return: The SQLite statement
+    """
+
+    key = (query, parameters)
+    if key in _translations:
+        return _translations[key]
+
+    sqlite_query = query
+    if parameters is True:
+        sqlite_query = PARAMETER.sub(lambda x: ":" + x.group(1) if x.group(1) else "?",
+                                     sqlite_query)
+
+    sqlite_query = CREATE_TEMPORARY_SELECT.sub(r"\1AS \2", sqlite_query)
+    sqlite_query = DROP_TEMPORARY.sub(r"\1", sqlite_query)
+    sqlite_query = _translate_update_join(sqlite_query)
+
+    if len(_translations) >= QUERY_CACHE_SIZE:
+        _translations.clear()
+
+    _translations[key] = sqlite_query
+
+    return sqlite_query
+
+# --------------------------------------------------------------------------------------------------
+
+
+def _concat(*args):
+    # MySQL CONCAT, which returns NULL if any argument is NULL
+    if None in args:
+        return None
+
+    return ''.join([x if isinstance(x, type(u'')) else str(x) for x in args])
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+# --------------------------------------------------------------------------------------------------
+
+
+class SQLiteCursor(object):
+    """
+    A sqlite3 cursor with the interface of a mysql.connector cursor. Buffered
+    cursors fetch all rows on execute, so that rowcount is the number of rows
+    of a query, and dictionary cursors return rows as dictionaries. Other
+    mysql.connector cursor arguments (raw, prepared) are accepted and ignored
+    """
+
+    def __init__(self, cnx, buffered=False, dictionary=False, **cursor_args):
+        self._cnx = cnx
+        self._cursor = cnx.cursor()
+        self._buffered = buffered
+        self._dictionary = dictionary
+        self._rows = None
+        self._index = 0
+        self.rowcount = -1
+        self.statement = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        if self._cursor.description is None:
+            return ()
+
+        return tuple([x[0] for x in self._cursor.description])
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+
+        return dict(zip(self.column_names, row))
+
+    def execute(self, operation, params=None, multi=False):
+        self.statement = operation
+        self._cursor.execute(translate_query(operation, params is not None),
+                             params if params is not None else ())
+
+        self._rows = None
+        self._index = 0
+        if self.with_rows:
+            self.rowcount = 0
+            if self._buffered:
+                self._rows = self._cursor.fetchall()
+                self.rowcount = len(self._rows)
+        else:
+            self.rowcount = self._cursor.rowcount
+
+    def executemany(self, operation, seq_params):
+        self.statement = operation
+        self._cursor.executemany(translate_query(operation, True), seq_params)
+        self._rows = None
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        if self._rows is not None:
+            if self._index == len(self._rows):
+                return None
+
+            self._index += 1
+            return self._row(self._rows[self._index - 1])
+
+        row = self._cursor.fetchone()
+        if row is not None:
+            self.rowcount += 1
+
+        return self._row(row)
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            rows = self._rows[self._index:self._index + size]
+            self._index += len(rows)
+        else:
+            rows = self._cursor.fetchmany(size)
+            self.rowcount += len(rows)
+
+        return [self._row(x) for x in rows]
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows = self._rows[self._index:]
+            self._index = len(self._rows)
+        else:
+            rows = self._cursor.fetchall()
+            self.rowcount += len(rows)
+
+        return [self._row(x) for x in rows]
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def close(self):
+        self._cursor.close()
+        return True
+
+# --------------------------------------------------------------------------------------------------
+
+
+class SQLiteConnection(object):
+    """
+    A sqlite3 connection with the interface of a mysql.connector connection
+    """
+
+    def __init__(self, path, autocommit=False, **connection_args):
+        """
+        path: The path to a database created with create_database
+        autocommit: If True statements are committed as they run
+        connection_args: Other mysql.connector arguments, which are ignored
+        """
+
+        if not os.path.exists(path):
+            raise IOError("Database file %s does not exist" % path)
+
+        self._cnx = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._cnx.create_function("concat", -1, _concat)
+        self._cnx.create_function("now", 0, _now)
+
+        self.autocommit = autocommit
+        if autocommit is True:
+            self._cnx.isolation_level = None
+
+        self.unread_result = False
+
+    def cursor(self, **cursor_args):
+        return SQLiteCursor(self._cnx, **cursor_args)
+
+    def commit(self):
+        self._cnx.commit()
+
+    def rollback(self):
+        self._cnx.rollback()
+
+    def consume_results(self):
+        pass
+
+    def is_connected(self):
+        return self._cnx is not None
+
+    def close(self):
+        if self._cnx is not None:
+            self._cnx.close()
+            self._cnx = None
+
+# --------------------------------------------------------------------------------------------------
+
+
+def connect(path, **connection_args):
+    """
+    Returns a connection to an SQLite database, see SQLiteConnection
+    """
+
+    return SQLiteConnection(path, **connection_args)
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python sqlite_backend.py <database file>")
+
+    create_database(sys.argv[1])
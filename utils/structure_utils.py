@@ -0,0 +1,147 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: Conversions between RNA secondary structure notations (WUSS,
+             dot-bracket) and base pair tables
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import string
+
+try:
+    maketrans = str.maketrans
+except AttributeError:
+    maketrans = string.maketrans
+
+# --------------------------------------------------------------------------------------------------
+
+WUSS_OPEN = "([{<"
+WUSS_CLOSE = ")]}>"
+WUSS_UNPAIRED = "_-.,~:"
+
+# shorthand WUSS to dot-bracket translation table. Any other characters (e.g.
+# pseudoknot annotation) are left unchanged
+WUSS_DBN_TABLE = maketrans(WUSS_OPEN + WUSS_CLOSE + WUSS_UNPAIRED,
+                           '(' * len(WUSS_OPEN) + ')' * len(WUSS_CLOSE) + '.' * len(WUSS_UNPAIRED))
+
+UNPAIRED = -1
+
+# --------------------------------------------------------------------------------------------------
+
+
+def wuss_to_dbn(ss_string):
+    """
+    Converts RNA structure string from shorthand WUSS notation to dot-bracket
+    notation in a single pass
+
+    ss_string: Secondary structure string in WUSS notation
+
+    return: The structure string in dot-bracket notation
+    """
+
+    return ss_string.translate(WUSS_DBN_TABLE)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def batch_wuss_to_dbn(ss_strings):
+    """
+    Converts a list of RNA structure strings from shorthand WUSS notation to
+    dot-bracket notation, translating all strings with a single call
+
+    ss_strings: A list of secondary structure strings in WUSS notation
+
+    return: A list of structure strings in dot-bracket notation
+    """
+
+    if len(ss_strings) == 0:
+        return []
+
+    # new lines are not structure characters and are not translated
+    return '\n'.join(ss_strings).translate(WUSS_DBN_TABLE).split('\n')
+
+# --------------------------------------------------------------------------------------------------
+
+
+def pair_table(ss_string):
+    """
+    Computes the base pair table of a WUSS or dot-bracket structure string. Each
+    bracket type is matched on its own stack and pseudoknots annotated as
+    upper/lower case letter pairs (e.g. AAA...aaa) are matched as well.
+
+    ss_string: Secondary structure string in WUSS or dot-bracket notation
+
+    return: A list with the index of the pairing partner of every position, or
+    UNPAIRED (-1) for unpaired positions
+    """
+
+    pairs = [UNPAIRED] * len(ss_string)
+    stacks = {}
+
+    for index, symbol in enumerate(ss_string):
+        if symbol in WUSS_OPEN or symbol.isupper():
+            stacks.setdefault(symbol, []).append(index)
+
+        elif symbol in WUSS_CLOSE or symbol.islower():
+            if symbol in WUSS_CLOSE:
+                opening = WUSS_OPEN[WUSS_CLOSE.index(symbol)]
+            else:
+                opening = symbol.upper()
+
+            stack = stacks.get(opening)
+
+            if not stack:
+                raise ValueError("Unbalanced structure: no opening pair for %s at %d" % (symbol, index))
+
+            partner = stack.pop()
+            pairs[index] = partner
+            pairs[partner] = index
+
+    for symbol in stacks.keys():
+        if len(stacks[symbol]) > 0:
+            raise ValueError("Unbalanced structure: no closing pair for %s at %d" % (symbol, stacks[symbol][-1]))
+
+    return pairs
+
+# --------------------------------------------------------------------------------------------------
+
+
+def dbn_from_pair_table(pairs):
+    """
+    Converts a base pair table, as returned by pair_table, to a dot-bracket
+    string. Pseudoknots are not represented and are written as nested pairs
+
+    pairs: A list with the index of the pairing partner of every position
+
+    return: A structure string in dot-bracket notation
+    """
+
+    symbols = []
+
+    for index, partner in enumerate(pairs):
+        if partner == UNPAIRED:
+            symbols.append('.')
+        elif partner > index:
+            symbols.append('(')
+        else:
+            symbols.append(')')
+
+    return ''.join(symbols)
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
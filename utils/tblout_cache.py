@@ -0,0 +1,280 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: A binary cache of parsed Infernal tblout files. Hits are stored
+             as a NumPy structured array (.npy) next to the tblout file along
+             with the size and modification time of the source, and are
+             loaded back with memory mapping while the source is unchanged.
+
+Usage: Use infernal_utils.load_tblout rather than calling this module directly.
+       infernal_utils.tblout_hits reads a fresh cache transparently
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import json
+import os
+
+import numpy as np
+
+# --------------------------------------------------------------------------------------------------
+
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".cache.npy"
+META_EXTENSION = ".cache.json"
+
+# numeric tblout columns. All other columns are stored as the strings found in
+# the file so that they convert back unchanged
+INT_FIELDS = ("mdl_from", "mdl_to", "seq_from", "seq_to", "pass_num")
+
+BLOCK_SIZE = 100000  # number of hits written to the cache at a time
+
+# --------------------------------------------------------------------------------------------------
+
+
+def cache_path(tblout_file):
+    """
+    Returns the path to the cache file of a tblout file
+    """
+
+    return tblout_file + CACHE_EXTENSION
+
+# --------------------------------------------------------------------------------------------------
+
+
+def meta_path(tblout_file):
+    """
+    Returns the path to the metadata file of a tblout cache
+    """
+
+    return tblout_file + META_EXTENSION
+
+# --------------------------------------------------------------------------------------------------
+
+
+def source_signature(tblout_file):
+    """
+    Returns the signature the cache of a tblout file is validated against
+
+    tblout_file: A valid Infernal's output file in .tblout format
+
+    return: A dictionary with the cache version and the size and modification
+    time of the tblout file
+    """
+
+    file_stat = os.stat(tblout_file)
+
+    return {"version": CACHE_VERSION, "size": file_stat.st_size,
+            "mtime": file_stat.st_mtime}
+
+# --------------------------------------------------------------------------------------------------
+
+
+def is_fresh(tblout_file):
+    """
+    Checks if a tblout file has a cache that is up to date with the source file
+
+    tblout_file: A valid Infernal's output file in .tblout format
+
+    return: True if the cache can be used, False otherwise
+    """
+
+    if not os.path.exists(cache_path(tblout_file)) or not os.path.exists(meta_path(tblout_file)):
+        return False
+
+    try:
+        fp = open(meta_path(tblout_file), 'r')
+        signature = json.load(fp)
+        fp.close()
+
+    except ValueError:
+        return False
+
+    return signature == source_signature(tblout_file)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def hit_dtype(fields, string_widths):
+    """
+    Builds the NumPy dtype of the cached hits
+
+    fields: The tblout field names in file order
+    string_widths: A dictionary with the maximum length of every string field
+
+    return: A numpy.dtype object
+    """
+
+    dtype = []
+    for field in fields:
+        if field in INT_FIELDS:
+            dtype.append((field, "<i8"))
+        else:
+            dtype.append((field, "S%d" % max(string_widths[field], 1)))
+
+    return np.dtype(dtype)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def scan_hits(tblout_file, fields, hit_reader):
+    """
+    Counts the hits of a tblout file and builds the dtype that fits them
+
+    tblout_file: A valid Infernal's output file in .tblout format
+    fields: The tblout field names in file order
+    hit_reader: A function returning an iterator of hit tuples for tblout_file
+
+    return: A tuple with the number of hits and the numpy.dtype of the cache
+    """
+
+    string_widths = dict([(field, 0) for field in fields if field not in INT_FIELDS])
+    string_indices = [(index, field) for (index, field) in enumerate(fields)
+                      if field not in INT_FIELDS]
+
+    num_hits = 0
+    for hit in hit_reader(tblout_file):
+        for (index, field) in string_indices:
+            if len(hit[index]) > string_widths[field]:
+                string_widths[field] = len(hit[index])
+        num_hits += 1
+
+    return (num_hits, hit_dtype(fields, string_widths))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def fill_hits(hits, tblout_file, hit_reader):
+    """
+    Copies the hits of a tblout file to a structured array in blocks
+
+    hits: A NumPy structured array, or memory map, sized by scan_hits
+    tblout_file: A valid Infernal's output file in .tblout format
+    hit_reader: A function returning an iterator of hit tuples for tblout_file
+
+    return: void
+    """
+
+    block = []
+    position = 0
+    for hit in hit_reader(tblout_file):
+        block.append(tuple(hit))
+
+        if len(block) == BLOCK_SIZE:
+            hits[position:position + len(block)] = np.array(block, dtype=hits.dtype)
+            position += len(block)
+            block = []
+
+    if len(block) > 0:
+        hits[position:position + len(block)] = np.array(block, dtype=hits.dtype)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def build_hits(tblout_file, fields, hit_reader):
+    """
+    Parses a tblout file into an in memory structured array, without caching
+
+    tblout_file: A valid Infernal's output file in .tblout format
+    fields: The tblout field names in file order
+    hit_reader: A function returning an iterator of hit tuples for tblout_file
+
+    return: A NumPy structured array with a record per hit
+    """
+
+    (num_hits, dtype) = scan_hits(tblout_file, fields, hit_reader)
+
+    hits = np.empty(num_hits, dtype=dtype)
+    fill_hits(hits, tblout_file, hit_reader)
+
+    return hits
+
+# --------------------------------------------------------------------------------------------------
+
+
+def write_cache(tblout_file, fields, hit_reader):
+    """
+    Parses a tblout file and stores all hits in a cache file next to it. The
+    file is read twice, to size the columns and to fill them, so that memory
+    usage does not depend on the number of hits.
+
+    tblout_file: A valid Infernal's output file in .tblout format
+    fields: The tblout field names in file order
+    hit_reader: A function returning an iterator of hit tuples for tblout_file
+
+    return: The path to the cache file
+    """
+
+    signature = source_signature(tblout_file)
+
+    (num_hits, dtype) = scan_hits(tblout_file, fields, hit_reader)
+
+    # write in a temporary file first so that readers never see a partial cache
+    # with the pid, so that concurrent jobs converting the same file don't
+    # write to each other's temporary files
+    tmp_cache = "%s.%d.tmp" % (cache_path(tblout_file), os.getpid())
+    hits = np.lib.format.open_memmap(tmp_cache, mode="w+", dtype=dtype, shape=(num_hits,))
+
+    fill_hits(hits, tblout_file, hit_reader)
+
+    hits.flush()
+    del hits
+
+    os.rename(tmp_cache, cache_path(tblout_file))
+
+    tmp_meta = "%s.%d.tmp" % (meta_path(tblout_file), os.getpid())
+    fp = open(tmp_meta, 'w')
+    json.dump(signature, fp)
+    fp.close()
+
+    os.rename(tmp_meta, meta_path(tblout_file))
+
+    return cache_path(tblout_file)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_cache(tblout_file, mmap=True):
+    """
+    Loads the cached hits of a tblout file
+
+    tblout_file: A valid Infernal's output file in .tblout format
+    mmap: If True the cache file is memory mapped read only, otherwise it is
+    loaded in memory
+
+    return: A NumPy structured array with a record per hit
+    """
+
+    if mmap:
+        return np.load(cache_path(tblout_file), mmap_mode='r')
+
+    return np.load(cache_path(tblout_file))
+
+# --------------------------------------------------------------------------------------------------
+
+
+def remove_cache(tblout_file):
+    """
+    Deletes the cache of a tblout file, if any
+    """
+
+    for path in (cache_path(tblout_file), meta_path(tblout_file)):
+        if os.path.exists(path):
+            os.remove(path)
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    pass
@@ -0,0 +1,220 @@
+"""
+Copyright [2009-2019] EMBL-European Bioinformatics Institute
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+     http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Description: An incremental XML writer for the search engine dumps. Elements
+             are written to the output file as they are completed, instead of
+             building the whole document in memory, and are formatted exactly
+             as minidom's toprettyxml (or toxml, when pretty printing is off)
+             formats an ElementTree serialised with ET.tostring, so that the
+             files are identical to those of the earlier in-memory export.
+"""
+
+# --------------------------------------------------------------------------------------------------
+
+import sys
+
+# --------------------------------------------------------------------------------------------------
+
+# ElementTree serialises attributes sorted before Python 3.8 and minidom
+# writes them sorted, from 3.8 on both keep the order they were set in
+SORT_ATTRIBUTES = sys.version_info < (3, 8)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def escape_text(text):
+    """
+    Escapes text as minidom does when writing a document
+
+    text: A string
+
+    return: The escaped string
+    """
+
+    # line endings are normalised when the serialised tree is parsed
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    # minidom no longer escapes quotes in text from 3.13 on
+    if sys.version_info < (3, 13):
+        text = text.replace("\"", "&quot;")
+
+    return text
+
+
+def escape_attribute(value):
+    """
+    Escapes an attribute value as minidom does when writing a document
+
+    value: A string
+
+    return: The escaped string
+    """
+
+    if sys.version_info < (3,):
+        # only line feeds are written as character references by ET.tostring
+        # and kept. Carriage returns and tabs are normalised to spaces when the
+        # tree is parsed, so \r\n becomes " \n"
+        value = value.replace("\r\n", " \n").replace("\r", " ").replace("\t", " ")
+
+    elif sys.version_info < (3, 9):
+        # line endings are normalised to \n by ET.tostring, and all whitespace
+        # is written as character references and kept
+        value = value.replace("\r\n", "\n").replace("\r", "\n")
+
+    value = value.replace("&", "&amp;").replace("<", "&lt;").replace(
+        "\"", "&quot;").replace(">", "&gt;")
+
+    # minidom writes the whitespace kept as character references from 3.13 on
+    if sys.version_info >= (3, 13):
+        value = value.replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#9;")
+
+    return value
+
+# --------------------------------------------------------------------------------------------------
+
+
+class XmlDumpWriter(object):
+    """
+    Writes an XML document to a file incrementally. Container elements are
+    opened and closed with start and end, and completed ElementTree elements
+    are written between them with element or write_children
+    """
+
+    def __init__(self, fp_out, pretty=True, indent='\t'):
+        """
+        fp_out: A file object opened in binary mode. The document is written
+        utf-8 encoded
+        pretty: If True indent elements and write each on a new line, as
+        toprettyxml does. If False write the document on a single line, as
+        toxml does
+        indent: The indentation added at each level when pretty printing
+        """
+
+        self.fp_out = fp_out
+        self.addindent = indent if pretty else ''
+        self.newl = '\n' if pretty else ''
+        self.open_tags = []
+
+    def _write(self, text):
+        if not isinstance(text, bytes):
+            text = text.encode("utf-8")
+
+        self.fp_out.write(text)
+
+    def _indent(self):
+        return self.addindent * len(self.open_tags)
+
+    def write_declaration(self):
+        """
+        Writes the XML declaration
+        """
+
+        self._write('<?xml version="1.0" ?>' + self.newl)
+
+    def start(self, tag):
+        """
+        Opens a container element, whose children are written next
+        """
+
+        self._write("%s<%s>%s" % (self._indent(), tag, self.newl))
+        self.open_tags.append(tag)
+
+    def end(self, tag):
+        """
+        Closes the container element last opened
+        """
+
+        if not self.open_tags or self.open_tags[-1] != tag:
+            raise ValueError("Closing tag %s does not match the open element" % tag)
+
+        self.open_tags.pop()
+        self._write("%s</%s>%s" % (self._indent(), tag, self.newl))
+
+    def text_element(self, tag, text):
+        """
+        Writes an element with text content only
+        """
+
+        self._write_element(tag, [], text, [], self._indent())
+
+    def element(self, elem):
+        """
+        Writes a complete ElementTree element and its subtree
+        """
+
+        self._write_element(elem.tag, list(elem.items()), elem.text, list(elem), self._indent())
+
+    def write_children(self, parent):
+        """
+        Writes the children of an ElementTree element and removes them from it,
+        so that the element can be used as a buffer for the next children
+
+        parent: An ElementTree element
+
+        return: The number of children written
+        """
+
+        children = list(parent)
+        for child in children:
+            self.element(child)
+
+        del parent[:]
+
+        return len(children)
+
+    def _write_element(self, tag, attributes, text, children, indent):
+        # the equivalent of minidom's Element.writexml for an ElementTree element
+        self._write(indent + "<" + tag)
+
+        if SORT_ATTRIBUTES:
+            attributes = sorted(attributes)
+
+        for (name, value) in attributes:
+            self._write(" %s=\"%s\"" % (name, escape_attribute(value)))
+
+        # text and tails become text nodes, empty strings are not serialised
+        nodes = []
+        if text:
+            nodes.append(text)
+
+        for child in children:
+            nodes.append(child)
+            if child.tail:
+                nodes.append(child.tail)
+
+        if not nodes:
+            self._write("/>" + self.newl)
+            return
+
+        self._write(">")
+
+        if len(nodes) == 1 and not len(children):
+            self._write(escape_text(text))
+
+        else:
+            self._write(self.newl)
+
+            child_indent = indent + self.addindent
+            for node in nodes:
+                if isinstance(node, (type(u''), str)):
+                    self._write(escape_text(child_indent + node + self.newl))
+                else:
+                    self._write_element(node.tag, list(node.items()), node.text, list(node),
+                                        child_indent)
+
+            self._write(indent)
+
+        self._write("</%s>%s" % (tag, self.newl))